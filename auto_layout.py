@@ -0,0 +1,154 @@
+import numpy as np
+
+from constants import BLOCK_RECT_SIZE, CELL_SIZE
+from story_components import Story, StoryBlock
+
+# Gaps between columns and rows of blocks, in grid cells
+LAYER_GAP_CELLS = 2
+ROW_GAP_CELLS = 1
+
+# Each iteration sweeps once towards the end of the story and once back
+CROSSING_REDUCTION_ITERATIONS = 6
+
+
+def _snap_up(value: float) -> int:
+    return int(-(-value // CELL_SIZE) * CELL_SIZE)
+
+
+def _csr(sources: np.ndarray, targets: np.ndarray, n: int):
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    return indptr, targets[order]
+
+
+def _expand(frontier: np.ndarray, indptr: np.ndarray, indices: np.ndarray):
+    # All the neighbours of every node in the frontier, in one go
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    if counts.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return indices[offsets + np.arange(counts.sum())]
+
+
+def assign_layers(n: int, sources: np.ndarray, targets: np.ndarray, start: int | None):
+    """
+    Puts each node in the column of its breadth-first distance from the
+    start node. Anything the start can't reach is laid out from its own
+    roots (nodes with no incoming links first) in the same way.
+    """
+    indptr, indices = _csr(sources, targets, n)
+    layers = np.full(n, -1, dtype=np.int64)
+
+    inDegree = np.bincount(targets, minlength=n)
+    roots = [start] if start is not None else []
+    roots += np.flatnonzero(inDegree == 0).tolist()
+    candidates = iter(roots + list(range(n)))
+
+    for root in candidates:
+        if layers[root] >= 0:
+            continue
+        frontier = np.array([root], dtype=np.int64)
+        depth = 0
+        while len(frontier) > 0:
+            layers[frontier] = depth
+            neighbours = _expand(frontier, indptr, indices)
+            frontier = np.unique(neighbours[layers[neighbours] < 0])
+            depth += 1
+    return layers
+
+
+def order_within_layers(
+    layers: np.ndarray, sources: np.ndarray, targets: np.ndarray
+) -> np.ndarray:
+    """
+    Returns each node's row within its column, reducing edge crossings
+    with barycentre sweeps: each column is sorted by the average position
+    of its neighbours in the columns already placed, sweeping towards the
+    end of the story and then back.
+    """
+    n = len(layers)
+    layerCount = int(layers.max()) + 1
+    sizes = np.bincount(layers, minlength=layerCount)
+
+    members = np.argsort(layers, kind="stable")
+    bounds = np.r_[0, np.cumsum(sizes)]
+    localIndex = np.empty(n, dtype=np.int64)
+    localIndex[members] = np.arange(n) - bounds[layers[members]]
+    rank = localIndex.astype(np.float64)
+
+    # Links within a column, or back up towards the start, would pull
+    # blocks in odd directions, so only forward links are used
+    forward = layers[sources] < layers[targets]
+    sources, targets = sources[forward], targets[forward]
+
+    # Group the links by the column they arrive in and leave from
+    byTarget = np.argsort(layers[targets], kind="stable")
+    targetBounds = np.searchsorted(layers[targets][byTarget], np.arange(layerCount + 1))
+    bySource = np.argsort(layers[sources], kind="stable")
+    sourceBounds = np.searchsorted(layers[sources][bySource], np.arange(layerCount + 1))
+
+    # Positions are scaled to 0-1 within each column, so that links
+    # spanning several columns of different heights weigh the same
+    scale = 1.0 / np.maximum(sizes[layers] - 1, 1)
+
+    for i in range(CROSSING_REDUCTION_ITERATIONS * 2):
+        down = i % 2 == 0
+        for layer in range(1, layerCount) if down else range(layerCount - 2, -1, -1):
+            if sizes[layer] <= 1:
+                continue
+            nodes = members[bounds[layer] : bounds[layer + 1]]
+            if down:
+                links = byTarget[targetBounds[layer] : targetBounds[layer + 1]]
+                towards, away = targets[links], sources[links]
+            else:
+                links = bySource[sourceBounds[layer] : sourceBounds[layer + 1]]
+                towards, away = sources[links], targets[links]
+            if len(links) == 0:
+                continue
+
+            slots = localIndex[towards]
+            total = np.bincount(slots, weights=rank[away] * scale[away], minlength=len(nodes))
+            count = np.bincount(slots, minlength=len(nodes))
+            current = rank[nodes] * scale[nodes]
+            barycentre = np.where(count > 0, total / np.maximum(count, 1), current)
+            rank[nodes[np.lexsort((current, barycentre))]] = np.arange(len(nodes))
+
+    return rank.astype(np.int64)
+
+
+def layered_layout(story: Story) -> dict[StoryBlock, tuple[float, float]]:
+    """
+    Works out grid-aligned positions for every block, in columns that
+    follow the links out from the start block.
+    """
+    blocks = list(story)
+    n = len(blocks)
+    if n == 0:
+        return {}
+
+    index = {block: i for i, block in enumerate(blocks)}
+    edgeList = [
+        (i, index[target])
+        for i, block in enumerate(blocks)
+        for target in story.getConnectionsForBlock(block)
+        if target is not block
+    ]
+    edges = np.array(edgeList, dtype=np.int64).reshape(-1, 2)
+    sources, targets = edges[:, 0], edges[:, 1]
+
+    start = index.get(story.startBlock())
+    layers = assign_layers(n, sources, targets, start)
+    rows = order_within_layers(layers, sources, targets)
+
+    layerWidth = _snap_up(BLOCK_RECT_SIZE.width() + LAYER_GAP_CELLS * CELL_SIZE)
+    rowHeight = _snap_up(BLOCK_RECT_SIZE.height() + ROW_GAP_CELLS * CELL_SIZE)
+
+    # Centre each column vertically on the tallest one
+    layerSizes = np.bincount(layers)
+    offset = (layerSizes.max() - layerSizes[layers]) // 2
+    xs = (layers + 1) * layerWidth
+    ys = (rows + offset) * rowHeight
+
+    return {block: (float(xs[i]), float(ys[i])) for i, block in enumerate(blocks)}
@@ -0,0 +1,50 @@
+"""
+Compares two results files written by benchmarks/run.py, and exits with
+an error if anything got slower by more than the threshold.
+
+    python benchmarks/compare.py before.json after.json --threshold 1.2
+"""
+
+from argparse import ArgumentParser
+from json import load
+import sys
+
+
+def main(args: list[str]) -> int:
+    parser = ArgumentParser(description="Compare two Packard benchmark runs.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="slowdown ratio (after/before) that counts as a regression",
+    )
+    options = parser.parse_args(args)
+
+    with open(options.before) as f:
+        before = load(f)
+    with open(options.after) as f:
+        after = load(f)
+
+    print(f"before: {before.get('revision')}  after: {after.get('revision')}")
+    regressions = 0
+    for size, results in after["results"].items():
+        for name, timing in results.items():
+            old = before["results"].get(size, {}).get(name)
+            if old is None:
+                continue
+            ratio = timing["median"] / max(old["median"], 1e-9)
+            flag = ""
+            if ratio > options.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(
+                f"{size:>7} {name:<32} {old['median'] * 1000:10.2f} ms"
+                f" -> {timing['median'] * 1000:10.2f} ms  x{ratio:.2f}{flag}"
+            )
+    return 1 if regressions > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
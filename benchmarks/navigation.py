@@ -0,0 +1,252 @@
+"""
+Simulates a reader clicking through a compiled story served over a slow
+connection, and reports how long each click takes to show the next page
+with and without prefetch hints and inlined pages, and with the story
+compiled as a single page of chunks. Also reports the time to show the
+first passage, and how many files and bytes each output has.
+
+    python benchmarks/navigation.py [--blocks 500] [--latency 50] [--steps 40]
+
+The pages are served from an in-process HTTP server that waits
+`--latency` ms before answering each request. The "browser" follows a
+random walk of links, spending `--think` ms on each page. While it's
+reading, it fetches the page's prefetch hints in the background, like a
+browser would. A click is instant if the page was inlined. If it was
+prefetched, the click only waits for whatever's left of that fetch.
+Otherwise the click pays the full round trip. The single-page bundle
+works the same way, but with chunks instead of pages.
+"""
+
+from os import walk as walk_dir
+from os.path import abspath, dirname, getsize, join
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from argparse import ArgumentParser
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from json import loads
+from random import Random
+from re import compile
+from statistics import median, quantiles
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+from urllib.request import urlopen
+
+from bundle import CHUNKS_DIR, RUNTIME_NAME, compile_story_data_to_bundle
+from saver import DEFAULT_PREFETCH_LIMIT, compile_story_data_to_html
+from stories import generate_story_data
+
+HREF_RE = compile(r'<a href="([^"]+)"')
+PREFETCH_RE = compile(r'<link rel="prefetch" href="([^"]+)"')
+PAGES_RE = compile(r"var PAGES = (.*);\n")
+STORY_RE = compile(r"var STORY = (.*?);</script>")
+FRAGMENT_HREF_RE = compile(r'<a href="#([^"]+)"')
+
+# Small enough that only some of the generated pages are inlined
+DEFAULT_INLINE_LIMIT = 400
+
+
+class _SlowHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(directory: str, latency: float) -> ThreadingHTTPServer:
+    handler = type("Handler", (_SlowHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=directory))
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _Browser:
+    """Fetches each URL once, on a pool so requests can overlap."""
+
+    def __init__(self, base_url: str):
+        self.__baseUrl = base_url
+        self.__pool = ThreadPoolExecutor(max_workers=8)
+        self.__cache: dict[str, Future] = {}
+
+    def __fetch(self, path: str) -> str:
+        with urlopen(f"{self.__baseUrl}/{path}") as response:
+            return response.read().decode("utf-8")
+
+    def request(self, path: str) -> Future:
+        future = self.__cache.get(path)
+        if future is None:
+            future = self.__cache[path] = self.__pool.submit(self.__fetch, path)
+        return future
+
+    def transferred(self) -> int:
+        return sum(len(f.result()) for f in self.__cache.values())
+
+    def close(self):
+        self.__pool.shutdown(wait=True)
+
+
+def walk(base_url: str, steps: int, think: float, seed: int) -> dict:
+    """Clicks through `steps` random links, returning the click latencies."""
+    rng = Random(seed)
+    browser = _Browser(base_url)
+
+    def request(page: str) -> Future:
+        return browser.request(f"pages/{page}")
+
+    loading = perf_counter()
+    index = browser.request("index.html").result()
+    html = request(index.split("url='pages/")[1].split("'")[0]).result()
+    firstPassage = perf_counter() - loading
+
+    latencies: list[float] = []
+    inlinedHits = 0
+    for _ in range(steps):
+        inlined = {}
+        match = PAGES_RE.search(html)
+        if match is not None:
+            inlined = loads(match.group(1).replace("<\\/", "</"))
+        for page in PREFETCH_RE.findall(html):
+            request(page)
+        sleep(think)
+
+        links = HREF_RE.findall(html[match.end() :] if match is not None else html)
+        if len(links) == 0:
+            break
+        page = rng.choice(links)
+        clicked = perf_counter()
+        if page in inlined:
+            html = inlined[page]
+            inlinedHits += 1
+        else:
+            html = request(page).result()
+        latencies.append(perf_counter() - clicked)
+
+    browser.close()
+    return {
+        "first": firstPassage,
+        "latencies": latencies,
+        "inlined": inlinedHits,
+        "bytes": browser.transferred(),
+    }
+
+
+def walk_bundle(base_url: str, steps: int, think: float, seed: int) -> dict:
+    """walk() for a story compiled with compile_story_data_to_bundle."""
+    rng = Random(seed)
+    browser = _Browser(base_url)
+    passages: dict[str, str] = {}
+
+    def chunk(id: str) -> Future:
+        return browser.request(f"{CHUNKS_DIR}/{story['chunks'][id]}.json")
+
+    def passage(id: str) -> str:
+        if id not in passages:
+            passages.update(loads(chunk(id).result()))
+        return passages[id]
+
+    loading = perf_counter()
+    index = browser.request("index.html").result()
+    story = loads(STORY_RE.search(index).group(1).replace("<\\/", "</"))
+    # The runtime and the preloaded first chunk are fetched side by side
+    browser.request(RUNTIME_NAME)
+    html = passage(story["start"])
+    browser.request(RUNTIME_NAME).result()
+    firstPassage = perf_counter() - loading
+
+    latencies: list[float] = []
+    for _ in range(steps):
+        links = [id for id in FRAGMENT_HREF_RE.findall(html) if id in story["chunks"]]
+        for id in links:
+            chunk(id)
+        sleep(think)
+
+        if len(links) == 0:
+            break
+        id = rng.choice(links)
+        clicked = perf_counter()
+        html = passage(id)
+        latencies.append(perf_counter() - clicked)
+
+    browser.close()
+    return {
+        "first": firstPassage,
+        "latencies": latencies,
+        "inlined": 0,
+        "bytes": browser.transferred(),
+    }
+
+
+def _output_size(directory: str) -> tuple[int, int]:
+    files = [join(root, name) for root, _, names in walk_dir(directory) for name in names]
+    return len(files), sum(getsize(path) for path in files)
+
+
+def _summary(latencies: list[float]) -> str:
+    ms = [latency * 1000 for latency in latencies]
+    p95 = quantiles(ms, n=20)[-1] if len(ms) > 1 else ms[0]
+    return f"median {median(ms):7.1f} ms  p95 {p95:7.1f} ms"
+
+
+def main(args: list[str]) -> int:
+    parser = ArgumentParser(description="Benchmark navigating a compiled story.")
+    parser.add_argument("--blocks", type=int, default=500, help="story size in blocks")
+    parser.add_argument("--body-length", type=int, default=300, help="body length in characters")
+    parser.add_argument("--latency", type=float, default=50, help="server latency in ms")
+    parser.add_argument("--think", type=float, default=100, help="time spent on each page in ms")
+    parser.add_argument("--steps", type=int, default=40, help="links followed per walk")
+    parser.add_argument("--prefetch-limit", type=int, default=DEFAULT_PREFETCH_LIMIT)
+    parser.add_argument("--inline-limit", type=int, default=DEFAULT_INLINE_LIMIT)
+    options = parser.parse_args(args)
+
+    data = generate_story_data(options.blocks, body_length=options.body_length)
+    compilePages = partial(compile_story_data_to_html, loaded_story=data)
+    configs = {
+        "plain": (partial(compilePages, prefetch_limit=0), walk),
+        "prefetch": (partial(compilePages, prefetch_limit=options.prefetch_limit), walk),
+        "prefetch+inline": (
+            partial(
+                compilePages,
+                prefetch_limit=options.prefetch_limit,
+                inline_limit=options.inline_limit,
+            ),
+            walk,
+        ),
+        "bundle": (
+            partial(compile_story_data_to_bundle, loaded_story=data),
+            walk_bundle,
+        ),
+    }
+    for name, (compileStory, walkStory) in configs.items():
+        with TemporaryDirectory() as outDir:
+            compileStory(outDir)
+            files, size = _output_size(outDir)
+            server = _serve(outDir, options.latency / 1000)
+            try:
+                result = walkStory(
+                    f"http://127.0.0.1:{server.server_address[1]}",
+                    options.steps,
+                    options.think / 1000,
+                    seed=0,
+                )
+            finally:
+                server.shutdown()
+                server.server_close()
+        print(
+            f"{name:<16} first {result['first'] * 1000:6.1f} ms  clicks {_summary(result['latencies'])}"
+            f"  inlined {result['inlined']:>3}/{len(result['latencies'])}"
+            f"  fetched {result['bytes'] / 1024:7.1f} KiB"
+            f"  output {files:>6} files {size / 1024:8.1f} KiB"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,178 @@
+"""
+Times the story model, saver and renderer on synthetic stories and
+writes the results as JSON, for comparing with benchmarks/compare.py.
+
+    python benchmarks/run.py --sizes 1000 10000 --out results.json
+"""
+
+from os import environ, mkdir
+from os.path import abspath, dirname, join
+import sys
+
+# Everything runs headless, including the scene painting
+environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from json import dump
+from platform import platform, python_version
+from statistics import median
+from subprocess import DEVNULL, check_output, CalledProcessError
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+
+from PyQt6.QtCore import QRectF
+from PyQt6.QtGui import QImage, QPainter, QUndoStack
+from PyQt6.QtWidgets import QApplication
+
+from graph_scene import GraphScene
+from saver import check_story_for_errors, compile_story_to_html, load_story, save_story
+from stories import GRID_COLUMNS, generate_story_data, story_from_data
+from story_components import StoryGroup
+
+DEFAULT_SIZES = [1000, 10000]
+
+# Collapsed groups in the drawing benchmark are squares of this many
+# blocks a side
+GROUP_TILE = 10
+
+# The area painted by drawBackground, roughly one screenful
+VIEWPORT_SIZE = (1920, 1080)
+
+
+def _time(fn: Callable, repeats: int) -> dict:
+    times: list[float] = []
+    for _ in range(repeats):
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    return {"min": min(times), "median": median(times), "runs": times}
+
+
+def _git_revision() -> str | None:
+    try:
+        return check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=dirname(abspath(__file__)),
+            stderr=DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, CalledProcessError):
+        return None
+
+
+def bench_size(size: int, links: float, body_length: int, repeats: int) -> dict:
+    data = generate_story_data(size, links, body_length)
+    results: dict[str, dict] = {}
+
+    with TemporaryDirectory() as storyDir, TemporaryDirectory() as htmlDirs:
+        results["save_story"] = _time(lambda: save_story(storyDir, data), repeats)
+        results["load_story"] = _time(lambda: load_story(storyDir), repeats)
+        results["check_story_for_errors"] = _time(
+            lambda: check_story_for_errors(data), repeats
+        )
+
+        # Unchanged files aren't written again, so a full compile needs an
+        # empty directory each time; compiling again into the last one
+        # times the incremental case
+        outDirs = iter([join(htmlDirs, str(i)) for i in range(repeats)])
+        lastDir: list[str] = []
+
+        def compileCold():
+            lastDir[:] = [next(outDirs)]
+            mkdir(lastDir[0])
+            compile_story_to_html(lastDir[0], storyDir)
+
+        results["compile_story_to_html"] = _time(compileCold, repeats)
+        results["compile_story_to_html_incremental"] = _time(
+            lambda: compile_story_to_html(lastDir[0], storyDir), repeats
+        )
+
+    results["story_construction"] = _time(lambda: story_from_data(data), repeats)
+    story = story_from_data(data)
+    blocks = list(story)
+
+    results["get_connections_for_all_blocks"] = _time(
+        lambda: [story.getConnectionsForBlock(block) for block in blocks], repeats
+    )
+
+    # Renaming rewrites every link to the block throughout the story
+    renamed = blocks[len(blocks) // 2]
+    newIds = iter([f"{renamed.id()}-renamed-{i}" for i in range(repeats)])
+    results["update_block_id"] = _time(lambda: renamed.setId(next(newIds)), repeats)
+
+    scene = GraphScene(undoStack=QUndoStack())
+    scene.setStory(story)
+    image = QImage(*VIEWPORT_SIZE, QImage.Format.Format_ARGB32_Premultiplied)
+    centre = blocks[len(blocks) // 2].pos()
+    rect = QRectF(
+        centre.x() - VIEWPORT_SIZE[0] / 2,
+        centre.y() - VIEWPORT_SIZE[1] / 2,
+        *VIEWPORT_SIZE,
+    )
+
+    def draw():
+        painter = QPainter(image)
+        painter.translate(-rect.topLeft())
+        scene.drawBackground(painter, rect)
+        painter.end()
+
+    results["draw_background"] = _time(draw, repeats)
+
+    # The same view with each square of the grid collapsed into a group,
+    # like chapters laid out side by side
+    tiles: dict[tuple[int, int], list] = {}
+    for i, block in enumerate(blocks):
+        row, column = divmod(i, GRID_COLUMNS)
+        tiles.setdefault((row // GROUP_TILE, column // GROUP_TILE), []).append(block)
+    story.setGroups(
+        [
+            StoryGroup(f"tile-{row}-{column}", blocks=members, collapsed=True)
+            for (row, column), members in tiles.items()
+        ]
+    )
+    results["draw_background_collapsed"] = _time(draw, repeats)
+    return results
+
+
+def main(args: list[str]) -> int:
+    parser = ArgumentParser(description="Run the Packard benchmarks.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="story sizes in blocks"
+    )
+    parser.add_argument("--links", type=float, default=2.0, help="links per block")
+    parser.add_argument("--body-length", type=int, default=400, help="body length in characters")
+    parser.add_argument("--repeats", type=int, default=3, help="runs of each benchmark")
+    parser.add_argument("--out", default="benchmark-results.json", help="where to write results")
+    options = parser.parse_args(args)
+
+    app = QApplication(sys.argv[:1])
+
+    report = {
+        "revision": _git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": python_version(),
+        "platform": platform(),
+        "config": {
+            "links": options.links,
+            "body_length": options.body_length,
+            "repeats": options.repeats,
+        },
+        "results": {},
+    }
+    for size in options.sizes:
+        results = bench_size(size, options.links, options.body_length, options.repeats)
+        report["results"][str(size)] = results
+        for name, timing in results.items():
+            print(f"{size:>7} {name:<32} {timing['median'] * 1000:10.2f} ms")
+
+    with open(options.out, "w") as f:
+        dump(report, f, indent=4)
+    print(f"Wrote {options.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,64 @@
+"""
+Times how long the editor takes from launch to its first painted frame,
+and to finish opening a story if one is given.
+
+    python benchmarks/startup.py [--story DIR] [--runs 10]
+"""
+
+from os import environ
+from os.path import abspath, dirname, join
+from argparse import ArgumentParser
+from statistics import median
+from subprocess import DEVNULL, PIPE, Popen
+from time import perf_counter
+import sys
+
+PACKARD = join(dirname(dirname(abspath(__file__))), "packard.py")
+
+# The window should be painted within this long of launching, whether or
+# not a story is being opened
+FIRST_FRAME_TARGET_MS = 200
+
+
+def time_startup(story: str | None) -> dict[str, float]:
+    """Returns the time taken to reach each marker the editor prints."""
+    env = dict(environ, PACKARD_STARTUP_TRACE="1")
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    args = [sys.executable, PACKARD] + ([story] if story is not None else [])
+
+    times: dict[str, float] = {}
+    start = perf_counter()
+    process = Popen(args, stdout=PIPE, stderr=DEVNULL, env=env, text=True)
+    for line in process.stdout:
+        times[line.strip()] = perf_counter() - start
+    process.wait()
+    if "first-frame" not in times:
+        raise RuntimeError("the editor exited without painting a frame")
+    return times
+
+
+def main(args: list[str]) -> int:
+    parser = ArgumentParser(description="Time the editor's cold start.")
+    parser.add_argument("--story", help="a story directory to open on launch")
+    parser.add_argument("--runs", type=int, default=10)
+    options = parser.parse_args(args)
+
+    # The first run warms the disk cache and .pyc files
+    time_startup(options.story)
+    runs = [time_startup(options.story) for _ in range(options.runs)]
+    for marker in runs[0]:
+        times = [run[marker] for run in runs]
+        print(
+            f"{marker}: median {median(times) * 1000:.0f} ms,"
+            f" min {min(times) * 1000:.0f} ms over {options.runs} runs"
+        )
+
+    firstFrame = median(run["first-frame"] for run in runs) * 1000
+    if firstFrame > FIRST_FRAME_TARGET_MS:
+        print(f"First frame is over the {FIRST_FRAME_TARGET_MS} ms target")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,71 @@
+from random import Random
+
+from PyQt6.QtCore import QPointF
+
+from story_components import Story, StoryBlock
+from story_link import link_markup
+
+WORDS = (
+    "the door creaks open and a cold wind drifts through the hall "
+    "you hear footsteps somewhere above while the lantern flickers "
+    "a letter lies on the table beside an old brass key"
+).split()
+
+# Blocks are laid out in a grid this many columns wide
+GRID_COLUMNS = 100
+GRID_SPACING_X = 200
+GRID_SPACING_Y = 100
+
+
+def block_id(i: int) -> str:
+    return f"block-{i}"
+
+
+def generate_story_data(
+    blocks: int, links_per_block: float = 2.0, body_length: int = 400, seed: int = 0
+) -> dict:
+    """
+    Makes story data in the form save_story takes: `blocks` blocks, each
+    with a body of about `body_length` characters of filler containing
+    (on average) `links_per_block` links to random other blocks.
+    """
+    rng = Random(seed)
+    blockData = []
+    for i in range(blocks):
+        linkCount = int(links_per_block) + (rng.random() < links_per_block % 1)
+        words: list[str] = []
+        length = 0
+        while length < body_length:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        for _ in range(linkCount):
+            target = rng.randrange(blocks)
+            words.insert(rng.randrange(len(words) + 1), link_markup("go", block_id(target)))
+
+        blockData.append(
+            {
+                "x": (i % GRID_COLUMNS) * GRID_SPACING_X,
+                "y": (i // GRID_COLUMNS) * GRID_SPACING_Y,
+                "title": f"Block {i}",
+                "id": block_id(i),
+                "body": " ".join(words),
+            }
+        )
+    return {"blocks": blockData, "start": block_id(0) if blocks > 0 else None}
+
+
+def story_from_data(data: dict) -> Story:
+    blocks = []
+    startBlock = None
+    for blockData in data["blocks"]:
+        block = StoryBlock(
+            title=blockData["title"],
+            body=blockData["body"],
+            id=blockData["id"],
+            pos=QPointF(blockData["x"] or 0, blockData["y"] or 0),
+        )
+        blocks.append(block)
+        if blockData["id"] == data["start"]:
+            startBlock = block
+    return Story(startBlock=startBlock, blocks=blocks)
@@ -1,8 +1,11 @@
-from PyQt6.QtCore import QSignalBlocker
-from PyQt6.QtWidgets import QWidget, QLineEdit, QTextEdit, QPlainTextEdit, QVBoxLayout, QPushButton
-from PyQt6.QtGui import QUndoStack, QUndoCommand
+from PyQt6.QtCore import QEvent, QObject, QSignalBlocker
+from PyQt6.QtWidgets import QWidget, QLabel, QLineEdit, QTextEdit, QPlainTextEdit, QVBoxLayout, QPushButton
+from body_edit import BodyEdit
+from constants import ERROR_BADGE_COLOR
+from PyQt6.QtGui import QKeyEvent, QKeySequence, QPalette, QTextCursor, QUndoStack, QUndoCommand
 from story_components import (
     SetStoryBlockBodyCommand,
+    SetStoryBlockIdCommand,
     SetStoryBlockNameCommand,
     SetStoryStartBlockCommand,
     Story,
@@ -18,6 +21,7 @@ class BlockEditor(QWidget):
 
         self.__undoStack = undoStack
         self.__story: Story = None
+        self.currentBlock: StoryBlock | None = None
 
         self.titleField = QLineEdit(parent=self)
         self.titleField.textEdited.connect(self.blockTitleChanged)
@@ -25,28 +29,108 @@ class BlockEditor(QWidget):
         self.idField = QLineEdit(parent=self)
         self.idField.setPlaceholderText("Page ID")
         self.idField.textEdited.connect(self.blockIdChanged)
+        self.idField.editingFinished.connect(self.onIdEditingFinished)
+
+        self.idTakenLabel = QLabel("That ID is already taken", parent=self)
+        palette = self.idTakenLabel.palette()
+        palette.setColor(QPalette.ColorRole.WindowText, ERROR_BADGE_COLOR)
+        self.idTakenLabel.setPalette(palette)
+        self.idTakenLabel.hide()
 
         self.isStartBlockField = QPushButton("Make Start Node")
         self.isStartBlockField.clicked.connect(self.blockStartChanged)
 
-        self.bodyField = QPlainTextEdit(parent=self)
+        self.bodyField = BodyEdit(parent=self)
         # self.bodyField.setAcceptRichText(False)
+        # Edits are undone through the story's undo stack instead
+        self.bodyField.setUndoRedoEnabled(False)
         self.bodyField.textChanged.connect(self.blockBodyChanged)
 
+        for field in (self.titleField, self.idField, self.bodyField):
+            field.installEventFilter(self)
+
         self.setLayout(QVBoxLayout())
         self.layout().addWidget(self.titleField)
         self.layout().addWidget(self.idField)
+        self.layout().addWidget(self.idTakenLabel)
         self.layout().addWidget(self.isStartBlockField)
         self.layout().addWidget(self.bodyField)
 
+    # The fields would otherwise take Undo and Redo for their own undo
+    # history, which doesn't know about the story's
+    def eventFilter(self, watched: QObject, event: QEvent) -> bool:
+        if event.type() not in (QEvent.Type.ShortcutOverride, QEvent.Type.KeyPress):
+            return False
+        if event.matches(QKeySequence.StandardKey.Undo):
+            action = self.__undoStack.undo
+        elif event.matches(QKeySequence.StandardKey.Redo):
+            action = self.__undoStack.redo
+        else:
+            return False
+
+        if event.type() == QEvent.Type.ShortcutOverride:
+            # Delivered to the field as a key press, so it's handled below
+            event.accept()
+        else:
+            action()
+        return True
+
     def setStory(self, story: Story):
+        if self.__story is not None:
+            self.__story.blockTitleChanged.disconnect(self.onBlockTitleChanged)
+            self.__story.blockIdChanged.disconnect(self.onBlockIdChanged)
+            self.__story.blockBodyChanged.disconnect(self.onBlockBodyChanged)
         self.__story = story
+        self.bodyField.setStory(story)
+        if self.__story is not None:
+            self.__story.blockTitleChanged.connect(self.onBlockTitleChanged)
+            self.__story.blockIdChanged.connect(self.onBlockIdChanged)
+            self.__story.blockBodyChanged.connect(self.onBlockBodyChanged)
 
     def setBlock(self, block: StoryBlock):
         self.currentBlock = block
         self.updateContents()
 
+    # The block can change without going through this editor (such as
+    # when an edit is undone), so keep the fields in sync with it
+    def onBlockTitleChanged(self, block: StoryBlock):
+        if block is not self.currentBlock:
+            return
+        if self.titleField.text() != self.currentBlock.title():
+            with QSignalBlocker(self.titleField) as _:
+                self.titleField.setText(self.currentBlock.title())
+
+    def onBlockIdChanged(self, block: StoryBlock):
+        if block is not self.currentBlock:
+            return
+        if self.idField.text() != self.currentBlock.id():
+            with QSignalBlocker(self.idField) as _:
+                self.idField.setText(self.currentBlock.id())
+
+    def onBlockBodyChanged(self, block: StoryBlock):
+        if block is not self.currentBlock:
+            return
+        if self.bodyField.toPlainText() != self.currentBlock.body():
+            cursorPos = self.bodyField.textCursor().position()
+            with QSignalBlocker(self.bodyField) as _:
+                self.bodyField.setPlainText(self.currentBlock.body())
+            cursor = self.bodyField.textCursor()
+            cursor.setPosition(min(cursorPos, len(self.currentBlock.body())))
+            self.bodyField.setTextCursor(cursor)
+
+    def selectBodySpan(self, start: int, end: int):
+        if self.currentBlock is None:
+            return
+        length = len(self.bodyField.toPlainText())
+        cursor = self.bodyField.textCursor()
+        cursor.setPosition(min(start, length))
+        cursor.setPosition(min(end, length), QTextCursor.MoveMode.KeepAnchor)
+        self.bodyField.setTextCursor(cursor)
+        self.bodyField.centerCursor()
+        self.bodyField.setFocus()
+
     def updateContents(self):
+        self.idTakenLabel.hide()
         if self.currentBlock is not None:
             self.setEnabled(True)
 
@@ -73,13 +157,30 @@ class BlockEditor(QWidget):
 
     def blockTitleChanged(self):
         if self.currentBlock is None:
-            return 
-        self.currentBlock.setTitle(self.titleField.text())
+            return
+        self.__undoStack.push(
+            SetStoryBlockNameCommand(self.currentBlock, self.titleField.text())
+        )
 
     def blockIdChanged(self):
         if self.currentBlock is None:
             return
-        self.currentBlock.setId(self.idField.text())
+        id = self.idField.text()
+        # Checked against the story's ID index rather than by validating
+        # the whole story; the block keeps its old ID until it's free
+        taken = id != self.currentBlock.id() and self.__story.idTaken(id)
+        self.idTakenLabel.setVisible(taken)
+        if not taken and id != self.currentBlock.id():
+            self.__undoStack.push(
+                SetStoryBlockIdCommand(self.__story, self.currentBlock, id)
+            )
+
+    def onIdEditingFinished(self):
+        if self.currentBlock is None or not self.idTakenLabel.isVisible():
+            return
+        self.idTakenLabel.hide()
+        with QSignalBlocker(self.idField) as _:
+            self.idField.setText(self.currentBlock.id())
 
     def blockStartChanged(self):
         if self.currentBlock is None:
@@ -91,4 +192,6 @@ class BlockEditor(QWidget):
     def blockBodyChanged(self):
         if self.currentBlock is None:
             return
-        self.currentBlock.setBody(self.bodyField.toPlainText())
+        self.__undoStack.push(
+            SetStoryBlockBodyCommand(self.currentBlock, self.bodyField.toPlainText())
+        )
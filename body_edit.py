@@ -0,0 +1,188 @@
+from PyQt6.QtCore import QModelIndex, QStringListModel, Qt
+from PyQt6.QtGui import (
+    QKeyEvent,
+    QSyntaxHighlighter,
+    QTextCharFormat,
+    QTextCursor,
+    QTextDocument,
+)
+from PyQt6.QtWidgets import QCompleter, QPlainTextEdit, QWidget
+
+from constants import BROKEN_LINK_COLOR, LINK_COLOR, LINK_TARGET_COLOR
+from link_target_index import LinkTargetIndex
+from profiling import profiled
+from story_components import Story, StoryBlock
+from story_link import LinkToken, tokenize_links
+
+# Beyond this many blocks changing at once, every line is re-highlighted
+# rather than searching for the ones that mention them
+MAX_TARGETED_REHIGHLIGHT = 20
+
+MAX_COMPLETIONS = 20
+
+POPUP_KEYS = (
+    Qt.Key.Key_Enter,
+    Qt.Key.Key_Return,
+    Qt.Key.Key_Escape,
+    Qt.Key.Key_Tab,
+    Qt.Key.Key_Backtab,
+)
+
+
+class LinkHighlighter(QSyntaxHighlighter):
+    """
+    Colours links, and marks ones whose target doesn't exist. Links can't
+    span lines, so each line is highlighted on its own and Qt only has to
+    redo the lines that are edited.
+    """
+
+    def __init__(self, document: QTextDocument):
+        super().__init__(document)
+        self.__story: Story | None = None
+
+        self.__linkFormat = QTextCharFormat()
+        self.__linkFormat.setForeground(LINK_COLOR)
+        self.__targetFormat = QTextCharFormat()
+        self.__targetFormat.setForeground(LINK_TARGET_COLOR)
+        self.__brokenFormat = QTextCharFormat()
+        self.__brokenFormat.setForeground(BROKEN_LINK_COLOR)
+        self.__brokenFormat.setUnderlineStyle(QTextCharFormat.UnderlineStyle.WaveUnderline)
+        self.__brokenFormat.setUnderlineColor(BROKEN_LINK_COLOR)
+
+    def setStory(self, story: Story | None):
+        if self.__story is not None:
+            self.__story.blockIdChanged.disconnect(self.onBlockIdChanged)
+            self.__story.blocksAdded.disconnect(self.onBlocksChanged)
+            self.__story.blocksRemoved.disconnect(self.onBlocksChanged)
+        self.__story = story
+        if self.__story is not None:
+            self.__story.blockIdChanged.connect(self.onBlockIdChanged)
+            self.__story.blocksAdded.connect(self.onBlocksChanged)
+            self.__story.blocksRemoved.connect(self.onBlocksChanged)
+        self.rehighlight()
+
+    @profiled("LinkHighlighter.highlightBlock")
+    def highlightBlock(self, text: str):
+        if "[[" not in text:
+            return
+        for token in tokenize_links(text):
+            if not isinstance(token, LinkToken):
+                continue
+            self.setFormat(token.start, token.end - token.start, self.__linkFormat)
+            known = self.__story is None or self.__story.blockById(token.target) is not None
+            self.setFormat(
+                token.target_start,
+                token.target_end - token.target_start,
+                self.__targetFormat if known else self.__brokenFormat,
+            )
+
+    # Blocks appearing, disappearing or being renamed can fix or break
+    # links, but only on lines that mention them
+    def onBlockIdChanged(self, block: StoryBlock, oldId: str):
+        self.__rehighlightMentions({oldId, block.id()})
+
+    def onBlocksChanged(self, blocks: list[StoryBlock]):
+        self.__rehighlightMentions({block.id() for block in blocks})
+
+    def __rehighlightMentions(self, ids: set[str]):
+        if len(ids) > MAX_TARGETED_REHIGHLIGHT:
+            self.rehighlight()
+            return
+        line = self.document().firstBlock()
+        while line.isValid():
+            text = line.text()
+            if "->" in text and any(id in text for id in ids):
+                self.rehighlightBlock(line)
+            line = line.next()
+
+
+class BodyEdit(QPlainTextEdit):
+    """
+    The block body editor: highlights links, and offers to complete a
+    link's target from the story's block IDs and titles once `->` is typed.
+    """
+
+    def __init__(self, parent: QWidget | None = None):
+        super().__init__(parent)
+        self.__story: Story | None = None
+        self.__highlighter = LinkHighlighter(self.document())
+        self.__targetIndex = LinkTargetIndex()
+
+        self.__completionIds: list[str] = []
+        self.__completionPrefix = ""
+        self.__completionModel = QStringListModel(self)
+        self.__completer = QCompleter(self.__completionModel, self)
+        self.__completer.setWidget(self)
+        # The index has already done the matching
+        self.__completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.__completer.activated[QModelIndex].connect(self.insertCompletion)
+
+    def setStory(self, story: Story | None):
+        self.__story = story
+        self.__highlighter.setStory(story)
+        self.__targetIndex.setStory(story)
+        self.__completer.popup().hide()
+
+    def keyPressEvent(self, e: QKeyEvent):
+        if self.__completer.popup().isVisible() and e.key() in POPUP_KEYS:
+            # Left for the completer to act on
+            e.ignore()
+            return
+        super().keyPressEvent(e)
+        self.updateCompletions()
+
+    def __typedTarget(self) -> str | None:
+        """The start of a link target being typed before the cursor, if any."""
+        cursor = self.textCursor()
+        if cursor.hasSelection():
+            return None
+        line = cursor.block().text()[: cursor.positionInBlock()]
+        start = line.rfind("[[")
+        if start < 0:
+            return None
+        arrow = line.find("->", start + 2)
+        if arrow < 0:
+            return None
+        target = line[arrow + 2 :]
+        if "]]" in target:
+            return None
+        return target
+
+    @profiled("BodyEdit.updateCompletions")
+    def updateCompletions(self):
+        popup = self.__completer.popup()
+        target = self.__typedTarget() if self.__story is not None else None
+        ids = self.__targetIndex.complete(target, MAX_COMPLETIONS) if target is not None else []
+        if len(ids) == 0 or ids == [target]:
+            popup.hide()
+            return
+
+        self.__completionPrefix = target
+        if ids == self.__completionIds and popup.isVisible():
+            return
+        self.__completionIds = ids
+        labels: list[str] = []
+        for id in ids:
+            block = self.__story.blockById(id)
+            title = block.title() if block is not None else id
+            labels.append(id if title == id else f"{id} — {title}")
+        self.__completionModel.setStringList(labels)
+
+        rect = self.cursorRect()
+        rect.setWidth(
+            popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width()
+        )
+        self.__completer.complete(rect)
+        popup.setCurrentIndex(self.__completionModel.index(0))
+
+    def insertCompletion(self, index: QModelIndex):
+        id = self.__completionIds[index.row()]
+        cursor = self.textCursor()
+        cursor.movePosition(
+            QTextCursor.MoveOperation.Left,
+            QTextCursor.MoveMode.KeepAnchor,
+            len(self.__completionPrefix),
+        )
+        rest = cursor.block().text()[cursor.positionInBlock() + len(self.__completionPrefix) :]
+        cursor.insertText(id if rest.startswith("]]") else id + "]]")
+        self.setTextCursor(cursor)
@@ -0,0 +1,197 @@
+"""
+Compiles a story into a single page: one index.html, a small runtime
+and the passages in JSON chunks that are only fetched when needed.
+
+Chunks are filled in breadth-first order from the start passage, so a
+chunk holds passages that are a few links away from each other, and
+following links mostly stays within chunks that are already loaded.
+"""
+
+from collections import deque
+from json import dumps
+from os import mkdir
+from os.path import exists, join
+from typing import Callable
+
+from compile_output import OutputWriter, minify_html
+from saver import PROGRESS_INTERVAL, link_targets, load_story, render_body_html
+
+# Roughly how much rendered passage text goes in each chunk
+DEFAULT_CHUNK_SIZE = 32 * 1024
+
+# Passages link to each other by fragment, so the back button works
+BUNDLE_HREF_FORMAT = "#{}"
+
+RUNTIME_NAME = "story.js"
+CHUNKS_DIR = "chunks"
+
+RUNTIME_JS = """(function () {
+  var passages = {}, chunks = {}, shown = null;
+
+  function load(n) {
+    if (!chunks[n]) {
+      chunks[n] = fetch("chunks/" + n + ".json")
+        .then(function (response) { return response.json(); })
+        .then(function (data) { Object.assign(passages, data); });
+    }
+    return chunks[n];
+  }
+
+  function show(id) {
+    var n = STORY.chunks[id];
+    if (n === undefined) return;
+    shown = id;
+    (id in passages ? Promise.resolve() : load(n)).then(function () {
+      if (shown !== id) return;
+      var passage = document.getElementById("passage");
+      passage.innerHTML = passages[id];
+      scrollTo(0, 0);
+      // Fetch the chunks the next choices are in while this is read
+      var links = passage.querySelectorAll("a[href^='#']");
+      for (var i = 0; i < links.length; i++) {
+        var target = decodeURIComponent(links[i].getAttribute("href").slice(1));
+        if (target in STORY.chunks) load(STORY.chunks[target]);
+      }
+    });
+  }
+
+  function current() {
+    return decodeURIComponent(location.hash.slice(1)) || STORY.start;
+  }
+
+  addEventListener("hashchange", function () { show(current()); });
+  show(current());
+})();
+"""
+
+
+def locality_order(blocks: list[dict], start: str | None) -> list[dict]:
+    """
+    Orders blocks breadth-first along their links from the start block,
+    followed by any it can't reach (breadth-first from each in turn).
+    """
+    byId = {block["id"]: block for block in blocks}
+    seen: set[str] = set()
+    order: list[dict] = []
+    roots = ([start] if start in byId else []) + [block["id"] for block in blocks]
+    for root in roots:
+        if root in seen:
+            continue
+        seen.add(root)
+        queue = deque([root])
+        while len(queue) > 0:
+            block = byId[queue.popleft()]
+            order.append(block)
+            for target in link_targets(block):
+                if target in byId and target not in seen:
+                    seen.add(target)
+                    queue.append(target)
+    return order
+
+
+def compile_story_to_bundle(
+    base_path: str,
+    story_source_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    minify: bool = True,
+    compress: bool = True,
+):
+    compile_story_data_to_bundle(
+        base_path,
+        load_story(story_source_path),
+        chunk_size=chunk_size,
+        minify=minify,
+        compress=compress,
+    )
+
+
+def compile_story_data_to_bundle(
+    base_path: str,
+    loaded_story: dict,
+    progress: Callable[[int, int], None] | None = None,
+    cancelled: Callable[[], bool] | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    minify: bool = True,
+    compress: bool = True,
+) -> bool:
+    """
+    Writes the story into `base_path` as a single page, with its passages
+    in chunks of about `chunk_size` characters. The other arguments work
+    as for compile_story_data_to_html. Returns whether the whole story
+    was written.
+    """
+    chunks_dir = join(base_path, CHUNKS_DIR)
+    if not exists(chunks_dir):
+        mkdir(chunks_dir)
+
+    blocks = loaded_story.get("blocks", [])
+    chunkOf: dict[str, int] = {}
+    chunk: dict[str, str] = {}
+    chunkNumber = 0
+    size = 0
+
+    with OutputWriter(minify=minify, compress=compress) as output:
+
+        def write_chunk():
+            output.write(
+                join(chunks_dir, f"{chunkNumber}.json"),
+                dumps(chunk, separators=(",", ":")),
+                html=False,
+            )
+
+        for i, block in enumerate(locality_order(blocks, loaded_story.get("start"))):
+            if i % PROGRESS_INTERVAL == 0:
+                if cancelled is not None and cancelled():
+                    return False
+                if progress is not None:
+                    progress(i, len(blocks))
+
+            if size >= chunk_size:
+                write_chunk()
+                chunk = {}
+                chunkNumber += 1
+                size = 0
+            html = render_body_html(block["body"], BUNDLE_HREF_FORMAT)
+            if minify:
+                html = minify_html(html)
+            chunk[block["id"]] = html
+            chunkOf[block["id"]] = chunkNumber
+            size += len(html)
+        if len(chunk) > 0:
+            write_chunk()
+
+        output.write(join(base_path, RUNTIME_NAME), RUNTIME_JS, html=False)
+
+        # The map of which chunk each passage is in goes in the page
+        # itself, so the first passage only waits for its own chunk
+        manifest = dumps(
+            {"start": loaded_story.get("start"), "chunks": chunkOf}, separators=(",", ":")
+        )
+        startChunk = chunkOf.get(loaded_story.get("start"), 0)
+
+        # Only needed here, so it isn't loaded when the editor starts
+        from yattag import Doc
+
+        doc, tag, text = Doc().tagtext()
+        doc.asis("<!DOCTYPE html>")
+        with tag("html"):
+            with tag("head"):
+                doc.stag(
+                    "link",
+                    ("as", "fetch"),
+                    rel="preload",
+                    href=f"{CHUNKS_DIR}/{startChunk}.json",
+                    crossorigin="anonymous",
+                )
+            with tag("body"):
+                with tag("div", id="passage"):
+                    pass
+                with tag("script"):
+                    doc.asis("var STORY = " + manifest.replace("</", "<\\/") + ";")
+                with tag("script", src=RUNTIME_NAME):
+                    pass
+        output.write(join(base_path, "index.html"), doc.getvalue())
+
+    if progress is not None:
+        progress(len(blocks), len(blocks))
+    return True
@@ -0,0 +1,116 @@
+"""
+The last stage of compiling: minifies pages, skips writing files whose
+contents haven't changed since the last compile, and writes compressed
+copies next to each file for static hosts to serve as they are.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from gzip import compress as gzip_compress
+from os.path import exists, getmtime
+from re import DOTALL, IGNORECASE, compile
+
+try:
+    # Optional; without it only .gz copies are written
+    from brotli import compress as brotli_compress
+except ImportError:
+    brotli_compress = None
+
+# Whitespace inside these is kept as it is
+PRESERVED_RE = compile(
+    r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", DOTALL | IGNORECASE
+)
+WHITESPACE_RE = compile(r"\s{2,}")
+
+
+def _collapse(match) -> str:
+    # A browser shows any run of whitespace as one space, but a newline
+    # is kept where there was one so lines stay readable in the source
+    return "\n" if "\n" in match.group(0) else " "
+
+
+def minify_html(html: str) -> str:
+    """
+    Collapses runs of whitespace, which browsers render as a single
+    space anyway, outside of elements where whitespace matters.
+    """
+    pieces = PRESERVED_RE.split(html)
+    out: list[str] = []
+    # split() gives text, then each preserved element and its tag name
+    for i in range(0, len(pieces), 3):
+        out.append(WHITESPACE_RE.sub(_collapse, pieces[i]))
+        if i + 1 < len(pieces):
+            out.append(pieces[i + 1])
+    return "".join(out).strip()
+
+
+def _compress(path: str, data: bytes):
+    # No timestamp in the header, so the same page always compresses to
+    # the same bytes
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip_compress(data, compresslevel=9, mtime=0))
+    if brotli_compress is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli_compress(data))
+
+
+def _compressed_up_to_date(path: str) -> bool:
+    siblings = [path + ".gz"] + ([path + ".br"] if brotli_compress is not None else [])
+    mtime = getmtime(path)
+    return all(exists(s) and getmtime(s) >= mtime for s in siblings)
+
+
+class OutputWriter:
+    """
+    Writes compiled files, compressing them on a pool of threads while
+    the compile carries on (zlib lets go of the GIL while it works).
+    Use it as a context manager; leaving it waits for the compression.
+    """
+
+    def __init__(self, minify: bool = True, compress: bool = True):
+        self.__minify = minify
+        self.__compress = compress
+        self.__pool = ThreadPoolExecutor() if compress else None
+        self.__pending: deque[Future] = deque()
+        self.written = 0
+        self.unchanged = 0
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def write(self, path: str, content: str, html: bool = True):
+        if html and self.__minify:
+            content = minify_html(content)
+        data = content.encode("utf-8")
+
+        # Left alone if it's the same as last time, so it keeps its
+        # modification time and isn't compressed again
+        unchanged = False
+        if exists(path):
+            with open(path, "rb") as f:
+                unchanged = f.read() == data
+        if unchanged:
+            self.unchanged += 1
+        else:
+            with open(path, "wb") as f:
+                f.write(data)
+            self.written += 1
+
+        if self.__compress and not (unchanged and _compressed_up_to_date(path)):
+            self.__pending.append(self.__pool.submit(_compress, path, data))
+        # Surface any failures so far rather than only at the end
+        while len(self.__pending) > 0 and self.__pending[0].done():
+            self.__pending.popleft().result()
+
+    def close(self):
+        if self.__pool is None:
+            return
+        self.__pool.shutdown(wait=True)
+        self.__pool = None
+        for future in self.__pending:
+            future.result()
+        self.__pending.clear()
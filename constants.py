@@ -12,6 +12,7 @@ CONNECTION_WIDTH = 3
 BLOCK_COLOR = QColor(98, 104, 111, 255)
 ERROR_BLOCK_COLOR = QColor(131, 88, 90, 255)
 SELECTED_BLOCK_PEN = QPen(QColor(192, 209, 232, 255), 3, Qt.PenStyle.SolidLine)
+HIGHLIGHTED_BLOCK_PEN = QPen(QColor(232, 200, 96, 255), 3, Qt.PenStyle.SolidLine)
 
 SELECTED_BLOCK_COLOR = QColor(200, 140, 150)
 TEMP_NEW_BLOCK_COLOR = QColor(140, 140, 150, 128)
@@ -28,3 +29,15 @@ BLOCK_RECT_SIZE = QSizeF(CELL_SIZE * 3, CELL_SIZE)
 CONNECTION_BEZIER_AMT = 75
 
 ERROR_BADGE_COLOR = QColor(184, 47, 47, 255)
+
+LINK_COLOR = QColor(86, 128, 196, 255)
+LINK_TARGET_COLOR = QColor(62, 142, 108, 255)
+BROKEN_LINK_COLOR = ERROR_BADGE_COLOR
+
+GROUP_COLOR = QColor(76, 92, 116, 255)
+GROUP_RECT_SIZE = QSizeF(CELL_SIZE * 4, CELL_SIZE * 2)
+# Drawn around the blocks of a group that isn't collapsed
+GROUP_FRAME_PEN = QPen(QColor(120, 140, 170, 160), 2, Qt.PenStyle.DashLine)
+GROUP_FRAME_MARGIN = CELL_SIZE / 2
+# Connections bundling several links get wider, up to this
+MAX_CONNECTION_WIDTH = 12
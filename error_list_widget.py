@@ -1,6 +1,7 @@
 from PyQt6.QtWidgets import QWidget, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QLabel
 from PyQt6.QtGui import QFont
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
+from profiling import profiled
 from saver import error_to_string
 from story_components import Story
 
@@ -10,6 +11,10 @@ CONTENT_ROLE = Qt.ItemDataRole.UserRole + 2
 
 
 class ErrorListWidget(QWidget):
+    blockActivated = pyqtSignal(object)
+    # The block, and the start and end of the error in its body
+    spanActivated = pyqtSignal(object, int, int)
+
     def __init__(self, parent: QWidget | None = None):
         super().__init__(parent)
         self.__story: Story | None = None
@@ -30,6 +35,7 @@ class ErrorListWidget(QWidget):
         self.__story = story
         self.__story.errorsReevaluated.connect(self.onErrorsReevaluated)
 
+    @profiled()
     def onErrorsReevaluated(self):
         while self.__listWidget.topLevelItemCount() > 0:
             self.__listWidget.takeTopLevelItem(0)
@@ -61,11 +67,10 @@ class ErrorListWidget(QWidget):
         itemType = item.data(0, TYPE_ROLE)
         blockId = item.data(0, BLOCK_ID_ROLE)
         content = item.data(0, CONTENT_ROLE)
-        if itemType == "block":
-            # Go to block
-            ...
-        elif itemType == "error":
-            # Go to block then go to line with error?
-            ...
-
-        print(f"{item} double clicked on column {col}")
+        block = self.__story.blockById(blockId)
+        if block is None:
+            return
+        if itemType == "error" and "start" in content:
+            self.spanActivated.emit(block, content["start"], content["end"])
+        else:
+            self.blockActivated.emit(block)
@@ -0,0 +1,114 @@
+from re import IGNORECASE, Match, Pattern, compile, escape
+from typing import Iterable, NamedTuple
+
+from story_components import StoryBlock
+
+FIELDS = ("title", "body")
+
+# How much text either side of a match to show in a preview
+PREVIEW_CONTEXT = 30
+
+
+class FindMatch(NamedTuple):
+    block: StoryBlock
+    field: str
+    start: int
+    end: int
+    replacement: str
+
+
+class Replacement(NamedTuple):
+    block: StoryBlock
+    field: str
+    old_text: str
+    new_text: str
+    count: int
+
+
+def compile_find_pattern(text: str, regex: bool, case_sensitive: bool) -> Pattern:
+    """
+    Raises re.error if `regex` is set and the text isn't a valid
+    expression.
+    """
+    return compile(
+        text if regex else escape(text), 0 if case_sensitive else IGNORECASE
+    )
+
+
+def _expander(replace_with: str, regex: bool):
+    if regex:
+        return lambda m: m.expand(replace_with)
+    return lambda m: replace_with
+
+
+def _field_text(block: StoryBlock, field: str) -> str:
+    return block.title() if field == "title" else block.body()
+
+
+def find_matches(
+    blocks: Iterable[StoryBlock],
+    pattern: Pattern,
+    replace_with: str,
+    regex: bool,
+    fields: Iterable[str] = FIELDS,
+    limit: int | None = None,
+) -> list[FindMatch]:
+    """Lists the matches in the given blocks, along with what each would become."""
+    expand = _expander(replace_with, regex)
+    matches: list[FindMatch] = []
+    for block in blocks:
+        for field in fields:
+            for m in pattern.finditer(_field_text(block, field)):
+                if m.start() == m.end():
+                    continue
+                matches.append(FindMatch(block, field, m.start(), m.end(), expand(m)))
+                if limit is not None and len(matches) >= limit:
+                    return matches
+    return matches
+
+
+def plan_replacements(
+    blocks: Iterable[StoryBlock],
+    pattern: Pattern,
+    replace_with: str,
+    regex: bool,
+    fields: Iterable[str] = FIELDS,
+) -> list[Replacement]:
+    """
+    Works out the new text of every field that has at least one match,
+    without changing anything. Fields with no matches are left out.
+    """
+    expand = _expander(replace_with, regex)
+
+    replacements: list[Replacement] = []
+    for block in blocks:
+        for field in fields:
+            old_text = _field_text(block, field)
+            if pattern.search(old_text) is None:
+                continue
+            count = 0
+
+            def replace(m: Match) -> str:
+                nonlocal count
+                # Empty matches (such as from "x*") would insert the
+                # replacement between every character, which is never
+                # what's wanted, so they're neither replaced nor counted
+                if m.start() == m.end():
+                    return m.group(0)
+                count += 1
+                return expand(m)
+
+            new_text = pattern.sub(replace, old_text)
+            if new_text != old_text:
+                replacements.append(Replacement(block, field, old_text, new_text, count))
+    return replacements
+
+
+def preview_text(match: FindMatch) -> str:
+    text = _field_text(match.block, match.field)
+    start = max(0, match.start - PREVIEW_CONTEXT)
+    end = min(len(text), match.end + PREVIEW_CONTEXT)
+    before = ("…" if start > 0 else "") + text[start : match.start]
+    after = text[match.end : end] + ("…" if end < len(text) else "")
+    found = text[match.start : match.end]
+    return f"{before}[{found} → {match.replacement}]{after}".replace("\n", " ")
@@ -0,0 +1,211 @@
+from re import error as RegexError
+from PyQt6.QtWidgets import (
+    QWidget,
+    QLineEdit,
+    QCheckBox,
+    QPushButton,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QLabel,
+    QVBoxLayout,
+    QHBoxLayout,
+    QFormLayout,
+)
+from PyQt6.QtGui import QUndoStack
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from find_replace import (
+    compile_find_pattern,
+    find_matches,
+    plan_replacements,
+    preview_text,
+)
+from story_components import ReplaceTextCommand, Story, StoryBlock
+
+BLOCK_ROLE = Qt.ItemDataRole.UserRole + 0
+
+# Only this many matches are listed in the preview
+MAX_PREVIEW_MATCHES = 500
+
+
+class FindReplaceWidget(QWidget):
+    blockActivated = pyqtSignal(object)
+
+    def __init__(self, undoStack: QUndoStack, parent: QWidget | None = None):
+        super().__init__(parent)
+        self.__undoStack = undoStack
+        self.__story: Story | None = None
+        self.__selectedBlocks: list[StoryBlock] = []
+
+        self.__findField = QLineEdit(self)
+        self.__findField.setPlaceholderText("Find")
+        self.__replaceField = QLineEdit(self)
+        self.__replaceField.setPlaceholderText("Replace with")
+
+        self.__regexBox = QCheckBox("Regular expression", self)
+        self.__caseBox = QCheckBox("Match case", self)
+        self.__titlesBox = QCheckBox("Titles", self, checked=True)
+        self.__bodiesBox = QCheckBox("Bodies", self, checked=True)
+        self.__selectionOnlyBox = QCheckBox("Selected blocks only", self)
+
+        self.__statusLabel = QLabel(self, wordWrap=True)
+        self.__previewTree = QTreeWidget(self)
+        self.__previewTree.setHeaderHidden(True)
+        self.__previewTree.itemActivated.connect(self.onItemActivated)
+
+        self.__replaceAllButton = QPushButton("Replace All", self)
+        self.__replaceAllButton.clicked.connect(self.replaceAll)
+
+        self.__previewTimer = QTimer(self)
+        self.__previewTimer.setSingleShot(True)
+        self.__previewTimer.setInterval(150)
+        self.__previewTimer.timeout.connect(self.updatePreview)
+
+        for field in (self.__findField, self.__replaceField):
+            field.textChanged.connect(self.schedulePreview)
+        for box in (
+            self.__regexBox,
+            self.__caseBox,
+            self.__titlesBox,
+            self.__bodiesBox,
+            self.__selectionOnlyBox,
+        ):
+            box.toggled.connect(self.schedulePreview)
+
+        fieldsLayout = QFormLayout()
+        fieldsLayout.addRow(self.__findField)
+        fieldsLayout.addRow(self.__replaceField)
+
+        optionsLayout = QHBoxLayout()
+        optionsLayout.addWidget(self.__titlesBox)
+        optionsLayout.addWidget(self.__bodiesBox)
+
+        self.__ly = QVBoxLayout(self)
+        self.__ly.addLayout(fieldsLayout)
+        self.__ly.addWidget(self.__regexBox)
+        self.__ly.addWidget(self.__caseBox)
+        self.__ly.addLayout(optionsLayout)
+        self.__ly.addWidget(self.__selectionOnlyBox)
+        self.__ly.addWidget(self.__statusLabel)
+        self.__ly.addWidget(self.__previewTree)
+        self.__ly.addWidget(self.__replaceAllButton)
+
+    def setStory(self, story: Story):
+        if self.__story is not None:
+            self.__story.stateChanged.disconnect(self.schedulePreview)
+        self.__story = story
+        if self.__story is not None:
+            self.__story.stateChanged.connect(self.schedulePreview)
+        self.schedulePreview()
+
+    def setSelectedBlocks(self, blocks: list[StoryBlock]):
+        self.__selectedBlocks = blocks
+        if self.__selectionOnlyBox.isChecked():
+            self.schedulePreview()
+
+    def focusFind(self):
+        self.__findField.setFocus()
+        self.__findField.selectAll()
+
+    def schedulePreview(self):
+        self.__previewTimer.start()
+
+    def __scope(self):
+        if self.__selectionOnlyBox.isChecked():
+            return [b for b in self.__selectedBlocks if b in self.__story]
+        return self.__story
+
+    def __fields(self) -> list[str]:
+        fields = []
+        if self.__titlesBox.isChecked():
+            fields.append("title")
+        if self.__bodiesBox.isChecked():
+            fields.append("body")
+        return fields
+
+    def __pattern(self):
+        if self.__story is None or self.__findField.text() == "":
+            return None
+        try:
+            return compile_find_pattern(
+                self.__findField.text(),
+                self.__regexBox.isChecked(),
+                self.__caseBox.isChecked(),
+            )
+        except RegexError as e:
+            self.__statusLabel.setText(f"Invalid expression: {e}")
+            return None
+
+    def updatePreview(self):
+        self.__previewTree.clear()
+        self.__statusLabel.setText("")
+        pattern = self.__pattern()
+        self.__replaceAllButton.setEnabled(pattern is not None)
+        if pattern is None:
+            return
+
+        try:
+            matches = find_matches(
+                self.__scope(),
+                pattern,
+                self.__replaceField.text(),
+                self.__regexBox.isChecked(),
+                self.__fields(),
+                limit=MAX_PREVIEW_MATCHES + 1,
+            )
+        except (RegexError, IndexError) as e:
+            self.__statusLabel.setText(f"Invalid replacement: {e}")
+            self.__replaceAllButton.setEnabled(False)
+            return
+
+        self.__statusLabel.setText(
+            f"More than {MAX_PREVIEW_MATCHES} matches"
+            if len(matches) > MAX_PREVIEW_MATCHES
+            else f"{len(matches)} match{'es' if len(matches) != 1 else ''}"
+        )
+
+        blockItems: dict[StoryBlock, QTreeWidgetItem] = {}
+        for match in matches[:MAX_PREVIEW_MATCHES]:
+            blockItem = blockItems.get(match.block)
+            if blockItem is None:
+                blockItem = QTreeWidgetItem(self.__previewTree)
+                blockItem.setText(0, f"{match.block.title()} ({match.block.id()})")
+                blockItem.setData(0, BLOCK_ROLE, match.block)
+                blockItem.setExpanded(True)
+                blockItems[match.block] = blockItem
+
+            matchItem = QTreeWidgetItem(blockItem)
+            matchItem.setText(0, f"{match.field}: {preview_text(match)}")
+            matchItem.setData(0, BLOCK_ROLE, match.block)
+
+    def replaceAll(self):
+        pattern = self.__pattern()
+        if pattern is None:
+            return
+
+        try:
+            replacements = plan_replacements(
+                self.__scope(),
+                pattern,
+                self.__replaceField.text(),
+                self.__regexBox.isChecked(),
+                self.__fields(),
+            )
+        except (RegexError, IndexError) as e:
+            self.__statusLabel.setText(f"Invalid replacement: {e}")
+            return
+
+        if len(replacements) == 0:
+            return
+
+        self.__undoStack.push(
+            ReplaceTextCommand(
+                self.__story,
+                [(r.block, r.field, r.old_text, r.new_text) for r in replacements],
+                sum(r.count for r in replacements),
+            )
+        )
+
+    def onItemActivated(self, item: QTreeWidgetItem, col: int):
+        block = item.data(0, BLOCK_ROLE)
+        if block is not None:
+            self.blockActivated.emit(block)
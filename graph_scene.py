@@ -14,6 +14,7 @@ from PyQt6.QtGui import (
 )
 from PyQt6.QtCore import QRectF, Qt, QPointF, pyqtSignal, QSizeF, QMarginsF
 from add_new_block_widget import AddNewBlockWidget
+from profiling import profiled
 
 from story_components import (
     AddLinkBetweenBlocksCommand,
@@ -22,6 +23,7 @@ from story_components import (
     MoveStoryBlocksCommand,
     Story,
     StoryBlock,
+    StoryGroup,
 )
 
 from constants import (
@@ -40,13 +42,22 @@ from constants import (
     OUTPUT_RADIUS,
     BLOCK_RECT_SIZE,
     SELECTED_BLOCK_PEN,
-    ERROR_BADGE_COLOR
+    HIGHLIGHTED_BLOCK_PEN,
+    ERROR_BADGE_COLOR,
+    GROUP_COLOR,
+    GROUP_FRAME_MARGIN,
+    GROUP_FRAME_PEN,
+    GROUP_RECT_SIZE,
+    MAX_CONNECTION_WIDTH,
 )
 
+# A block, or a collapsed group standing in for its blocks
+Node = StoryBlock | StoryGroup
+
 
 class GraphScene(QGraphicsScene):
-    userRequestedBlockAdd = pyqtSignal(StoryBlock, QPointF)
-    blockRemoved = pyqtSignal(StoryBlock)
+    userRequestedBlockAdd = pyqtSignal(object, QPointF)
+    blockRemoved = pyqtSignal(object)
     blockSelectionChanged = pyqtSignal()
 
     def __init__(self, undoStack: QUndoStack, parent=None):
@@ -61,6 +72,7 @@ class GraphScene(QGraphicsScene):
 
         self.__selectedBlocks: list[StoryBlock] = []
         self.__selectedBlocksInitialPositions: dict = {}
+        self.__highlightedBlocks: set[StoryBlock] = set()
 
         self.__mouseDown: bool = False
         self.__mouseDownPos: QPointF | None = None
@@ -68,16 +80,38 @@ class GraphScene(QGraphicsScene):
         self.__newConnectionSourceBlock: StoryBlock = None
         self.__newConnectionTargetBlock: StoryBlock = None
         self.__newConnectionTargetPoint: QPointF | None = None
+        # Set when clicking a block that's already part of a larger
+        # selection, which narrows the selection to it unless it's dragged
+        self.__clickedBlocks: list[StoryBlock] | None = None
+
+        # The connections between the nodes on the canvas, with how many
+        # links each one bundles. Only rebuilt once links or groups change.
+        self.__connections: dict[tuple[Node, Node], int] | None = None
+        # Each group's bounding rect, and its blocks that are in the story
+        self.__groupGeometry: dict[StoryGroup, tuple[QRectF, list[StoryBlock]]] = {}
 
     def setStory(self, story: Story):
         if self.__story is not None:
             self.__story.stateChanged.disconnect(self.onStateChanged)
+            self.__story.errorsReevaluated.disconnect(self.onLinksChanged)
+            self.__story.groupsChanged.disconnect(self.onLinksChanged)
+            self.__story.blockPosChanged.disconnect(self.onBlockPosChanged)
         self.__story = story
 
         if self.__story is not None:
             self.__story.stateChanged.connect(self.onStateChanged)
+            # Anything that changes links or which blocks there are
+            # reevaluates the errors
+            self.__story.errorsReevaluated.connect(self.onLinksChanged)
+            self.__story.groupsChanged.connect(self.onLinksChanged)
+            self.__story.blockPosChanged.connect(self.onBlockPosChanged)
 
         self.clear()
+        self.__connections = None
+        self.__groupGeometry.clear()
+        self.__clickedBlocks = None
+        self.__selectedBlocks.clear()
+        self.__highlightedBlocks.clear()
         self.__newConnectionSourceBlock = None
         self.__newConnectionTargetBlock = None
         self.__newConnectionTargetPoint = None
@@ -85,7 +119,89 @@ class GraphScene(QGraphicsScene):
 
     def selectedBlocks(self) -> list[StoryBlock]:
         return self.__selectedBlocks.copy()
-    
+
+    def selectBlock(self, block: StoryBlock | None):
+        self.__selectedBlocks.clear()
+        self.__selectedBlocksInitialPositions.clear()
+        if block is not None:
+            self.__selectedBlocks.append(block)
+        self.blockSelectionChanged.emit()
+        self.update()
+
+    def setHighlightedBlocks(self, blocks: set[StoryBlock]):
+        self.__highlightedBlocks = set(blocks)
+        self.update()
+
+    def onLinksChanged(self):
+        self.__connections = None
+        self.__groupGeometry.clear()
+
+    def onBlockPosChanged(self, block: StoryBlock):
+        group = self.__story.groupOf(block)
+        if group is not None:
+            self.__groupGeometry.pop(group, None)
+
+    def isHidden(self, block: StoryBlock) -> bool:
+        """Whether the block is inside a collapsed group."""
+        group = self.__story.groupOf(block)
+        return group is not None and group.collapsed()
+
+    def nodeFor(self, block: StoryBlock) -> Node:
+        group = self.__story.groupOf(block)
+        return group if group is not None and group.collapsed() else block
+
+    def groupBlocks(self, group: StoryGroup) -> list[StoryBlock]:
+        """The group's blocks that are in the story."""
+        return self.__groupGeometryFor(group)[1]
+
+    def __groupGeometryFor(self, group: StoryGroup) -> tuple[QRectF, list[StoryBlock]]:
+        geometry = self.__groupGeometry.get(group)
+        if geometry is None:
+            blocks = [block for block in group.blocks() if block in self.__story]
+            if len(blocks) > 0:
+                left = min(block.x() for block in blocks)
+                top = min(block.y() for block in blocks)
+                right = max(block.x() for block in blocks) + BLOCK_RECT_SIZE.width()
+                bottom = max(block.y() for block in blocks) + BLOCK_RECT_SIZE.height()
+                bounds = QRectF(left, top, right - left, bottom - top)
+            else:
+                bounds = QRectF()
+            geometry = self.__groupGeometry[group] = (bounds, blocks)
+        return geometry
+
+    def groupRect(self, group: StoryGroup) -> QRectF:
+        """Where the group's node is drawn while it's collapsed."""
+        return QRectF(self.__groupGeometryFor(group)[0].topLeft(), GROUP_RECT_SIZE)
+
+    def nodeRect(self, node: Node) -> QRectF:
+        if isinstance(node, StoryGroup):
+            return self.groupRect(node)
+        return self.blockRect(node)
+
+    def __nodeOrigin(self, node: Node) -> tuple[float, float]:
+        if isinstance(node, StoryGroup):
+            bounds = self.__groupGeometryFor(node)[0]
+            return bounds.x(), bounds.y()
+        return node.x(), node.y()
+
+    def connections(self) -> dict[tuple[Node, Node], int]:
+        """
+        Every link between nodes on the canvas. Links into, out of and
+        between collapsed groups are bundled into a single connection per
+        pair of nodes, and links within a collapsed group are left out.
+        """
+        if self.__connections is None:
+            connections: dict[tuple[Node, Node], int] = {}
+            for block in self.__story:
+                source = self.nodeFor(block)
+                for targetBlock in self.__story.getConnectionsForBlock(block):
+                    target = self.nodeFor(targetBlock)
+                    if target is source and isinstance(source, StoryGroup):
+                        continue
+                    connections[(source, target)] = connections.get((source, target), 0) + 1
+            self.__connections = connections
+        return self.__connections
+
     def onStateChanged(self):
         # totalRect = QRectF()
         # for blockRect in [self.blockRect(b) for b in self.__story.blocks()]:
@@ -106,11 +222,12 @@ class GraphScene(QGraphicsScene):
         hasErrors = len(self.__story.errors().get(block.id(), [])) > 0
         painter.setBrush(ERROR_BLOCK_COLOR if hasErrors else  BLOCK_COLOR)
         painter.setPen(Qt.PenStyle.NoPen)
-        painter.setPen(
-            SELECTED_BLOCK_PEN
-            if block in self.__selectedBlocks
-            else QPen(Qt.PenStyle.NoPen)
-        )
+        if block in self.__selectedBlocks:
+            painter.setPen(SELECTED_BLOCK_PEN)
+        elif block in self.__highlightedBlocks:
+            painter.setPen(HIGHLIGHTED_BLOCK_PEN)
+        else:
+            painter.setPen(QPen(Qt.PenStyle.NoPen))
         painter.drawRoundedRect(
             br,
             10,
@@ -131,14 +248,40 @@ class GraphScene(QGraphicsScene):
             f"{block.pos().x()}, {block.pos().y()}",
         )
 
-    def blockRect(self, block: StoryBlock) -> QRectF:
-        return QRectF(
-            self.blockBoundingRect(block).x(),
-            self.blockBoundingRect(block).y(),
-            self.blockBoundingRect(block).width() - OUTPUT_RADIUS,
-            self.blockBoundingRect(block).height(),
+    def drawGroup(self, painter: QPainter, group: StoryGroup):
+        rect = self.groupRect(group)
+        blocks = self.groupBlocks(group)
+
+        errors = self.__story.errors()
+        hasErrors = any(len(errors.get(block.id(), [])) > 0 for block in blocks)
+        painter.setBrush(ERROR_BLOCK_COLOR if hasErrors else GROUP_COLOR)
+        if blocks[0] in self.__selectedBlocks:
+            painter.setPen(SELECTED_BLOCK_PEN)
+        elif not self.__highlightedBlocks.isdisjoint(blocks):
+            painter.setPen(HIGHLIGHTED_BLOCK_PEN)
+        else:
+            painter.setPen(QPen(Qt.PenStyle.NoPen))
+        painter.drawRoundedRect(rect, 10, 10, Qt.SizeMode.AbsoluteSize)
+
+        painter.setPen(Qt.GlobalColor.white)
+        painter.drawText(
+            rect,
+            Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap,
+            f"{group.title()}\n{len(blocks)} passage{'s' if len(blocks) != 1 else ''}",
         )
 
+    def drawGroupFrame(self, painter: QPainter, group: StoryGroup):
+        frame = self.__groupGeometryFor(group)[0].marginsAdded(
+            QMarginsF(GROUP_FRAME_MARGIN, GROUP_FRAME_MARGIN, GROUP_FRAME_MARGIN, GROUP_FRAME_MARGIN)
+        )
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.setPen(GROUP_FRAME_PEN)
+        painter.drawRoundedRect(frame, 10, 10, Qt.SizeMode.AbsoluteSize)
+        painter.drawText(frame.topLeft() + QPointF(0, -8), group.title())
+
+    def blockRect(self, block: StoryBlock) -> QRectF:
+        return QRectF(block.pos(), BLOCK_RECT_SIZE)
+
     def outputNodeRect(self, block: StoryBlock) -> QRectF:
         return QRectF(
             self.blockRect(block).right() - OUTPUT_RADIUS,
@@ -150,6 +293,7 @@ class GraphScene(QGraphicsScene):
     def blockBoundingRect(self, block: StoryBlock) -> QRectF:
         return QRectF(block.pos(), BLOCK_RECT_SIZE + QSizeF(OUTPUT_RADIUS, 0))
 
+    @profiled()
     def drawBackground(self, painter: QPainter, rect: QRectF) -> None:
         painter.setBrush(QBrush(BG_COLOR))
         painter.setPen(QPen(Qt.PenStyle.NoPen))
@@ -173,65 +317,54 @@ class GraphScene(QGraphicsScene):
         if self.__story is None:
             return
 
+        # Only what's in (or, for connections, crosses) the exposed area
+        # is drawn
+        left, top, right, bottom = rect.left(), rect.top(), rect.right(), rect.bottom()
+
         # Draw start block arrow
         if self.__story.startBlock() is not None:
+            startRect = self.nodeRect(self.nodeFor(self.__story.startBlock()))
             painter.setBrush(Qt.BrushStyle.NoBrush)
             painter.setPen(QPen(CONNECTION_COLOR, CONNECTION_WIDTH))
             painter.drawLine(
-                QPointF(
-                    self.blockRect(self.__story.startBlock()).left() - 100,
-                    self.blockRect(self.__story.startBlock()).center().y(),
-                ),
-                QPointF(
-                    self.blockRect(self.__story.startBlock()).left(),
-                    self.blockRect(self.__story.startBlock()).center().y(),
-                ),
-            )
-            self.drawArrowhead(
-                painter,
-                QPointF(
-                    self.blockRect(self.__story.startBlock()).left(),
-                    self.blockRect(self.__story.startBlock()).center().y(),
-                ),
+                QPointF(startRect.left() - 100, startRect.center().y()),
+                QPointF(startRect.left(), startRect.center().y()),
             )
+            self.drawArrowhead(painter, QPointF(startRect.left(), startRect.center().y()))
 
         # Draw connection arrows
-        for block in self.__story.blocks():
-            targetBlocks = self.__story.getConnectionsForBlock(block)
-            for targetBlock in targetBlocks:
-                # Find the graphicsitem that this block goes to
-                painter.setBrush(QBrush(Qt.BrushStyle.NoBrush))
-                painter.setPen(QPen(CONNECTION_COLOR, CONNECTION_WIDTH))
-
-                path = QPainterPath()
-                path.moveTo(
-                    QPointF(
-                        self.blockRect(block).right(),
-                        self.blockRect(block).center().y(),
-                    )
-                )
-                path.cubicTo(
-                    QPointF(
-                        self.blockRect(block).right() + CONNECTION_BEZIER_AMT,
-                        self.blockRect(block).center().y(),
-                    ),
-                    QPointF(
-                        self.blockRect(targetBlock).left() - CONNECTION_BEZIER_AMT,
-                        self.blockRect(targetBlock).center().y(),
-                    ),
-                    QPointF(
-                        self.blockRect(targetBlock).left() - 5,
-                        self.blockRect(targetBlock).center().y(),
-                    ),
-                )
-                painter.drawPath(path)
-                self.drawArrowhead(
-                    painter,
-                    QPointF(
-                        self.blockRect(targetBlock).left(),
-                        self.blockRect(targetBlock).center().y(),
-                    ),
-                )
+        for (source, target), count in self.connections().items():
+            sourceX, sourceY = self.__nodeOrigin(source)
+            targetX, targetY = self.__nodeOrigin(target)
+            # The curve stays within its ends' rects, widened by the
+            # bezier handles (a group's node is the bigger of the two sizes)
+            if (
+                min(sourceX, targetX) - CONNECTION_BEZIER_AMT > right
+                or max(sourceX, targetX) + GROUP_RECT_SIZE.width() + CONNECTION_BEZIER_AMT < left
+                or min(sourceY, targetY) > bottom
+                or max(sourceY, targetY) + GROUP_RECT_SIZE.height() < top
+            ):
+                continue
+
+            sourceRect = self.nodeRect(source)
+            targetRect = self.nodeRect(target)
+            painter.setBrush(QBrush(Qt.BrushStyle.NoBrush))
+            painter.setPen(
+                QPen(CONNECTION_COLOR, min(CONNECTION_WIDTH + count - 1, MAX_CONNECTION_WIDTH))
+            )
+
+            path = QPainterPath()
+            path.moveTo(QPointF(sourceRect.right(), sourceRect.center().y()))
+            path.cubicTo(
+                QPointF(sourceRect.right() + CONNECTION_BEZIER_AMT, sourceRect.center().y()),
+                QPointF(targetRect.left() - CONNECTION_BEZIER_AMT, targetRect.center().y()),
+                QPointF(targetRect.left() - 5, targetRect.center().y()),
+            )
+            painter.drawPath(path)
+            self.drawArrowhead(painter, QPointF(targetRect.left(), targetRect.center().y()))
+            if count > 1:
+                painter.setPen(Qt.GlobalColor.white)
+                painter.drawText(path.pointAtPercent(0.5) + QPointF(4, -4), str(count))
 
         # Draw temporary new connection
         if self.__newConnectionSourceBlock is not None and self.__newConnectionTargetPoint is not None:
@@ -293,9 +426,34 @@ class GraphScene(QGraphicsScene):
                     10,
                 )
 
-        # Draw all blocks
-        for block in self.__story.blocks():
-            self.drawBlock(painter, block)
+        # Draw all blocks, and groups either as a frame around their
+        # blocks or in place of them
+        groups = self.__story.groups()
+        for group in groups:
+            if group.collapsed() or len(self.groupBlocks(group)) == 0:
+                continue
+            if self.__groupGeometryFor(group)[0].marginsAdded(
+                QMarginsF(GROUP_FRAME_MARGIN, CELL_SIZE, GROUP_FRAME_MARGIN, GROUP_FRAME_MARGIN)
+            ).intersects(rect):
+                self.drawGroupFrame(painter, group)
+
+        width = BLOCK_RECT_SIZE.width() + OUTPUT_RADIUS * 2
+        height = BLOCK_RECT_SIZE.height()
+        for block in self.__story:
+            x, y = block.x(), block.y()
+            # The block's position is drawn just above it
+            if x > right or x + width < left or y - CELL_SIZE > bottom or y + height < top:
+                continue
+            if not self.isHidden(block):
+                self.drawBlock(painter, block)
+
+        for group in groups:
+            if (
+                group.collapsed()
+                and len(self.groupBlocks(group)) > 0
+                and self.groupRect(group).intersects(rect)
+            ):
+                self.drawGroup(painter, group)
 
         return super().drawBackground(painter, rect)
 
@@ -311,32 +469,71 @@ class GraphScene(QGraphicsScene):
         painter.setPen(QPen(Qt.PenStyle.NoPen))
         painter.drawPath(arrowheadPath)
 
+    def nodeAt(self, pos: QPointF) -> tuple[Node | None, bool]:
+        """
+        Returns the node under `pos`, if there is one, and whether `pos`
+        is on its output rather than its body. Blocks inside collapsed
+        groups are skipped.
+        """
+        for group in reversed(self.__story.groups()):
+            if (
+                group.collapsed()
+                and len(self.groupBlocks(group)) > 0
+                and self.groupRect(group).contains(pos)
+            ):
+                return group, False
+
+        for block in self.__story:
+            if self.isHidden(block):
+                continue
+            if self.outputNodeRect(block).contains(pos):
+                return block, True
+            elif self.blockRect(block).contains(pos):
+                return block, False
+        return None, False
+
+    def __setSelection(self, blocks: list[StoryBlock]):
+        self.__selectedBlocks = list(blocks)
+        self.__selectedBlocksInitialPositions = {block: block.pos() for block in blocks}
+        self.blockSelectionChanged.emit()
+        self.update()
+
     def mousePressEvent(self, event: QGraphicsSceneMouseEvent) -> None:
         self.__mouseDown = True
         self.__mouseDownPos = event.scenePos()
-        for block in self.__story.blocks():
-            if self.outputNodeRect(block).contains(event.scenePos()):
-                event.accept()
-                self.__newConnectionSourceBlock = block
-                self.__selectedBlocks.clear()
-                self.__selectedBlocksInitialPositions.clear()
-                self.blockSelectionChanged.emit()
-                self.update()
-                return
-
-            elif self.blockRect(block).contains(event.scenePos()):
-                event.accept()
-                self.__selectedBlocks.clear()
-                self.__selectedBlocks.append(block)
-                self.__selectedBlocksInitialPositions[block] = block.pos()
-                self.blockSelectionChanged.emit()
-                self.update()
-                return
+        self.__clickedBlocks = None
+        extend = bool(event.modifiers() & Qt.KeyboardModifier.ShiftModifier)
+        node, onOutput = self.nodeAt(event.scenePos())
+
+        if node is not None and onOutput:
+            event.accept()
+            self.__newConnectionSourceBlock = node
+            self.__setSelection([])
+            return
 
-        self.__selectedBlocks.clear()
-        self.__selectedBlocksInitialPositions.clear()
-        self.blockSelectionChanged.emit()
-        self.update()
+        elif node is not None:
+            event.accept()
+            # Clicking a collapsed group selects all of its blocks
+            blocks = self.groupBlocks(node) if isinstance(node, StoryGroup) else [node]
+            selected = blocks[0] in self.__selectedBlocks
+            if extend and selected:
+                self.__setSelection([b for b in self.__selectedBlocks if b not in blocks])
+            elif extend:
+                self.__setSelection(self.__selectedBlocks + blocks)
+            elif selected:
+                # Kept as it is so the whole selection can be dragged
+                self.__clickedBlocks = blocks
+                self.__setSelection(self.__selectedBlocks)
+            else:
+                self.__setSelection(blocks)
+            return
+
+        if extend:
+            # Keeps the selection, but dragging on empty space doesn't move it
+            self.__mouseDown = False
+            self.__selectedBlocksInitialPositions.clear()
+        else:
+            self.__setSelection([])
         return
 
     def mouseMoveEvent(self, event: QGraphicsSceneMouseEvent) -> None:
@@ -346,8 +543,9 @@ class GraphScene(QGraphicsScene):
             # want to move them
             if len(self.__selectedBlocks) > 0:
                 delta = event.scenePos() - event.lastScenePos()
-                for block in self.__selectedBlocks:
-                    block.setPos(block.pos() + delta)
+                with self.__story.batchUpdate():
+                    for block in self.__selectedBlocks:
+                        block.setPos(block.pos() + delta)
                 self.update()
 
             else:
@@ -355,7 +553,9 @@ class GraphScene(QGraphicsScene):
                 # over an existing block, then snap the connection to
                 # that block.
                 if self.__newConnectionSourceBlock is not None:
-                    for block in self.__story.blocks():
+                    for block in self.__story:
+                        if self.isHidden(block):
+                            continue
                         if self.blockRect(block).contains(event.scenePos()):
                             self.__newConnectionTargetBlock = block
 
@@ -379,13 +579,19 @@ class GraphScene(QGraphicsScene):
 
         # Save mouse down position, and make a command for moving
         # blocks where it sets their position by the delta amount
-        if len(self.__selectedBlocks) > 0 and event.scenePos() != self.__mouseDownPos:
+        if (
+            len(self.__selectedBlocksInitialPositions) > 0
+            and event.scenePos() != self.__mouseDownPos
+        ):
             self.__undoStack.push(
                 MoveStoryBlocksCommand(
                 self.__selectedBlocksInitialPositions.copy(), event.scenePos() - self.__mouseDownPos
                 )
             )
 
+        elif self.__clickedBlocks is not None:
+            self.__setSelection(self.__clickedBlocks)
+
         elif self.__newConnectionSourceBlock is not None:
             if self.__newConnectionTargetBlock is not None:
                 # Don't create a new block; instead, add a link
@@ -401,6 +607,7 @@ class GraphScene(QGraphicsScene):
                 self.userRequestedBlockAdd.emit(self.__newConnectionSourceBlock, pos)
 
         self.__selectedBlocksInitialPositions.clear()
+        self.__clickedBlocks = None
         self.__mouseDownPos = None
         self.__newConnectionTargetPoint = None
         self.__newConnectionSourceBlock = None
@@ -429,7 +636,10 @@ class GraphScene(QGraphicsScene):
         return super().keyPressEvent(event)
 
     def mouseDoubleClickEvent(self, event: QGraphicsSceneMouseEvent) -> None:
-        if self.__newConnectionSourceBlock is None:
+        node, _ = self.nodeAt(event.scenePos())
+        if isinstance(node, StoryGroup):
+            node.setCollapsed(False)
+        elif self.__newConnectionSourceBlock is None:
             self.userRequestedBlockAdd.emit(None, event.scenePos())
 
         return super().mouseDoubleClickEvent(event)
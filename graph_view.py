@@ -1,8 +1,10 @@
 from PyQt6 import QtGui
 from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QWidget
-from PyQt6.QtGui import QPainter, QMouseEvent
+from PyQt6.QtGui import QPainter, QMouseEvent, QPaintEvent
 from PyQt6.QtCore import QRect, QPointF, pyqtSignal, QMetaObject
 
+from perf_hud import FRAME_SPAN, PerfHud
+from profiling import span
 from story_components import StoryBlock
 
 Connection = QMetaObject.Connection
@@ -11,7 +13,8 @@ from add_new_block_widget import AddNewBlockWidget, BubbleOverlayWidget
 
 
 class GraphView(QGraphicsView):
-    userConfirmedNewNode = pyqtSignal(str, StoryBlock, QPointF)
+    userConfirmedNewNode = pyqtSignal(str, object, QPointF)
+    firstFramePainted = pyqtSignal()
 
     def __init__(self, scene: QGraphicsScene, parent: QWidget | None = None):
         super().__init__(scene, parent)
@@ -34,6 +37,16 @@ class GraphView(QGraphicsView):
         self.__targetPos: QPointF | None = None
         self.__sourceBlock: StoryBlock | None = None
 
+        self.perfHud = PerfHud(self)
+        self.__painted = False
+
+    def paintEvent(self, event: QPaintEvent) -> None:
+        with span(FRAME_SPAN):
+            super().paintEvent(event)
+        if not self.__painted:
+            self.__painted = True
+            self.firstFramePainted.emit()
+
     def onUserRequestedNewNode(
         self, sourceBlock: StoryBlock | None, pos: QPointF
     ) -> None:
@@ -1,6 +1,35 @@
+from typing import Callable
+
+
 def id_ify(title: str) -> str:
     """
     Takes a title and makes it all lowercase, then replaces spaces with
     hyphens to make it more URL-friendly.
     """
-    return '-'.join([t.lower() for t in title.split()])
\ No newline at end of file
+    return '-'.join([t.lower() for t in title.split()])
+
+# Used when a title has nothing to make an ID from
+DEFAULT_ID_BASE = "untitled"
+
+
+class IdAllocator:
+    """
+    Hands out IDs that aren't taken yet, given a way to check whether
+    one is. A clash gets a numbered suffix ("title-2", "title-3", ...);
+    the next suffix to try is remembered for each base, so making many
+    blocks with the same title doesn't check every earlier number again.
+    """
+
+    def __init__(self, taken: Callable[[str], bool]):
+        self.__taken = taken
+        self.__nextSuffix: dict[str, int] = {}
+
+    def allocate(self, base: str) -> str:
+        base = base or DEFAULT_ID_BASE
+        if not self.__taken(base):
+            return base
+        n = self.__nextSuffix.get(base, 2)
+        while self.__taken(f"{base}-{n}"):
+            n += 1
+        self.__nextSuffix[base] = n + 1
+        return f"{base}-{n}"
@@ -0,0 +1,314 @@
+"""
+An append-only record of every change made to an open story, kept next
+to it so that edits made since the last save survive a crash.
+
+Changes are recorded from the Story's signals, so undo commands, their
+undoing and redoing, and direct edits to blocks are all covered alike.
+Each change is one short JSON line; body edits store only the spliced
+text. Block moves come in on every step of a drag, so they're held
+and written out together at most every POSITION_FLUSH_INTERVAL. When a
+save starts the journal is rotated, and once the save has finished the
+rotated part is deleted, since the save now holds it.
+"""
+
+from json import JSONDecodeError, dumps, loads
+from os import remove, replace
+from os.path import exists, join
+from typing import IO
+
+from PyQt6.QtCore import QObject, QTimer
+
+from story_components import Story, StoryBlock
+from text_diff import apply_diff, diff_text, text_checksum
+
+JOURNAL_NAME = ".packard-journal.jsonl"
+# The part of the journal covered by a save that's still being written
+CHECKPOINT_NAME = ".packard-journal.1.jsonl"
+# Milliseconds that block moves are held for before being written
+POSITION_FLUSH_INTERVAL = 500
+
+
+def _journal_files(story_path: str) -> list[str]:
+    # Oldest first
+    return [join(story_path, CHECKPOINT_NAME), join(story_path, JOURNAL_NAME)]
+
+
+def has_journal(story_path: str) -> bool:
+    return any(exists(path) for path in _journal_files(story_path))
+
+
+def discard_journal(story_path: str):
+    for path in _journal_files(story_path):
+        if exists(path):
+            remove(path)
+
+
+def discard_checkpoint(story_path: str):
+    """Deletes the part of the journal covered by a save that has finished."""
+    path = join(story_path, CHECKPOINT_NAME)
+    if exists(path):
+        remove(path)
+
+
+def read_journal(story_path: str) -> list[dict]:
+    records: list[dict] = []
+    for path in _journal_files(story_path):
+        if not exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(loads(line))
+                except JSONDecodeError:
+                    # The last line may have been cut off by the crash
+                    break
+    return records
+
+
+def replay_journal(story_data: dict, records: list[dict]) -> int:
+    """
+    Applies journal records to story data as returned by load_story,
+    in place. Returns how many records changed anything.
+
+    A crash during a save can leave some blocks on disk already holding
+    edits that are also in the journal. Every body record carries the
+    checksum of the body it produced, so each block's body edits are
+    only replayed from after the last one that it already matches. It
+    also carries the checksum of the text it removed, and an edit that
+    doesn't line up with the body it's replayed onto is skipped.
+    """
+    blocks: list[dict] = story_data["blocks"]
+    byId = {block["id"]: block for block in reversed(blocks)}
+
+    # Work out where each block's body edits should start from
+    skipUntil: dict[str, int] = {}
+    ids = {id: id for id in byId}
+    for i, record in enumerate(records):
+        op = record.get("op")
+        if op == "id":
+            if record["old"] in ids:
+                ids[record["id"]] = ids.pop(record["old"])
+            else:
+                # The rename was already saved, so the block is on disk
+                # under its new ID
+                ids.setdefault(record["id"], record["id"] if record["id"] in byId else None)
+        elif op == "add":
+            # A crash part way through a save can leave the block on disk
+            ids[record["id"]] = record["id"] if record["id"] in byId else None
+        elif op == "body":
+            original = ids.get(record["id"])
+            if original is not None and text_checksum(byId[original]["body"]) == record["crc"]:
+                skipUntil[original] = i
+
+    applied = 0
+    for i, record in enumerate(records):
+        op = record.get("op")
+        block = byId.get(record.get("id"))
+
+        if op == "body" and block is not None:
+            # Keyed by the block's ID on disk, which is where skipUntil
+            # was worked out from
+            if i > skipUntil.get(block.get("_diskId", block["id"]), -1):
+                body = block["body"]
+                start = record["s"]
+                removed = body[start : start + record["n"]]
+                # Older journals don't record what the edit removed
+                if "rc" in record and text_checksum(removed) != record["rc"]:
+                    continue
+                block["body"] = apply_diff(body, start, removed, record["t"])
+                applied += 1
+        elif op == "title" and block is not None:
+            block["title"] = record["title"]
+            applied += 1
+        elif op == "pos" and block is not None:
+            block["x"], block["y"] = record["x"], record["y"]
+            applied += 1
+        elif op == "id":
+            block = byId.pop(record["old"], None)
+            if block is not None:
+                block.setdefault("_diskId", block["id"])
+                block["id"] = record["id"]
+                byId[record["id"]] = block
+                for group in story_data.get("groups", {}).values():
+                    group["blocks"] = [
+                        record["id"] if id == record["old"] else id for id in group["blocks"]
+                    ]
+                applied += 1
+        elif op == "add" and block is None:
+            newBlock = {key: record[key] for key in ("id", "title", "body", "x", "y")}
+            blocks.append(newBlock)
+            byId[newBlock["id"]] = newBlock
+            applied += 1
+        elif op == "remove":
+            removed = {id for id in record["ids"] if id in byId}
+            for id in removed:
+                del byId[id]
+            story_data["blocks"] = blocks = [b for b in blocks if b["id"] not in removed]
+            if len(removed) > 0:
+                applied += 1
+        elif op == "start":
+            story_data["start"] = record["id"]
+            applied += 1
+        elif op == "groups":
+            story_data["groups"] = record["groups"]
+            applied += 1
+
+    for block in blocks:
+        block.pop("_diskId", None)
+    return applied
+
+
+class Journal(QObject):
+    """Records the changes made to a story into its journal file."""
+
+    def __init__(self, parent: QObject | None = None):
+        super().__init__(parent)
+        self.__story: Story | None = None
+        self.__path: str | None = None
+        self.__file: IO | None = None
+        self.__startId: str | None = None
+        self.__pendingPositions: set[StoryBlock] = set()
+
+        self.__positionTimer = QTimer(self)
+        self.__positionTimer.setSingleShot(True)
+        self.__positionTimer.setInterval(POSITION_FLUSH_INTERVAL)
+        self.__positionTimer.timeout.connect(self.flushPositions)
+
+    def setStory(self, story: Story, path: str | None):
+        if self.__story is not None:
+            self.__story.blockTitleChanged.disconnect(self.onBlockTitleChanged)
+            self.__story.blockIdChanged.disconnect(self.onBlockIdChanged)
+            self.__story.blockBodyChanged.disconnect(self.onBlockBodyChanged)
+            self.__story.blockPosChanged.disconnect(self.onBlockPosChanged)
+            self.__story.blocksAdded.disconnect(self.onBlocksAdded)
+            self.__story.blocksRemoved.disconnect(self.onBlocksRemoved)
+            self.__story.stateChanged.disconnect(self.onStateChanged)
+            self.__story.groupsChanged.disconnect(self.onGroupsChanged)
+        self.close()
+
+        self.__story = story
+        self.__path = path
+        if self.__story is None or self.__path is None:
+            self.__story = None
+            return
+
+        self.__startId = self.__currentStartId()
+        self.__story.blockTitleChanged.connect(self.onBlockTitleChanged)
+        self.__story.blockIdChanged.connect(self.onBlockIdChanged)
+        self.__story.blockBodyChanged.connect(self.onBlockBodyChanged)
+        self.__story.blockPosChanged.connect(self.onBlockPosChanged)
+        self.__story.blocksAdded.connect(self.onBlocksAdded)
+        self.__story.blocksRemoved.connect(self.onBlocksRemoved)
+        self.__story.stateChanged.connect(self.onStateChanged)
+        self.__story.groupsChanged.connect(self.onGroupsChanged)
+
+    def close(self):
+        self.flushPositions()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __write(self, record: dict):
+        if self.__file is None:
+            self.__file = open(join(self.__path, JOURNAL_NAME), "a", encoding="utf-8")
+        self.__file.write(dumps(record, separators=(",", ":")) + "\n")
+        # Flushed to the OS, which keeps it through the app crashing
+        self.__file.flush()
+
+    def __currentStartId(self) -> str | None:
+        start = self.__story.startBlock()
+        return start.id() if isinstance(start, StoryBlock) else None
+
+    def flushPositions(self):
+        """Writes out the blocks moved since the last flush."""
+        self.__positionTimer.stop()
+        pending, self.__pendingPositions = self.__pendingPositions, set()
+        for block in pending:
+            # The block's current ID, which is what's in the journal by now
+            # if it's been renamed since it moved
+            self.__write({"op": "pos", "id": block.id(), "x": block.x(), "y": block.y()})
+
+    def checkpointStarted(self):
+        """
+        Called as a save takes its snapshot: everything journaled so far
+        is about to be in the save.
+        """
+        if self.__path is None:
+            return
+        self.close()
+        current, checkpoint = join(self.__path, JOURNAL_NAME), join(self.__path, CHECKPOINT_NAME)
+        if not exists(current):
+            return
+        if exists(checkpoint):
+            # An earlier save didn't finish, so its part is still needed
+            with open(current, encoding="utf-8") as src, open(
+                checkpoint, "a", encoding="utf-8"
+            ) as dest:
+                dest.write(src.read())
+            remove(current)
+        else:
+            replace(current, checkpoint)
+
+    def discard(self):
+        """Throws the journal away, such as when unsaved changes are discarded."""
+        self.__pendingPositions.clear()
+        self.close()
+        if self.__path is not None:
+            discard_journal(self.__path)
+
+    def onBlockTitleChanged(self, block: StoryBlock, oldTitle: str):
+        self.__write({"op": "title", "id": block.id(), "title": block.title()})
+
+    def onBlockIdChanged(self, block: StoryBlock, oldId: str):
+        self.__write({"op": "id", "old": oldId, "id": block.id()})
+
+    def onBlockBodyChanged(self, block: StoryBlock, oldBody: str):
+        start, removed, inserted = diff_text(oldBody, block.body())
+        self.__write(
+            {
+                "op": "body",
+                "id": block.id(),
+                "s": start,
+                "n": len(removed),
+                "t": inserted,
+                "rc": text_checksum(removed),
+                "crc": text_checksum(block.body()),
+            }
+        )
+
+    def onBlockPosChanged(self, block: StoryBlock):
+        self.__pendingPositions.add(block)
+        if not self.__positionTimer.isActive():
+            self.__positionTimer.start()
+
+    def onBlocksAdded(self, blocks: list[StoryBlock]):
+        for block in blocks:
+            self.__write(
+                {
+                    "op": "add",
+                    "id": block.id(),
+                    "title": block.title(),
+                    "body": block.body(),
+                    "x": block.x(),
+                    "y": block.y(),
+                }
+            )
+        # Blocks put back by an undo go back into their groups as well
+        if any(self.__story.groupOf(block) is not None for block in blocks):
+            self.onGroupsChanged()
+
+    def onBlocksRemoved(self, blocks: list[StoryBlock]):
+        # Another block could take the removed one's ID before the flush
+        self.__pendingPositions.difference_update(blocks)
+        self.__write({"op": "remove", "ids": [block.id() for block in blocks]})
+
+    def onGroupsChanged(self):
+        # Groups are few and small, so they're recorded whole
+        self.__write({"op": "groups", "groups": self.__story.groupsData()})
+
+    def onStateChanged(self):
+        # Changing the start block has no signal of its own
+        startId = self.__currentStartId()
+        if startId != self.__startId:
+            self.__startId = startId
+            self.__write({"op": "start", "id": startId})
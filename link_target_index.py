@@ -0,0 +1,102 @@
+from bisect import bisect_left, insort
+
+from story_components import Story, StoryBlock
+
+
+class LinkTargetIndex:
+    """
+    A sorted index of every block's ID and title, for completing link
+    targets by prefix. It's built on first use and then kept up to date
+    block by block from the story's signals.
+    """
+
+    def __init__(self) -> None:
+        self.__story: Story | None = None
+        # (lowercased key, block ID) pairs, kept sorted for bisecting
+        self.__entries: list[tuple[str, str]] = []
+        self.__blockEntries: dict[StoryBlock, list[tuple[str, str]]] = {}
+        self.__built: bool = False
+
+    def setStory(self, story: Story | None):
+        if self.__story is not None:
+            self.__story.blockTitleChanged.disconnect(self.onBlockChanged)
+            self.__story.blockIdChanged.disconnect(self.onBlockChanged)
+            self.__story.blocksAdded.disconnect(self.onBlocksAdded)
+            self.__story.blocksRemoved.disconnect(self.onBlocksRemoved)
+        self.__story = story
+        self.__entries.clear()
+        self.__blockEntries.clear()
+        self.__built = False
+
+        if self.__story is None:
+            return
+
+        self.__story.blockTitleChanged.connect(self.onBlockChanged)
+        self.__story.blockIdChanged.connect(self.onBlockChanged)
+        self.__story.blocksAdded.connect(self.onBlocksAdded)
+        self.__story.blocksRemoved.connect(self.onBlocksRemoved)
+
+    def __ensureBuilt(self):
+        if self.__built or self.__story is None:
+            return
+        for block in self.__story:
+            entries = self.__entriesForBlock(block)
+            self.__blockEntries[block] = entries
+            self.__entries.extend(entries)
+        self.__entries.sort()
+        self.__built = True
+
+    def onBlockChanged(self, block: StoryBlock):
+        if not self.__built or block not in self.__blockEntries:
+            return
+        self.__removeBlock(block)
+        self.__addBlock(block)
+
+    def onBlocksAdded(self, blocks: list[StoryBlock]):
+        if not self.__built:
+            return
+        for block in blocks:
+            self.__addBlock(block)
+
+    def onBlocksRemoved(self, blocks: list[StoryBlock]):
+        if not self.__built:
+            return
+        for block in blocks:
+            self.__removeBlock(block)
+
+    def complete(self, prefix: str, limit: int = 50) -> list[str]:
+        """
+        Returns the IDs of up to `limit` blocks whose ID or title starts
+        with `prefix`, ignoring case, in order.
+        """
+        self.__ensureBuilt()
+        prefix = prefix.lower()
+        entries = self.__entries
+        ids: list[str] = []
+        seen: set[str] = set()
+        i = bisect_left(entries, (prefix,))
+        while i < len(entries) and len(ids) < limit and entries[i][0].startswith(prefix):
+            id = entries[i][1]
+            if id not in seen:
+                seen.add(id)
+                ids.append(id)
+            i += 1
+        return ids
+
+    def __entriesForBlock(self, block: StoryBlock) -> list[tuple[str, str]]:
+        entries = [(block.id().lower(), block.id())]
+        if block.title().lower() != entries[0][0]:
+            entries.append((block.title().lower(), block.id()))
+        return entries
+
+    def __addBlock(self, block: StoryBlock):
+        entries = self.__entriesForBlock(block)
+        for entry in entries:
+            insort(self.__entries, entry)
+        self.__blockEntries[block] = entries
+
+    def __removeBlock(self, block: StoryBlock):
+        for entry in self.__blockEntries.pop(block, []):
+            i = bisect_left(self.__entries, entry)
+            if i < len(self.__entries) and self.__entries[i] == entry:
+                del self.__entries[i]
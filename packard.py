@@ -6,44 +6,103 @@ from PyQt6.QtWidgets import (
     QWidget,
     QDockWidget,
     QFileDialog,
+    QInputDialog,
     QMessageBox,
 )
-from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtCore import Qt, QPointF, QTimer, pyqtSignal
 from PyQt6.QtGui import (
     QPainter,
     QAction,
     QKeySequence,
-    QUndoStack,
     QCloseEvent,
     QTransform,
 )
-from sys import argv
+from os import environ
+from sys import argv, exit
+from typing import Callable
 from block_editor import BlockEditor
 from error_list_widget import ErrorListWidget
+from find_replace_widget import FindReplaceWidget
 from graph_scene import GraphScene
 from graph_view import GraphView
 from id_ify import id_ify
+from journal import (
+    Journal,
+    discard_checkpoint,
+    discard_journal,
+    has_journal,
+    read_journal,
+    replay_journal,
+)
+from preview_widget import PreviewWidget
+from search_widget import SearchWidget
 from status_bar import StatusBar
-from saver import errors_as_list, load_story, save_story, compile_story_to_html
+from saver import errors_as_list, load_story, save_story, compile_story_data_to_html
+from story_fsck import LOST_AND_FOUND, FsckReport, fsck_story, problem_to_string, repair_story
+from story_watcher import DiskChanges, StoryWatcher
+from undo_stack import UndoStack
+from workers import Worker, wait_for_workers
+import profiling
 from os.path import basename
 
 from story_components import (
     AddStoryBlockCommand,
     DeleteStoryBlockCommand,
     AddStoryBlockWithLinkToExistingBlockCommand,
+    SetStoryBlockPositionsCommand,
+    SetStoryGroupsCommand,
     Story,
     StoryBlock,
+    StoryGroup,
+    groups_from_data,
 )
 
 
+def load_blocks(
+    path: str, recover: bool = False
+) -> tuple[list[StoryBlock], StoryBlock | None, list[StoryGroup]]:
+    """
+    Reads a story from disk, returning its blocks, its start block and its
+    groups. If `recover` is set, the changes in its journal are replayed
+    on top.
+    """
+    storyData = load_story(path)
+    if recover:
+        replay_journal(storyData, read_journal(path))
+
+    blocks = []
+    startBlock = None
+    for blockData in storyData["blocks"]:
+        newBlock = StoryBlock(
+            title=blockData["title"],
+            body=blockData["body"],
+            id=blockData["id"],
+            pos=QPointF(blockData["x"] or 0, blockData["y"] or 0),
+        )
+        blocks.append(newBlock)
+        if blockData["id"] == storyData["start"]:
+            startBlock = newBlock
+    groups = groups_from_data(
+        storyData["groups"], {block.id(): block for block in reversed(blocks)}
+    )
+    return blocks, startBlock, groups
+
+
 class MainWindow(QMainWindow):
+    storyOpened = pyqtSignal()
+
     def __init__(self, parent: QWidget | None = None) -> None:
         super().__init__(parent)
-        self.undoStack = QUndoStack(self)
+        self.undoStack = UndoStack(self)
         self.currentStoryPath: str | None = None
 
         self.currentStory: Story | None = None
 
+        self.storyWatcher = StoryWatcher(self)
+        self.storyWatcher.changesDetected.connect(self.onStoryChangedOnDisk)
+        self.storyWatcher.storyReloaded.connect(self.onStoryReloaded)
+        self.journal = Journal(self)
+
         self.graphScene = GraphScene(parent=self, undoStack=self.undoStack)
         self.graphView = GraphView(self.graphScene, parent=self)
 
@@ -58,23 +117,46 @@ class MainWindow(QMainWindow):
 
         # set up editor
         self.editor = BlockEditor(undoStack=self.undoStack, parent=self)
-        self.onSelectionChanged()
         self.editorDockWidget = QDockWidget("Editor")
         self.editorDockWidget.setWidget(self.editor)
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.editorDockWidget)
 
-        # Set up error pane
-        self.errorPaneContents = ErrorListWidget(self)
+        # The other panes' docks are laid out now, but what goes in them
+        # is only built once the window has been painted (see buildPanes)
         self.errorPaneDockWidget = QDockWidget("Errors")
-        self.errorPaneDockWidget.setWidget(self.errorPaneContents)
         self.addDockWidget(
             Qt.DockWidgetArea.LeftDockWidgetArea, self.errorPaneDockWidget
         )
+        self.searchPaneDockWidget = QDockWidget("Search")
+        self.addDockWidget(
+            Qt.DockWidgetArea.LeftDockWidgetArea, self.searchPaneDockWidget
+        )
+        self.findReplaceDockWidget = QDockWidget("Find and Replace")
+        self.addDockWidget(
+            Qt.DockWidgetArea.RightDockWidgetArea, self.findReplaceDockWidget
+        )
+        self.findReplaceDockWidget.hide()
+        self.previewDockWidget = QDockWidget("Preview")
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.previewDockWidget)
+        self.previewDockWidget.hide()
+
+        self.errorPaneContents: ErrorListWidget | None = None
+        self.searchPaneContents: SearchWidget | None = None
+        self.findReplaceContents: FindReplaceWidget | None = None
+        self.previewContents: PreviewWidget | None = None
+        self.graphView.firstFramePainted.connect(
+            lambda: QTimer.singleShot(0, self.buildPanes)
+        )
 
         # Status bar
         self.__statusBar = StatusBar(self)
         self.setStatusBar(self.__statusBar)
         self.__statusBar.zoomSet.connect(self.onZoomSet)
+        self.__statusBar.cancelRequested.connect(self.onCancelTask)
+
+        self.__saveWorker: Worker | None = None
+        self.__saveQueued = False
+        self.__compileWorker: Worker | None = None
 
         self.__statusBar.setToggleErrorPaneAction(
             self.errorPaneDockWidget.toggleViewAction()
@@ -101,12 +183,33 @@ class MainWindow(QMainWindow):
             shortcut=QKeySequence.StandardKey.Open,
             triggered=self.onOpen,
         )
+        self.importTwineAction = QAction(
+            "&Import from Twine...",
+            parent=self,
+            triggered=self.onImportTwine,
+        )
         self.compileStoryAction = QAction(
             "&Compile...",
             parent=self,
             shortcut=QKeySequence("Ctrl+Shift+E"),
             triggered=self.onCompileStory,
         )
+        self.compileBundleAction = QAction(
+            "Compile as Single &Page...",
+            parent=self,
+            triggered=self.onCompileBundle,
+        )
+        self.playFromHereAction = QAction(
+            "Play from &Here",
+            parent=self,
+            shortcut=QKeySequence("F5"),
+            triggered=self.onPlayFromHere,
+        )
+        self.checkStoryAction = QAction(
+            "Check Story &Files...",
+            parent=self,
+            triggered=self.onCheckStory,
+        )
 
         self.editMenu = self.menuBar().addMenu("&Edit")
 
@@ -115,14 +218,103 @@ class MainWindow(QMainWindow):
         self.redoAction = self.undoStack.createRedoAction(self)
         self.redoAction.setShortcut(QKeySequence.StandardKey.Redo)
 
+        self.findAction = QAction(
+            "&Find...",
+            parent=self,
+            shortcut=QKeySequence.StandardKey.Find,
+            triggered=self.onFind,
+        )
+        self.autoLayoutAction = QAction(
+            "&Auto Layout",
+            parent=self,
+            shortcut=QKeySequence("Ctrl+Shift+L"),
+            triggered=self.onAutoLayout,
+        )
+        self.groupBlocksAction = QAction(
+            "&Group Blocks...",
+            parent=self,
+            shortcut=QKeySequence("Ctrl+G"),
+            triggered=self.onGroupBlocks,
+        )
+        self.ungroupAction = QAction(
+            "&Ungroup",
+            parent=self,
+            shortcut=QKeySequence("Ctrl+Shift+G"),
+            triggered=self.onUngroup,
+        )
+        self.collapseGroupsAction = QAction(
+            "&Collapse Groups",
+            parent=self,
+            shortcut=QKeySequence("Ctrl+["),
+            triggered=lambda: self.setGroupsCollapsed(True),
+        )
+        self.expandGroupsAction = QAction(
+            "E&xpand Groups",
+            parent=self,
+            shortcut=QKeySequence("Ctrl+]"),
+            triggered=lambda: self.setGroupsCollapsed(False),
+        )
+        self.findReplaceAction = QAction(
+            "Find and &Replace...",
+            parent=self,
+            shortcut=QKeySequence.StandardKey.Replace,
+            triggered=self.onFindReplace,
+        )
+
         self.fileMenu.addAction(self.saveAction)
         self.fileMenu.addAction(self.saveAsAction)
         self.fileMenu.addAction(self.openAction)
+        self.fileMenu.addAction(self.importTwineAction)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.compileStoryAction)
+        self.fileMenu.addAction(self.compileBundleAction)
+        self.fileMenu.addAction(self.playFromHereAction)
+        self.fileMenu.addSeparator()
+        self.fileMenu.addAction(self.checkStoryAction)
 
         self.editMenu.addAction(self.undoAction)
         self.editMenu.addAction(self.redoAction)
+        self.editMenu.addSeparator()
+        self.editMenu.addAction(self.findAction)
+        self.editMenu.addAction(self.findReplaceAction)
+        self.editMenu.addSeparator()
+        self.editMenu.addAction(self.autoLayoutAction)
+        self.editMenu.addSeparator()
+        self.editMenu.addAction(self.groupBlocksAction)
+        self.editMenu.addAction(self.ungroupAction)
+        self.editMenu.addAction(self.collapseGroupsAction)
+        self.editMenu.addAction(self.expandGroupsAction)
+
+        self.profilingAction = QAction(
+            "&Record Timings",
+            parent=self,
+            checkable=True,
+            checked=profiling.enabled(),
+            toggled=profiling.set_enabled,
+        )
+        self.perfHudAction = QAction(
+            "Show Performance &HUD",
+            parent=self,
+            checkable=True,
+            toggled=self.graphView.perfHud.setVisible,
+        )
+        self.exportTraceAction = QAction(
+            "&Export Trace...",
+            parent=self,
+            triggered=self.onExportTrace,
+        )
+        self.resetProfilingAction = QAction(
+            "Re&set Timings",
+            parent=self,
+            triggered=profiling.reset,
+        )
+
+        self.debugMenu = self.menuBar().addMenu("&Debug")
+        self.debugMenu.addAction(self.profilingAction)
+        self.debugMenu.addAction(self.perfHudAction)
+        self.debugMenu.addSeparator()
+        self.debugMenu.addAction(self.exportTraceAction)
+        self.debugMenu.addAction(self.resetProfilingAction)
 
         self.setStory(Story())
 
@@ -132,8 +324,7 @@ class MainWindow(QMainWindow):
         if self.currentStoryPath is None:
             return self.onSaveAs()
 
-        save_story(self.currentStoryPath, self.currentStory.data())
-        self.currentStory.resetModified()
+        self.saveStoryInBackground(self.currentStoryPath)
         return True
 
     def onSaveAs(self) -> bool:
@@ -142,45 +333,267 @@ class MainWindow(QMainWindow):
         if saveLocation == "":
             return False
 
-        storyData = self.currentStory.data()
-
-        # TODO: handle errors in saving story
-        save_story(saveLocation, storyData)
-
         self.currentStoryPath = saveLocation
+        self.storyWatcher.setStory(self.currentStory, self.currentStoryPath)
+        self.journal.setStory(self.currentStory, self.currentStoryPath)
 
-        self.currentStory.resetModified()
+        self.saveStoryInBackground(saveLocation)
         self.updateWindowTitle()
         return True
 
+    def saveStoryInBackground(self, saveLocation: str):
+        """
+        Writes a snapshot of the story as it is now on a worker thread.
+        Editing can carry on meanwhile; those changes stay unsaved.
+        """
+        if self.__saveWorker is not None:
+            # Saved again once the current save is done, with whatever
+            # has changed by then
+            self.__saveQueued = True
+            return
+
+        story = self.currentStory
+        generation = story.generation()
+        self.storyWatcher.suspend()
+        self.journal.checkpointStarted()
+
+        self.__saveWorker = Worker(
+            save_story, saveLocation, story.data(), reportsProgress=True
+        )
+        self.__saveWorker.signals.progress.connect(self.onSaveProgress)
+        self.__saveWorker.signals.finished.connect(
+            lambda _: self.onSaveFinished(story, saveLocation, generation, None)
+        )
+        self.__saveWorker.signals.failed.connect(
+            lambda message: self.onSaveFinished(story, saveLocation, generation, message)
+        )
+        self.__saveWorker.start()
+
+    def onSaveProgress(self, done: int, total: int):
+        if self.__compileWorker is None:
+            self.__statusBar.showProgress("Saving...", done, total)
+
+    def onSaveFinished(
+        self, story: Story, saveLocation: str, generation: int, error: str | None
+    ):
+        self.__saveWorker = None
+        self.storyWatcher.resume()
+        if error is None:
+            # Even if another story has been opened since, or the
+            # checkpoint would be offered for recovery next time
+            discard_checkpoint(saveLocation)
+        if self.__compileWorker is None:
+            self.__statusBar.hideProgress()
+
+        if error is not None:
+            self.__saveQueued = False
+            QMessageBox.critical(
+                self,
+                "Could not save story",
+                f"The story could not be saved: {error}",
+                QMessageBox.StandardButton.Ok,
+                QMessageBox.StandardButton.Ok,
+            )
+            return
+
+        story.markSaved(generation)
+        self.updateWindowTitle()
+
+        if self.__saveQueued:
+            self.__saveQueued = False
+            if story is self.currentStory and story.modified():
+                self.saveStoryInBackground(self.currentStoryPath)
+
     def onOpen(self):
         openLocation = QFileDialog.getExistingDirectory(self, "Open Story...")
         if openLocation == "":
             return
+        self.openStory(openLocation)
 
-        # TODO: handle errors in loading story
-        storyData = load_story(openLocation)
-
-        blocks = []
-        startBlock = None
-        for blockData in storyData["blocks"]:
-            newBlock = StoryBlock(
-                title=blockData["title"],
-                body=blockData["body"],
-                id=blockData["id"],
-                pos=QPointF(blockData["x"], blockData["y"]),
-            )
-            blocks.append(newBlock)
-            if blockData["id"] == storyData["start"]:
-                startBlock = newBlock
+    def onImportTwine(self):
+        sourcePath, _ = QFileDialog.getOpenFileName(
+            self,
+            "Import from Twine...",
+            filter="Twine stories (*.html *.htm *.twee *.tw);;All files (*)",
+        )
+        if sourcePath == "":
+            return
+
+        destLocation = QFileDialog.getExistingDirectory(
+            self, "Choose Folder for Imported Story..."
+        )
+        if destLocation == "":
+            return
 
-        newStory = Story(startBlock=startBlock, blocks=blocks)
+        from twine_import import import_twine
+
+        try:
+            import_twine(sourcePath, destLocation)
+        except (OSError, UnicodeDecodeError) as e:
+            QMessageBox.critical(
+                self,
+                "Could not import story",
+                f"The story could not be imported: {e}",
+                QMessageBox.StandardButton.Ok,
+                QMessageBox.StandardButton.Ok,
+            )
+            return
+        self.openStory(destLocation)
+
+    def askToRecover(self, openLocation: str) -> bool:
+        """
+        Offers to bring back the changes journaled by a session that ended
+        without saving them, if there are any.
+        """
+        if not has_journal(openLocation):
+            return False
+        box = QMessageBox(
+            QMessageBox.Icon.Warning,
+            "Recover unsaved changes?",
+            f"{basename(openLocation)} has unsaved changes from a session that didn't close properly.",
+            parent=self,
+        )
+        box.setInformativeText("Discarding them opens the story as it was last saved.")
+        recoverButton = box.addButton("Recover", QMessageBox.ButtonRole.AcceptRole)
+        box.addButton("Discard", QMessageBox.ButtonRole.DestructiveRole)
+        box.exec()
+        if box.clickedButton() is recoverButton:
+            return True
+        discard_journal(openLocation)
+        return False
+
+    def openStory(self, openLocation: str):
+        recover = self.askToRecover(openLocation)
+        try:
+            loaded = load_blocks(openLocation, recover)
+        except (OSError, ValueError) as e:
+            # Such as missing block files, or JSON that won't parse
+            self.onStoryLoadFailed(openLocation, str(e))
+            return
+        self.onStoryLoaded(openLocation, loaded, recover)
+
+    def openStoryInBackground(self, openLocation: str):
+        """
+        Reads the story on a worker thread, so the window can carry on
+        painting and responding while a large story loads.
+        """
+        recover = self.askToRecover(openLocation)
+        self.__statusBar.showMessage(f"Opening {basename(openLocation)}...")
+        worker = Worker(load_blocks, openLocation, recover)
+        worker.signals.finished.connect(
+            lambda loaded: self.onStoryLoaded(openLocation, loaded, recover)
+        )
+        worker.signals.failed.connect(
+            lambda message: self.onStoryLoadFailed(openLocation, message)
+        )
+        worker.start()
+
+    def onStoryLoaded(
+        self,
+        openLocation: str,
+        loaded: tuple[list[StoryBlock], StoryBlock | None, list[StoryGroup]],
+        recovered: bool = False,
+    ):
+        blocks, startBlock, groups = loaded
+        newStory = Story(startBlock=startBlock, blocks=blocks, groups=groups)
+        if recovered:
+            newStory.markModified()
 
         self.currentStoryPath = openLocation
 
         self.setStory(newStory)
 
         self.updateWindowTitle()
+        self.__statusBar.clearMessage()
+        self.storyOpened.emit()
+
+    def onStoryLoadFailed(self, openLocation: str, message: str):
+        self.__statusBar.clearMessage()
+        box = QMessageBox(
+            QMessageBox.Icon.Critical,
+            "Could not open story",
+            f"{basename(openLocation)} could not be opened: {message}",
+            parent=self,
+        )
+        checkButton = box.addButton("Check and Repair...", QMessageBox.ButtonRole.ActionRole)
+        box.addButton(QMessageBox.StandardButton.Ok)
+        box.exec()
+        if box.clickedButton() is checkButton:
+            self.checkStoryFiles(openLocation, openAfterRepair=True)
+
+    def onCheckStory(self):
+        if self.currentStoryPath is None:
+            QMessageBox.information(
+                self,
+                "Check Story Files",
+                "This story hasn't been saved yet, so it has no files to check.",
+            )
+            return
+        self.checkStoryFiles(self.currentStoryPath)
+
+    def checkStoryFiles(self, path: str, openAfterRepair: bool = False):
+        """
+        Scans a story's files for problems on a worker thread, and offers
+        to repair any that are found.
+        """
+        self.__statusBar.showMessage(f"Checking {basename(path)}...")
+        worker = Worker(fsck_story, path)
+        worker.signals.finished.connect(
+            lambda report: self.onStoryChecked(path, report, openAfterRepair)
+        )
+        worker.signals.failed.connect(
+            lambda message: self.onStoryCheckFailed(path, message)
+        )
+        worker.start()
+
+    def onStoryChecked(self, path: str, report: FsckReport, openAfterRepair: bool):
+        self.__statusBar.clearMessage()
+        if len(report.problems) == 0:
+            QMessageBox.information(
+                self, "Check Story Files", f"No problems were found in {basename(path)}."
+            )
+            return
+
+        count = len(report.problems)
+        box = QMessageBox(
+            QMessageBox.Icon.Warning,
+            "Check Story Files",
+            f"{count} problem{'s were' if count != 1 else ' was'} found in {basename(path)}.",
+            parent=self,
+        )
+        box.setInformativeText(
+            "Repairing adopts unlisted blocks, fills in missing files and moves "
+            f"unreadable ones into {LOST_AND_FOUND}."
+        )
+        box.setDetailedText("\n".join(problem_to_string(p) for p in report.problems))
+        repairButton = box.addButton("Repair", QMessageBox.ButtonRole.AcceptRole)
+        box.addButton(QMessageBox.StandardButton.Cancel)
+        box.exec()
+        if box.clickedButton() is not repairButton:
+            return
+
+        try:
+            actions = repair_story(path, report)
+        except OSError as e:
+            self.onStoryCheckFailed(path, str(e))
+            return
+        self.__statusBar.showMessage(
+            f"Repaired {basename(path)}: {len(actions)} change{'s' if len(actions) != 1 else ''}",
+            5000,
+        )
+        # A story that's already open picks the repairs up from disk
+        if openAfterRepair:
+            self.openStoryInBackground(path)
+
+    def onStoryCheckFailed(self, path: str, message: str):
+        self.__statusBar.clearMessage()
+        QMessageBox.critical(
+            self,
+            "Could not check story",
+            f"{basename(path)} could not be checked: {message}",
+            QMessageBox.StandardButton.Ok,
+            QMessageBox.StandardButton.Ok,
+        )
 
     def setStory(self, story: Story):
         if self.currentStory is not None:
@@ -191,11 +604,91 @@ class MainWindow(QMainWindow):
             self.currentStory.stateChanged.connect(self.updateWindowTitle)
 
         self.graphScene.setStory(self.currentStory)
-        self.errorPaneContents.setStory(self.currentStory)
         self.editor.setStory(self.currentStory)
+        if self.errorPaneContents is not None:
+            self.errorPaneContents.setStory(self.currentStory)
+            self.searchPaneContents.setStory(self.currentStory)
+            self.findReplaceContents.setStory(self.currentStory)
+            self.previewContents.setStory(self.currentStory)
         self.__statusBar.setStory(self.currentStory)
+        self.storyWatcher.setStory(self.currentStory, self.currentStoryPath)
+        self.journal.setStory(self.currentStory, self.currentStoryPath)
+
+    def buildPanes(self):
+        """Fills in the docks that aren't needed for the first frame."""
+        if self.errorPaneContents is not None:
+            return
+
+        # Set up error pane
+        self.errorPaneContents = ErrorListWidget(self)
+        self.errorPaneContents.blockActivated.connect(self.goToBlock)
+        self.errorPaneContents.spanActivated.connect(self.goToBlockSpan)
+        self.errorPaneDockWidget.setWidget(self.errorPaneContents)
+
+        # Set up search pane
+        self.searchPaneContents = SearchWidget(self)
+        self.searchPaneContents.matchesChanged.connect(
+            self.graphScene.setHighlightedBlocks
+        )
+        self.searchPaneContents.blockActivated.connect(self.goToBlock)
+        self.searchPaneDockWidget.setWidget(self.searchPaneContents)
+
+        # Set up find and replace pane
+        self.findReplaceContents = FindReplaceWidget(undoStack=self.undoStack, parent=self)
+        self.findReplaceContents.blockActivated.connect(self.goToBlock)
+        self.findReplaceDockWidget.setWidget(self.findReplaceContents)
+
+        # Set up preview pane
+        self.previewContents = PreviewWidget(self)
+        self.previewContents.blockActivated.connect(self.goToBlock)
+        self.previewDockWidget.setWidget(self.previewContents)
+
+        if self.currentStory is not None:
+            self.errorPaneContents.setStory(self.currentStory)
+            self.errorPaneContents.onErrorsReevaluated()
+            self.searchPaneContents.setStory(self.currentStory)
+            self.findReplaceContents.setStory(self.currentStory)
+            self.previewContents.setStory(self.currentStory)
+        self.onSelectionChanged()
+
+    def onStoryChangedOnDisk(self, changes: DiskChanges):
+        reloadConflicts = True
+        if len(changes.conflicts) > 0:
+            titles = ", ".join(f'"{block.title()}"' for block in changes.conflicts[:5])
+            if len(changes.conflicts) > 5:
+                titles += f" and {len(changes.conflicts) - 5} more"
+            box = QMessageBox(
+                QMessageBox.Icon.Warning,
+                "Story changed on disk",
+                f"Some blocks with unsaved changes were also changed outside of Packard: {titles}.",
+                parent=self,
+            )
+            box.setInformativeText(
+                "Reloading them will lose your changes to them. Other changed blocks are reloaded either way."
+            )
+            reloadButton = box.addButton("Reload from Disk", QMessageBox.ButtonRole.DestructiveRole)
+            box.addButton("Keep My Changes", QMessageBox.ButtonRole.RejectRole)
+            box.exec()
+            reloadConflicts = box.clickedButton() is reloadButton
+
+        self.storyWatcher.applyChanges(changes, reloadConflicts)
+
+    def onStoryReloaded(self, blocks: list[StoryBlock]):
+        # Undoing past a reload would apply old edits to the new text, but
+        # edits to blocks that weren't reloaded can still be undone
+        self.undoStack.dropCommandsTouching(blocks)
+        self.updateWindowTitle()
 
     def onCompileStory(self):
+        return self.compileStory(compile_story_data_to_html)
+
+    def onCompileBundle(self):
+        # Only needed for compiling, so it isn't loaded when the editor starts
+        from bundle import compile_story_data_to_bundle
+
+        return self.compileStory(compile_story_data_to_bundle)
+
+    def compileStory(self, compileFunction: Callable[..., bool]):
         totalErrors = errors_as_list(self.currentStory.errors())
         if len(totalErrors) > 0:
             errorString = f"{'were' if len(totalErrors) != 1 else 'was'} {len(totalErrors)} error{'s' if len(totalErrors) != 1 else ''}"
@@ -214,8 +707,47 @@ class MainWindow(QMainWindow):
         if compileLocation == "":
             return
 
-        self.onSave()
-        compile_story_to_html(compileLocation, self.currentStoryPath)
+        # Compiled from the story as it is now, rather than as last saved
+        self.__compileWorker = Worker(
+            compileFunction,
+            compileLocation,
+            self.currentStory.data(),
+            reportsProgress=True,
+            cancellable=True,
+        )
+        self.__compileWorker.signals.progress.connect(self.onCompileProgress)
+        self.__compileWorker.signals.finished.connect(self.onCompileFinished)
+        self.__compileWorker.signals.failed.connect(self.onCompileFailed)
+        self.compileStoryAction.setEnabled(False)
+        self.compileBundleAction.setEnabled(False)
+        self.__statusBar.showProgress("Compiling...", 0, 0, cancellable=True)
+        self.__compileWorker.start()
+
+    def onCompileProgress(self, done: int, total: int):
+        self.__statusBar.showProgress("Compiling...", done, total, cancellable=True)
+
+    def onCancelTask(self):
+        if self.__compileWorker is not None:
+            self.__compileWorker.cancel()
+
+    def onCompileFinished(self, completed: bool):
+        self.__compileWorker = None
+        self.compileStoryAction.setEnabled(True)
+        self.compileBundleAction.setEnabled(True)
+        self.__statusBar.hideProgress()
+        self.__statusBar.showMessage(
+            "Compiled story" if completed else "Compiling cancelled", 5000
+        )
+
+    def onCompileFailed(self, message: str):
+        self.onCompileFinished(False)
+        QMessageBox.critical(
+            self,
+            "Could not compile story",
+            f"The story could not be compiled: {message}",
+            QMessageBox.StandardButton.Ok,
+            QMessageBox.StandardButton.Ok,
+        )
 
     def updateWindowTitle(self):
         title = "Packard - "
@@ -230,16 +762,125 @@ class MainWindow(QMainWindow):
 
     def onSelectionChanged(self):
         selectedItems = self.graphScene.selectedBlocks()
+        if self.findReplaceContents is not None:
+            self.findReplaceContents.setSelectedBlocks(selectedItems)
         if len(selectedItems) == 1:
             self.editor.setBlock(selectedItems[0])
         else:
             self.editor.setBlock(None)
 
+    def onExportTrace(self):
+        tracePath, _ = QFileDialog.getSaveFileName(
+            self, "Export Trace...", "packard-trace.json", "Chrome traces (*.json)"
+        )
+        if tracePath == "":
+            return
+        profiling.export_chrome_trace(tracePath)
+
+    def onFind(self):
+        self.buildPanes()
+        self.searchPaneDockWidget.show()
+        self.searchPaneDockWidget.raise_()
+        self.searchPaneContents.focusQuery()
+
+    def onAutoLayout(self):
+        if len(self.currentStory) == 0:
+            return
+        # Imports numpy, which is slow enough to noticeably delay startup
+        from auto_layout import layered_layout
+
+        positions = layered_layout(self.currentStory)
+        self.undoStack.push(
+            SetStoryBlockPositionsCommand(
+                self.currentStory,
+                {block: QPointF(x, y) for block, (x, y) in positions.items()},
+                "Auto Layout",
+            )
+        )
+        self.graphView.centerOn(self.graphScene.blockRect(
+            self.currentStory.startBlock() or next(iter(self.currentStory))
+        ).center())
+
+    def onFindReplace(self):
+        self.buildPanes()
+        self.findReplaceDockWidget.show()
+        self.findReplaceDockWidget.raise_()
+        self.findReplaceContents.focusFind()
+
+    def onPlayFromHere(self):
+        selected = self.graphScene.selectedBlocks()
+        block = selected[0] if len(selected) == 1 else self.currentStory.startBlock()
+        if block is None:
+            return
+        self.buildPanes()
+        self.previewDockWidget.show()
+        self.previewDockWidget.raise_()
+        self.previewContents.play(block)
+
+    def onGroupBlocks(self):
+        blocks = self.graphScene.selectedBlocks()
+        if len(blocks) == 0:
+            return
+        title, ok = QInputDialog.getText(self, "Group Blocks", "Group title:")
+        if not ok or title.strip() == "":
+            return
+
+        # A block can only be in one group, so it leaves any it was in,
+        # and groups left empty by that go
+        grouped = set(blocks)
+        groups: dict[StoryGroup, list[StoryBlock]] = {}
+        for group in self.currentStory.groups():
+            remaining = [block for block in group.blocks() if block not in grouped]
+            if len(remaining) > 0:
+                groups[group] = remaining
+        newGroup = StoryGroup(self.currentStory.allocateGroupId(id_ify(title)), title.strip())
+        groups[newGroup] = blocks
+        self.undoStack.push(SetStoryGroupsCommand(self.currentStory, groups, "Group Blocks"))
+
+    def selectedGroups(self) -> list[StoryGroup]:
+        groups = (self.currentStory.groupOf(block) for block in self.graphScene.selectedBlocks())
+        return list(dict.fromkeys(group for group in groups if group is not None))
+
+    def onUngroup(self):
+        ungrouped = set(self.selectedGroups())
+        if len(ungrouped) == 0:
+            return
+        groups = {
+            group: group.blocks()
+            for group in self.currentStory.groups()
+            if group not in ungrouped
+        }
+        self.undoStack.push(SetStoryGroupsCommand(self.currentStory, groups, "Ungroup"))
+
+    def setGroupsCollapsed(self, collapsed: bool):
+        """Collapses or expands the selected blocks' groups, or every group if none are selected."""
+        groups = self.selectedGroups()
+        if len(self.graphScene.selectedBlocks()) == 0:
+            groups = self.currentStory.groups()
+        with self.currentStory.batchUpdate():
+            for group in groups:
+                group.setCollapsed(collapsed)
+
+    def goToBlock(self, block: StoryBlock):
+        # A block in a collapsed group isn't shown until it's expanded
+        group = self.currentStory.groupOf(block)
+        if group is not None:
+            group.setCollapsed(False)
+        self.graphScene.selectBlock(block)
+        self.graphView.centerOn(self.graphScene.blockRect(block).center())
+
+    def goToBlockSpan(self, block: StoryBlock, start: int, end: int):
+        self.goToBlock(block)
+        self.editor.selectBodySpan(start, end)
+
     def blockAdded(self, title: str, sourceBlock: StoryBlock, pos: QPointF):
         if sourceBlock is None:
             self.undoStack.push(
                 AddStoryBlockCommand(
-                    self.currentStory, title=title, id=id_ify(title), pos=pos
+                    self.currentStory,
+                    title=title,
+                    id=self.currentStory.allocateId(id_ify(title)),
+                    pos=pos,
                 )
             )
         else:
@@ -247,14 +888,14 @@ class MainWindow(QMainWindow):
                 AddStoryBlockWithLinkToExistingBlockCommand(
                     self.currentStory,
                     title=title,
-                    id=id_ify(title),
+                    id=self.currentStory.allocateId(id_ify(title)),
                     sourceBlock=sourceBlock,
                     pos=pos
                 )
             )
 
     def blockRemoved(self, block: StoryBlock):
-        self.undoStack.push(DeleteStoryBlockCommand(self.currentStory, block))
+        self.undoStack.push(DeleteStoryBlockCommand(self.currentStory, [block]))
 
     def onZoomSet(self, zoomAmount: float):
         tr = QTransform()
@@ -262,6 +903,7 @@ class MainWindow(QMainWindow):
         self.graphView.setTransform(tr)
 
     def closeEvent(self, event: QCloseEvent) -> None:
+        discarding = False
         if self.currentStory.modified():
             box = QMessageBox.question(
                 self,
@@ -278,6 +920,7 @@ class MainWindow(QMainWindow):
                 else:
                     event.ignore()
             elif box == QMessageBox.StandardButton.Discard:
+                discarding = True
                 event.accept()
             else:
                 event.ignore()
@@ -285,8 +928,60 @@ class MainWindow(QMainWindow):
         else:
             event.accept()
 
+        if event.isAccepted():
+            if self.__compileWorker is not None:
+                self.__compileWorker.cancel()
+            # Let any save finish writing before the app exits
+            wait_for_workers()
+            # Delivers that save's result, which clears its part of the journal
+            QApplication.processEvents()
+            if discarding or not self.currentStory.modified():
+                self.journal.discard()
+            else:
+                self.journal.close()
+
+
+STARTUP_TRACE_ENV_VAR = "PACKARD_STARTUP_TRACE"
+
+# Command-line tools, run as "packard <command> ..." instead of the editor
+COMMANDS = {
+    "import": ("twine_import", "main"),
+    "merge": ("story_merge", "main"),
+    "merge-file": ("story_merge", "main_file"),
+    "fsck": ("story_fsck", "main"),
+}
+
+
+def main() -> int:
+    if len(argv) > 1 and argv[1] in COMMANDS:
+        moduleName, functionName = COMMANDS[argv[1]]
+        return getattr(__import__(moduleName), functionName)(argv[2:])
+
+    app = QApplication(argv)
+    mainWindow = MainWindow()
+
+    storyPath = argv[1] if len(argv) > 1 else None
+
+    # Used by benchmarks/startup.py to time how long the window takes to
+    # appear, and then to finish opening the story if one was given
+    if environ.get(STARTUP_TRACE_ENV_VAR):
+        def onFirstFrame():
+            print("first-frame", flush=True)
+            if storyPath is None:
+                app.quit()
+
+        def onStoryOpened():
+            print("story-opened", flush=True)
+            app.quit()
+
+        mainWindow.graphView.firstFramePainted.connect(onFirstFrame)
+        mainWindow.storyOpened.connect(onStoryOpened)
+
+    mainWindow.show()
+    if storyPath is not None:
+        mainWindow.openStoryInBackground(storyPath)
+    return app.exec()
+
 
-app = QApplication(argv)
-mainWindow = MainWindow()
-mainWindow.show()
-app.exec()
+if __name__ == "__main__":
+    exit(main())
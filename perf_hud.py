@@ -0,0 +1,57 @@
+from PyQt6.QtWidgets import QLabel, QWidget
+from PyQt6.QtGui import QFont
+from PyQt6.QtCore import QTimer
+
+import profiling
+
+# Refreshing on a timer rather than every frame keeps the HUD from
+# causing repaints of the view underneath it
+HUD_REFRESH_INTERVAL = 250
+
+FRAME_SPAN = "GraphView.frame"
+VALIDATION_SPAN = "validation"
+
+
+class PerfHud(QLabel):
+    """An overlay showing how long recent frames and validation took."""
+
+    def __init__(self, parent: QWidget | None = None):
+        super().__init__(parent)
+        font = QFont("Courier")
+        font.setStyleHint(QFont.StyleHint.TypeWriter)
+        self.setFont(font)
+        self.setAutoFillBackground(True)
+        self.setMargin(4)
+        self.move(8, 8)
+
+        self.__timer = QTimer(self)
+        self.__timer.setInterval(HUD_REFRESH_INTERVAL)
+        self.__timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def setVisible(self, visible: bool):
+        super().setVisible(visible)
+        if visible:
+            self.__timer.start()
+            self.refresh()
+        else:
+            self.__timer.stop()
+
+    def refresh(self):
+        if not profiling.enabled():
+            self.setText("Profiling is off")
+            self.adjustSize()
+            return
+
+        stats = profiling.stats()
+        lines = []
+        for label, name in (("frame", FRAME_SPAN), ("validate", VALIDATION_SPAN)):
+            s = stats.get(name)
+            if s is None:
+                lines.append(f"{label:>8}: -")
+            else:
+                lines.append(
+                    f"{label:>8}: {s.last_ms:7.2f} ms (max {s.max_ms:.2f}, n={s.count})"
+                )
+        self.setText("\n".join(lines))
+        self.adjustSize()
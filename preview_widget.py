@@ -0,0 +1,141 @@
+from html import escape
+
+from PyQt6.QtCore import QUrl, pyqtSignal
+from PyQt6.QtWidgets import QHBoxLayout, QPushButton, QTextBrowser, QVBoxLayout, QWidget
+
+from profiling import profiled
+from saver import render_body_html
+from story_components import Story, StoryBlock
+
+# Links in the preview point at a fragment, which the browser hands back
+# to us instead of trying to load it
+PREVIEW_HREF_FORMAT = "#{}"
+
+
+class PreviewWidget(QWidget):
+    """
+    Plays a story straight from the open Story, one passage at a time.
+    Only the passage being shown is rendered, and each render is kept
+    until the block's title or body changes, so going back and forth is
+    free.
+    """
+
+    blockActivated = pyqtSignal(object)
+
+    def __init__(self, parent: QWidget | None = None):
+        super().__init__(parent)
+        self.__story: Story | None = None
+        self.__current: StoryBlock | None = None
+        self.__history: list[StoryBlock] = []
+        self.__startBlock: StoryBlock | None = None
+        self.__rendered: dict[StoryBlock, str] = {}
+
+        self.__browser = QTextBrowser(self)
+        self.__browser.setOpenLinks(False)
+        self.__browser.anchorClicked.connect(self.onAnchorClicked)
+
+        self.__backButton = QPushButton("Back", self, clicked=self.back)
+        self.__restartButton = QPushButton("Restart", self, clicked=self.restart)
+        self.__editButton = QPushButton(
+            "Edit Passage",
+            self,
+            clicked=lambda: self.blockActivated.emit(self.__current),
+        )
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.__backButton)
+        buttons.addWidget(self.__restartButton)
+        buttons.addStretch()
+        buttons.addWidget(self.__editButton)
+
+        self.__ly = QVBoxLayout(self)
+        self.__ly.addLayout(buttons)
+        self.__ly.addWidget(self.__browser)
+        self.__updateButtons()
+
+    def setStory(self, story: Story | None):
+        if self.__story is not None:
+            self.__story.blockTitleChanged.disconnect(self.onBlockTitleChanged)
+            self.__story.blockBodyChanged.disconnect(self.onBlockBodyChanged)
+            self.__story.blocksRemoved.disconnect(self.onBlocksRemoved)
+        self.__story = story
+        self.__rendered.clear()
+        self.__history.clear()
+        self.__startBlock = None
+        self.__show(None)
+
+        if self.__story is None:
+            return
+
+        self.__story.blockTitleChanged.connect(self.onBlockTitleChanged)
+        self.__story.blockBodyChanged.connect(self.onBlockBodyChanged)
+        self.__story.blocksRemoved.connect(self.onBlocksRemoved)
+
+    def currentBlock(self) -> StoryBlock | None:
+        return self.__current
+
+    def play(self, block: StoryBlock):
+        """Starts playing from `block`, forgetting the previous playthrough."""
+        self.__history.clear()
+        self.__startBlock = block
+        self.__show(block)
+
+    def restart(self):
+        if self.__startBlock is not None:
+            self.play(self.__startBlock)
+
+    def back(self):
+        if len(self.__history) > 0:
+            self.__show(self.__history.pop())
+
+    def onAnchorClicked(self, url: QUrl):
+        target = url.fragment()
+        block = self.__story.blockById(target) if self.__story is not None else None
+        if self.__current is not None:
+            self.__history.append(self.__current)
+        self.__show(block)
+        if block is None:
+            self.__browser.setHtml(
+                f"<p><i>There's no passage with the ID \"{escape(target)}\".</i></p>"
+            )
+
+    def onBlockTitleChanged(self, block: StoryBlock):
+        # The title is part of the render too
+        self.__rendered.pop(block, None)
+        if block is self.__current:
+            self.__show(block)
+
+    def onBlockBodyChanged(self, block: StoryBlock):
+        self.__rendered.pop(block, None)
+        if block is self.__current:
+            self.__show(block)
+
+    def onBlocksRemoved(self, blocks: list[StoryBlock]):
+        removed = set(blocks)
+        for block in removed:
+            self.__rendered.pop(block, None)
+        self.__history = [block for block in self.__history if block not in removed]
+        if self.__startBlock in removed:
+            self.__startBlock = None
+        if self.__current in removed:
+            self.__show(None)
+
+    @profiled("PreviewWidget.render")
+    def __render(self, block: StoryBlock) -> str:
+        html = self.__rendered.get(block)
+        if html is None:
+            html = f"<h2>{escape(block.title())}</h2>" + render_body_html(
+                block.body(), PREVIEW_HREF_FORMAT
+            )
+            self.__rendered[block] = html
+        return html
+
+    def __show(self, block: StoryBlock | None):
+        self.__current = block
+        self.__browser.setHtml(self.__render(block) if block is not None else "")
+        self.__updateButtons()
+
+    def __updateButtons(self):
+        self.__backButton.setEnabled(len(self.__history) > 0)
+        self.__restartButton.setEnabled(self.__startBlock is not None)
+        self.__editButton.setEnabled(self.__current is not None)
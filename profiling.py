@@ -0,0 +1,139 @@
+"""
+Lightweight timing of the editor's hot paths.
+
+Code is instrumented with the @profiled decorator or a `with span(...)`
+block. Nothing is recorded unless profiling is turned on, either from
+the Debug menu or by starting Packard with PACKARD_PROFILE set. If that's
+set to a file path rather than "1", a Chrome trace (viewable in
+chrome://tracing or Perfetto) is written there on exit.
+"""
+
+from atexit import register
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+from json import dump
+from os import environ, getpid
+from threading import get_ident
+from time import perf_counter_ns
+from typing import Callable, NamedTuple
+
+ENV_VAR = "PACKARD_PROFILE"
+
+# Only the most recent spans are kept for trace export
+MAX_EVENTS = 200_000
+
+_enabled = False
+_events: deque[tuple[str, int, int, int]] = deque(maxlen=MAX_EVENTS)
+_totals: dict[str, list[int]] = {}
+_NULL_SPAN = nullcontext()
+
+
+class SpanStats(NamedTuple):
+    count: int
+    total_ms: float
+    max_ms: float
+    last_ms: float
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(on: bool):
+    global _enabled
+    _enabled = on
+
+
+def reset():
+    _events.clear()
+    _totals.clear()
+
+
+def record(name: str, start_ns: int, end_ns: int):
+    duration = end_ns - start_ns
+    _events.append((name, start_ns, duration, get_ident()))
+    totals = _totals.get(name)
+    if totals is None:
+        _totals[name] = [1, duration, duration, duration]
+    else:
+        totals[0] += 1
+        totals[1] += duration
+        totals[2] = max(totals[2], duration)
+        totals[3] = duration
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc):
+        record(self.name, self.start, perf_counter_ns())
+        return False
+
+
+def span(name: str):
+    """A context manager that times its block while profiling is on."""
+    return _Span(name) if _enabled else _NULL_SPAN
+
+
+def profiled(name: str | None = None) -> Callable:
+    """Times every call of the decorated function while profiling is on."""
+
+    def decorator(fn: Callable) -> Callable:
+        spanName = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(spanName, start, perf_counter_ns())
+
+        return wrapper
+
+    return decorator
+
+
+def stats() -> dict[str, SpanStats]:
+    return {
+        name: SpanStats(count, total / 1e6, longest / 1e6, last / 1e6)
+        for name, (count, total, longest, last) in _totals.items()
+    }
+
+
+def export_chrome_trace(path: str):
+    """Writes the recorded spans in Chrome's trace event format."""
+    pid = getpid()
+    with open(path, "w") as f:
+        dump(
+            {
+                "traceEvents": [
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "ts": start / 1000,
+                        "dur": duration / 1000,
+                        "pid": pid,
+                        "tid": tid,
+                    }
+                    for name, start, duration, tid in list(_events)
+                ],
+                "displayTimeUnit": "ms",
+            },
+            f,
+        )
+
+
+if environ.get(ENV_VAR, "") not in ("", "0"):
+    set_enabled(True)
+    if environ[ENV_VAR] != "1":
+        register(export_chrome_trace, environ[ENV_VAR])
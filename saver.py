@@ -1,8 +1,11 @@
-from json import dump, load
+from json import dump, dumps, load
 from os.path import join, exists
 from os import mkdir
-from yattag import Doc
-from story_link import LINK_RE
+from typing import Callable, Sized
+from story_link import LinkToken, find_links, tokenize_links
+
+# How many blocks to save or compile between progress reports
+PROGRESS_INTERVAL = 100
 
 
 def check_story_for_errors(story_data: dict):
@@ -16,13 +19,21 @@ def check_story_for_errors(story_data: dict):
         unique_blocks.add(block["id"])
 
     for block in story_data["blocks"]:
-        for _, target_block_id in LINK_RE.findall(block["body"]):
+        # Blocks may come with their links already parsed
+        links = block.get("links")
+        if links is None:
+            links = find_links(block["body"])
+        for link in links:
+            target_block_id = link.target
             if target_block_id not in unique_blocks:
                 story_errors[block["id"]].append(
                     {
                         "id": block["id"],
                         "type": "unknown_id_referenced",
                         "referenced_id": target_block_id,
+                        # Where the link's target is in the body
+                        "start": link.target_start,
+                        "end": link.target_end,
                     }
                 )
     return story_errors
@@ -43,29 +54,166 @@ def errors_as_list(errors: dict[str, list[dict]]) -> list[dict]:
     return errors_out
 
 
-def compile_story_to_html(base_path: str, story_source_path: str):
-    loaded_story = load_story(story_source_path)
+def render_body_html(body: str, href_format: str = "{}.html") -> str:
+    pieces: list[str] = []
+    for token in tokenize_links(body):
+        if isinstance(token, LinkToken):
+            href = href_format.format(token.target)
+            pieces.append(f'<a href="{href}">{token.label}</a>')
+        else:
+            pieces.append(body[token.start : token.end])
+    return "".join(pieces).replace("\n", "<br/>")
+
+
+# How many of a page's links get a prefetch hint, by default
+DEFAULT_PREFETCH_LIMIT = 4
+
+# Swaps in a linked page that was inlined into this one instead of
+# fetching it. Going back reloads, since the page being left was replaced.
+INLINE_NAVIGATION_SCRIPT = """document.addEventListener("click", function (e) {
+  var a = e.target.closest("a"), href = a && a.getAttribute("href");
+  if (!href || !Object.prototype.hasOwnProperty.call(PAGES, href)) return;
+  e.preventDefault();
+  history.pushState(null, "", a.href);
+  document.open();
+  document.write(PAGES[href] + "<script>onpopstate = function () { location.reload(); };<\\/script>");
+  document.close();
+});
+onpopstate = function () { location.reload(); };"""
+
+
+def link_targets(block: dict, limit: int | None = None) -> list[str]:
+    """The first `limit` distinct blocks a block links to, other than itself."""
+    links = block.get("links")
+    if links is None:
+        links = find_links(block["body"])
+    targets: dict[str, None] = {}
+    for link in links:
+        if limit is not None and len(targets) >= limit:
+            break
+        if link.target != block["id"]:
+            targets[link.target] = None
+    return list(targets)
+
+
+def render_page_html(
+    body_html: str, prefetch: list[str], inlined: dict[str, str] | None = None
+) -> str:
+    """
+    Makes a compiled page around a rendered body, with prefetch hints for
+    the pages in `prefetch` and the pages in `inlined` (by ID) embedded.
+    """
+    from yattag import Doc
+
+    doc, tag, text = Doc().tagtext()
+    doc.asis("<!DOCTYPE html>")
+    with tag("html"):
+        if len(prefetch) > 0 or inlined:
+            with tag("head"):
+                for target in prefetch:
+                    doc.stag("link", rel="prefetch", href=f"{target}.html")
+                if inlined:
+                    pages = {f"{target}.html": page for target, page in inlined.items()}
+                    with tag("script"):
+                        # Nothing in the JSON may close the script early
+                        doc.asis("var PAGES = " + dumps(pages).replace("</", "<\\/") + ";\n")
+                        doc.asis(INLINE_NAVIGATION_SCRIPT)
+        with tag("body"):
+            doc.asis(body_html)
+    return doc.getvalue()
+
+
+def compile_story_to_html(
+    base_path: str,
+    story_source_path: str,
+    prefetch_limit: int = DEFAULT_PREFETCH_LIMIT,
+    inline_limit: int = 0,
+    minify: bool = True,
+    compress: bool = True,
+):
+    compile_story_data_to_html(
+        base_path,
+        load_story(story_source_path),
+        prefetch_limit=prefetch_limit,
+        inline_limit=inline_limit,
+        minify=minify,
+        compress=compress,
+    )
+
+
+def compile_story_data_to_html(
+    base_path: str,
+    loaded_story: dict,
+    progress: Callable[[int, int], None] | None = None,
+    cancelled: Callable[[], bool] | None = None,
+    prefetch_limit: int = DEFAULT_PREFETCH_LIMIT,
+    inline_limit: int = 0,
+    minify: bool = True,
+    compress: bool = True,
+) -> bool:
+    """
+    Writes the story's pages and index into `base_path`. `progress` is
+    called now and then with the number of pages written so far and the
+    total, and if `cancelled` returns True the compile stops early.
+    Returns whether every page was written.
+
+    Each page hints to the browser to prefetch the pages for its first
+    `prefetch_limit` links. Separately, every linked page whose body
+    renders to at most `inline_limit` characters is embedded in the page,
+    and shown without a request at all when its link is followed. Pages
+    that are embedded aren't prefetched as well.
+
+    With `minify` set whitespace is collapsed, and with `compress` set
+    each file gets .gz (and .br, with brotli installed) copies. Files
+    that come out the same as the last compile aren't written or
+    compressed again.
+    """
+    # Only needed here, so they aren't loaded when the editor starts
+    from compile_output import OutputWriter
+    from yattag import Doc
 
     pages_dir = join(base_path, "pages")
     if not exists(pages_dir):
         mkdir(pages_dir)
 
-    for block in loaded_story.get("blocks", []):
-        block_page_path = join(pages_dir, f"{block['id']}.html")
-        block_page_content = LINK_RE.sub(r'<a href="\2.html">\1</a>', block["body"])
-        block_page_content = block_page_content.replace("\n", "<br/>")
+    blocks = loaded_story.get("blocks", [])
+    prefetch_targets = {block["id"]: link_targets(block, prefetch_limit) for block in blocks}
 
-        doc, tag, text = Doc().tagtext()
-        doc.asis("<!DOCTYPE html>")
-        with tag("html"):
-            with tag("body"):
-                doc.asis(block_page_content)
+    bodies: dict[str, str] = {}
+    if inline_limit > 0:
+        bodies = {block["id"]: render_body_html(block["body"]) for block in blocks}
+    # Inlined pages are embedded as they'd be served, without their own
+    # inlined pages, so pages don't grow by nesting
+    plain_pages: dict[str, str] = {}
+
+    def plain_page(id: str) -> str:
+        page = plain_pages.get(id)
+        if page is None:
+            page = plain_pages[id] = render_page_html(bodies[id], prefetch_targets[id])
+        return page
 
-        with open(block_page_path, "w") as f:
-            f.write(doc.getvalue())
+    with OutputWriter(minify=minify, compress=compress) as output:
+        for i, block in enumerate(blocks):
+            if i % PROGRESS_INTERVAL == 0:
+                if cancelled is not None and cancelled():
+                    return False
+                if progress is not None:
+                    progress(i, len(blocks))
 
-    # Now create index file
-    with open(join(base_path, "index.html"), "w") as f:
+            block_page_path = join(pages_dir, f"{block['id']}.html")
+            inlined: dict[str, str] = {}
+            if inline_limit > 0:
+                for target in link_targets(block):
+                    if target in bodies and len(bodies[target]) <= inline_limit:
+                        inlined[target] = plain_page(target)
+            prefetch = [t for t in prefetch_targets[block["id"]] if t not in inlined]
+            body_html = bodies.get(block["id"])
+            if body_html is None:
+                body_html = render_body_html(block["body"])
+
+            output.write(block_page_path, render_page_html(body_html, prefetch, inlined))
+
+        # Now create index file
         doc, tag, text = Doc().tagtext()
         doc.asis("<!DOCTYPE html>")
         with tag("html"):
@@ -78,10 +226,18 @@ def compile_story_to_html(base_path: str, story_source_path: str):
                     },
                 )
 
-        f.write(doc.getvalue())
+        output.write(join(base_path, "index.html"), doc.getvalue())
 
+    if progress is not None:
+        progress(len(blocks), len(blocks))
+    return True
 
-def save_story(base_path: str, story_data: dict):
+
+def save_story(
+    base_path: str,
+    story_data: dict,
+    progress: Callable[[int, int], None] | None = None,
+):
     meta_path = join(base_path, "meta")
     content_path = join(base_path, "content")
 
@@ -90,8 +246,15 @@ def save_story(base_path: str, story_data: dict):
     if not exists(content_path):
         mkdir(content_path)
 
+    # The blocks may come from a generator, whose length isn't known
+    blocks = story_data["blocks"]
+    total = len(blocks) if isinstance(blocks, Sized) else 0
+
     list_of_block_ids = []
-    for block in story_data["blocks"]:
+    for block in blocks:
+        if progress is not None and len(list_of_block_ids) % PROGRESS_INTERVAL == 0:
+            progress(len(list_of_block_ids), total)
+
         content = {
             "x": block["x"],
             "y": block["y"],
@@ -105,8 +268,31 @@ def save_story(base_path: str, story_data: dict):
 
         list_of_block_ids.append(block["id"])
 
+    main = {"blocks": list_of_block_ids, "start": story_data["start"]}
+    # Left out when empty, so stories without groups save as they always have
+    if story_data.get("groups"):
+        main["groups"] = story_data["groups"]
     with open(join(base_path, f"main.json"), "w") as f:
-        dump({"blocks": list_of_block_ids, "start": story_data["start"]}, f, indent=4)
+        dump(main, f, indent=4)
+
+
+def load_block(base_path: str, block_id: str) -> dict:
+    # Find this block's metadata file
+    block_metadata: dict
+    with open(join(base_path, "meta", f"{block_id}.json")) as f:
+        block_metadata = load(f)
+
+    block_body: str
+    with open(join(base_path, "content", f"{block_id}.txt")) as f:
+        block_body = f.read()
+
+    return {
+        "x": block_metadata.get("x", None),
+        "y": block_metadata.get("y", None),
+        "title": block_metadata.get("title", block_id),
+        "id": block_id,
+        "body": block_body,
+    }
 
 
 def load_story(base_path: str):
@@ -117,25 +303,12 @@ def load_story(base_path: str):
 
     list_of_block_ids: list[str] = metadata.get("blocks", [])
 
-    blocks: list[dict] = []
-    for block_id in list_of_block_ids:
-        # Find this block's metadata file
-        block_metadata: dict
-        with open(join(base_path, "meta", f"{block_id}.json")) as f:
-            block_metadata = load(f)
-
-        block_body: str
-        with open(join(base_path, "content", f"{block_id}.txt")) as f:
-            block_body = f.read()
-
-        blocks.append(
-            {
-                "x": block_metadata.get("x", None),
-                "y": block_metadata.get("y", None),
-                "title": block_metadata.get("title", block_id),
-                "id": block_id,
-                "body": block_body,
-            }
-        )
-
-    return {"blocks": blocks, "start": metadata.get("start", None)}
+    blocks: list[dict] = [
+        load_block(base_path, block_id) for block_id in list_of_block_ids
+    ]
+
+    return {
+        "blocks": blocks,
+        "start": metadata.get("start", None),
+        "groups": metadata.get("groups", {}),
+    }
@@ -0,0 +1,146 @@
+from bisect import bisect_left, insort
+from re import compile
+from time import monotonic
+
+from PyQt6.QtCore import QTimer
+
+from story_components import Story, StoryBlock
+
+WORD_RE = compile(r"\w+")
+
+# Seconds of indexing done at a time while the event loop is idle
+INDEX_SLICE_DURATION = 0.005
+
+
+def search_terms(text: str) -> set[str]:
+    return set(WORD_RE.findall(text.lower()))
+
+
+class SearchIndex:
+    """
+    An inverted index from words to the blocks whose title or body
+    contain them. Once a story is set it's built a slice at a time
+    whenever the event loop is idle, and a search that comes before it's
+    done finishes it off. After that it follows the story's signals and
+    only re-indexes the blocks that change.
+    """
+
+    def __init__(self) -> None:
+        self.__story: Story | None = None
+        self.__postings: dict[str, set[StoryBlock]] = {}
+        self.__blockTerms: dict[StoryBlock, set[str]] = {}
+        self.__built: bool = False
+        # Blocks still to be indexed, last first
+        self.__unindexed: list[StoryBlock] = []
+
+        # Kept sorted once the index is built, so that prefix queries can
+        # bisect into it
+        self.__sortedTerms: list[str] = []
+
+        self.__sliceTimer = QTimer()
+        self.__sliceTimer.setInterval(0)
+        self.__sliceTimer.timeout.connect(self.indexSlice)
+
+    def setStory(self, story: Story | None):
+        if self.__story is not None:
+            self.__story.blockTitleChanged.disconnect(self.onBlockChanged)
+            self.__story.blockBodyChanged.disconnect(self.onBlockChanged)
+            self.__story.blocksAdded.disconnect(self.onBlocksAdded)
+            self.__story.blocksRemoved.disconnect(self.onBlocksRemoved)
+        self.__story = story
+        self.__postings.clear()
+        self.__blockTerms.clear()
+        self.__sortedTerms.clear()
+        self.__unindexed.clear()
+        self.__built = False
+        self.__sliceTimer.stop()
+
+        if self.__story is None:
+            return
+
+        self.__story.blockTitleChanged.connect(self.onBlockChanged)
+        self.__story.blockBodyChanged.connect(self.onBlockChanged)
+        self.__story.blocksAdded.connect(self.onBlocksAdded)
+        self.__story.blocksRemoved.connect(self.onBlocksRemoved)
+
+        self.__unindexed = self.__story.blocks()
+        self.__unindexed.reverse()
+        self.__sliceTimer.start()
+
+    def indexSlice(self):
+        self.__indexUnindexed(monotonic() + INDEX_SLICE_DURATION)
+
+    def __indexUnindexed(self, deadline: float | None = None):
+        unindexed = self.__unindexed
+        while len(unindexed) > 0:
+            block = unindexed.pop()
+            # Blocks removed since the story was set are skipped, and ones
+            # added since are already indexed
+            if block.parent() is self.__story and block not in self.__blockTerms:
+                self.__reindexBlock(block, self.__termsForBlock(block))
+            if deadline is not None and monotonic() > deadline:
+                return
+
+        self.__sliceTimer.stop()
+        self.__sortedTerms = sorted(self.__postings)
+        self.__built = True
+
+    # Changes to blocks that are still waiting to be indexed are picked
+    # up when they're reached
+    def onBlockChanged(self, block: StoryBlock):
+        if block not in self.__blockTerms:
+            return
+        self.__reindexBlock(block, self.__termsForBlock(block))
+
+    def onBlocksAdded(self, blocks: list[StoryBlock]):
+        for block in blocks:
+            self.__reindexBlock(block, self.__termsForBlock(block))
+
+    def onBlocksRemoved(self, blocks: list[StoryBlock]):
+        for block in blocks:
+            self.__reindexBlock(block, set())
+            self.__blockTerms.pop(block, None)
+
+    def search(self, query: str) -> set[StoryBlock]:
+        """
+        Finds the blocks that contain every word in the query. Each word
+        matches as a prefix, so results show up while it's being typed.
+        """
+        if not self.__built:
+            self.__indexUnindexed()
+        results: set[StoryBlock] | None = None
+        for term in sorted(search_terms(query), key=len, reverse=True):
+            matches: set[StoryBlock] = set()
+            i = bisect_left(self.__sortedTerms, term)
+            while i < len(self.__sortedTerms) and self.__sortedTerms[i].startswith(term):
+                matches |= self.__postings[self.__sortedTerms[i]]
+                i += 1
+
+            results = matches if results is None else results & matches
+            if len(results) == 0:
+                break
+        return results if results is not None else set()
+
+    def __termsForBlock(self, block: StoryBlock) -> set[str]:
+        return search_terms(block.title()) | search_terms(block.body())
+
+    def __reindexBlock(self, block: StoryBlock, newTerms: set[str]):
+        # Until the index is built, the sorted terms are left to be
+        # worked out all at once at the end
+        sortedTerms = self.__sortedTerms if self.__built else None
+        oldTerms = self.__blockTerms.get(block, set())
+        for term in oldTerms - newTerms:
+            blocks = self.__postings[term]
+            blocks.discard(block)
+            if len(blocks) == 0:
+                del self.__postings[term]
+                if sortedTerms is not None:
+                    del sortedTerms[bisect_left(sortedTerms, term)]
+        for term in newTerms - oldTerms:
+            blocks = self.__postings.get(term)
+            if blocks is None:
+                blocks = self.__postings[term] = set()
+                if sortedTerms is not None:
+                    insort(sortedTerms, term)
+            blocks.add(block)
+        self.__blockTerms[block] = newTerms
@@ -0,0 +1,86 @@
+from PyQt6.QtWidgets import QWidget, QLineEdit, QListWidget, QListWidgetItem, QVBoxLayout, QLabel
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from search_index import SearchIndex
+from story_components import Story, StoryBlock
+
+BLOCK_ROLE = Qt.ItemDataRole.UserRole + 0
+
+# Every match is highlighted in the graph, but only this many are listed
+MAX_LISTED_RESULTS = 500
+
+
+class SearchWidget(QWidget):
+    matchesChanged = pyqtSignal(set)
+    blockActivated = pyqtSignal(object)
+
+    def __init__(self, parent: QWidget | None = None):
+        super().__init__(parent)
+        self.__story: Story | None = None
+        self.__index = SearchIndex()
+
+        self.__queryField = QLineEdit(self)
+        self.__queryField.setPlaceholderText("Search passages")
+        self.__queryField.setClearButtonEnabled(True)
+        self.__queryField.textChanged.connect(self.scheduleRefresh)
+
+        self.__resultCountLabel = QLabel(self)
+
+        self.__resultList = QListWidget(self)
+        self.__resultList.itemActivated.connect(self.onItemActivated)
+        self.__resultList.itemClicked.connect(self.onItemActivated)
+
+        # Several edits can arrive at once (such as a batched replace),
+        # so the results are refreshed once control returns to the event loop
+        self.__refreshTimer = QTimer(self)
+        self.__refreshTimer.setSingleShot(True)
+        self.__refreshTimer.setInterval(0)
+        self.__refreshTimer.timeout.connect(self.refresh)
+
+        self.__ly = QVBoxLayout(self)
+        self.__ly.addWidget(self.__queryField)
+        self.__ly.addWidget(self.__resultCountLabel)
+        self.__ly.addWidget(self.__resultList)
+
+    def setStory(self, story: Story):
+        if self.__story is not None:
+            self.__story.stateChanged.disconnect(self.scheduleRefresh)
+        self.__story = story
+        # The index connects to the story first, so it's always up to
+        # date by the time the results are refreshed
+        self.__index.setStory(story)
+        if self.__story is not None:
+            self.__story.stateChanged.connect(self.scheduleRefresh)
+        self.refresh()
+
+    def focusQuery(self):
+        self.__queryField.setFocus()
+        self.__queryField.selectAll()
+
+    def scheduleRefresh(self):
+        if self.__queryField.text().strip() != "":
+            self.__refreshTimer.start()
+        elif self.__resultList.count() > 0 or self.__resultCountLabel.text() != "":
+            self.refresh()
+
+    def refresh(self):
+        self.__resultList.clear()
+        query = self.__queryField.text()
+        if query.strip() == "":
+            self.__resultCountLabel.setText("")
+            self.matchesChanged.emit(set())
+            return
+
+        matches = self.__index.search(query)
+        self.__resultCountLabel.setText(
+            f"{len(matches)} match{'es' if len(matches) != 1 else ''}"
+        )
+        listed = sorted(matches, key=lambda b: (b.title().lower(), b.id()))
+        for block in listed[:MAX_LISTED_RESULTS]:
+            item = QListWidgetItem(f"{block.title()} ({block.id()})", self.__resultList)
+            item.setData(BLOCK_ROLE, block)
+        self.matchesChanged.emit(matches)
+
+    def onItemActivated(self, item: QListWidgetItem):
+        block: StoryBlock = item.data(BLOCK_ROLE)
+        if block is not None:
+            self.blockActivated.emit(block)
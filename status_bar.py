@@ -1,4 +1,4 @@
-from PyQt6.QtWidgets import QStatusBar, QWidget, QSlider, QHBoxLayout, QPushButton, QSizePolicy
+from PyQt6.QtWidgets import QStatusBar, QWidget, QSlider, QHBoxLayout, QPushButton, QSizePolicy, QProgressBar, QLabel
 from PyQt6.QtGui import QAction
 from PyQt6.QtCore import Qt, pyqtSignal
 
@@ -6,6 +6,7 @@ from story_components import Story
 
 class StatusBar(QStatusBar):
     zoomSet = pyqtSignal(float)
+    cancelRequested = pyqtSignal()
     def __init__(self, parent: QWidget | None = None) -> None:
         super().__init__(parent)
         
@@ -16,9 +17,18 @@ class StatusBar(QStatusBar):
         self.__zoomer = ZoomSlider(self)
         self.__zoomer.zoomSet.connect(self.zoomSet)
 
+        self.__taskLabel = QLabel(self)
+        self.__progressBar = QProgressBar(self)
+        self.__progressBar.setMaximumWidth(150)
+        self.__cancelButton = StatusBarPushButton("Cancel", self, clicked=self.cancelRequested)
+
         self.addWidget(self.__numBlocksLabel)
         self.addWidget(self.__numErrorsLabel)
+        self.addPermanentWidget(self.__taskLabel)
+        self.addPermanentWidget(self.__progressBar)
+        self.addPermanentWidget(self.__cancelButton)
         self.addPermanentWidget(self.__zoomer)
+        self.hideProgress()
 
 
     def setStory(self, story: Story):
@@ -33,11 +43,28 @@ class StatusBar(QStatusBar):
         self.onStoryStateChanged()
         self.onStoryErrorsReevaluated()
 
+    def showProgress(self, text: str, done: int, total: int, cancellable: bool = False):
+        """
+        Shows how far along a background task is. A total of 0 shows a
+        busy indicator instead of a percentage.
+        """
+        self.__taskLabel.setText(text)
+        self.__progressBar.setRange(0, total)
+        self.__progressBar.setValue(done)
+        self.__taskLabel.show()
+        self.__progressBar.show()
+        self.__cancelButton.setVisible(cancellable)
+
+    def hideProgress(self):
+        self.__taskLabel.hide()
+        self.__progressBar.hide()
+        self.__cancelButton.hide()
+
     def setToggleErrorPaneAction(self, action: QAction):
         self.__numErrorsLabel.clicked.connect(action.trigger)
 
     def onStoryStateChanged(self):
-        self.__numBlocksLabel.setText(f"{len(self.__story.blocks())} blocks")
+        self.__numBlocksLabel.setText(f"{len(self.__story)} blocks")
 
     def onStoryErrorsReevaluated(self):
         self.__numErrorsLabel.setText(f"🚫{len(self.__story.errorsAsList())}")
@@ -1,38 +1,185 @@
-from enum import unique
+from collections.abc import Iterator
+from contextlib import contextmanager
 from PyQt6.QtGui import QUndoCommand
 from PyQt6.QtCore import QObject, QPointF, pyqtSignal
-from re import compile, escape
-from time import time
+from time import monotonic, time
+from id_ify import IdAllocator
+from profiling import span
 from saver import check_story_for_errors, errors_as_list
-from story_link import LINK_RE
+from story_link import LinkToken, Token, link_markup, replace_link_targets, tokenize_links
+from text_diff import apply_diff, diff_text, merge_diffs, text_checksum
 
 
-class SetStoryBlockNameCommand(QUndoCommand):
-    def __init__(self, storyBlock: "StoryBlock", newText: str):
+# Edits made within this many seconds of each other are undone together
+TYPING_MERGE_INTERVAL = 2.0
+
+
+class _TextEditCommand(QUndoCommand):
+    """
+    Base for commands that edit a block's text. Rather than keeping the
+    whole text before and after, these store the edit as a single splice,
+    and consecutive edits that touch each other merge into one command.
+    """
+
+    def __init__(self, storyBlock: "StoryBlock", oldText: str, newText: str):
         super().__init__()
-        self.__storyBlock = storyBlock
-        self.__oldText = self.__storyBlock.title()
-        self.__newText = newText
+        self._storyBlock = storyBlock
+        self.__diff = diff_text(oldText, newText)
+        # For noticing that the text has been changed some other way
+        # since, so the splice may no longer line up with it
+        self.__oldChecksum = text_checksum(oldText)
+        self.__newChecksum = text_checksum(newText)
+        self.__lastEditTime = monotonic()
+
+    def _getText(self) -> str:
+        raise NotImplementedError
+
+    def _setText(self, text: str):
+        raise NotImplementedError
+
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [self._storyBlock]
+
+    def memoryCost(self) -> int:
+        _, removed, inserted = self.__diff
+        return 128 + len(removed) + len(inserted)
+
+    def mergeWith(self, other: QUndoCommand) -> bool:
+        if (
+            other.id() != self.id()
+            or other._storyBlock is not self._storyBlock
+            or other.__lastEditTime - self.__lastEditTime > TYPING_MERGE_INTERVAL
+        ):
+            return False
+
+        merged = merge_diffs(self.__diff, other.__diff)
+        if merged is None:
+            return False
+
+        self.__diff = merged
+        self.__newChecksum = other.__newChecksum
+        self.__lastEditTime = other.__lastEditTime
+        # Such as typing a character and then deleting it again
+        _, removed, inserted = merged
+        if removed == inserted:
+            self.setObsolete(True)
+        return True
+
+    def __apply(self, expectedChecksum: int, removed: str, inserted: str):
+        text = self._getText()
+        if text_checksum(text) != expectedChecksum:
+            # Splicing into text this command didn't see would garble it,
+            # so the text is left as it is
+            return
+        start, _, _ = self.__diff
+        self._setText(apply_diff(text, start, removed, inserted))
 
     def undo(self):
-        self.__storyBlock.setTitle(self.__oldText)
+        _, removed, inserted = self.__diff
+        self.__apply(self.__newChecksum, inserted, removed)
 
     def redo(self):
-        self.__storyBlock.setTitle(self.__newText)
+        _, removed, inserted = self.__diff
+        self.__apply(self.__oldChecksum, removed, inserted)
 
 
-class SetStoryBlockBodyCommand(QUndoCommand):
+class SetStoryBlockNameCommand(_TextEditCommand):
     def __init__(self, storyBlock: "StoryBlock", newText: str):
+        super().__init__(storyBlock, storyBlock.title(), newText)
+        self.setText("Edit Block Title")
+
+    def id(self) -> int:
+        return 1
+
+    def _getText(self) -> str:
+        return self._storyBlock.title()
+
+    def _setText(self, text: str):
+        self._storyBlock.setTitle(text)
+
+
+class SetStoryBlockBodyCommand(_TextEditCommand):
+    def __init__(self, storyBlock: "StoryBlock", newText: str):
+        super().__init__(storyBlock, storyBlock.body(), newText)
+        self.setText("Edit Block Body")
+
+    def id(self) -> int:
+        return 2
+
+    def _getText(self) -> str:
+        return self._storyBlock.body()
+
+    def _setText(self, text: str):
+        self._storyBlock.setBody(text)
+
+
+class SetStoryBlockIdCommand(QUndoCommand):
+    """
+    Changes a block's ID, along with the links to it in other blocks.
+    The bodies the links were rewritten in are kept whole, so that undoing
+    puts them back exactly, even links that already pointed at the new ID.
+    """
+
+    def __init__(self, story: "Story", storyBlock: "StoryBlock", newId: str):
         super().__init__()
+        self.setText("Change Block ID")
+        self.__story = story
         self.__storyBlock = storyBlock
-        self.__oldText = self.__storyBlock.body()
-        self.__newText = newText
+        self.__oldId = storyBlock.id()
+        self.__newId = newId
+        # Block: (body before, body after), worked out on the first redo
+        self.__bodies: dict["StoryBlock", tuple[str, str]] | None = None
+        self.__lastEditTime = monotonic()
+
+    def id(self) -> int:
+        return 3
+
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [self.__storyBlock, *self.__bodies]
+
+    def memoryCost(self) -> int:
+        return 128 + sum(len(old) + len(new) for old, new in self.__bodies.values())
+
+    def mergeWith(self, other: QUndoCommand) -> bool:
+        if (
+            other.id() != self.id()
+            or other.__storyBlock is not self.__storyBlock
+            or other.__lastEditTime - self.__lastEditTime > TYPING_MERGE_INTERVAL
+        ):
+            return False
+
+        for block, (otherOldBody, newBody) in other.__bodies.items():
+            # The body from before this command, if it touched the block
+            # too, and otherwise from before the later one
+            oldBody = self.__bodies[block][0] if block in self.__bodies else otherOldBody
+            self.__bodies[block] = (oldBody, newBody)
+        self.__newId = other.__newId
+        self.__lastEditTime = other.__lastEditTime
+        if self.__newId == self.__oldId and all(
+            old == new for old, new in self.__bodies.values()
+        ):
+            self.setObsolete(True)
+        return True
 
     def undo(self):
-        self.__storyBlock.setBody(self.__oldText)
+        with self.__story.batchUpdate():
+            self.__storyBlock.setId(self.__oldId, updateLinks=False)
+            for block, (oldBody, _) in self.__bodies.items():
+                block.setBody(oldBody)
 
     def redo(self):
-        self.__storyBlock.setBody(self.__newText)
+        with self.__story.batchUpdate():
+            self.__storyBlock.setId(self.__newId, updateLinks=False)
+            if self.__bodies is None:
+                self.__bodies = {
+                    block: (oldBody, block.body())
+                    for block, oldBody in self.__story.updateBlockId(
+                        self.__storyBlock, self.__oldId
+                    )
+                }
+            else:
+                for block, (_, newBody) in self.__bodies.items():
+                    block.setBody(newBody)
 
 
 class MoveStoryBlocksCommand(QUndoCommand):
@@ -46,6 +193,9 @@ class MoveStoryBlocksCommand(QUndoCommand):
         self.__storyBlocks = storyBlocks
         self.__delta = delta
 
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return list(self.__storyBlocks)
+
     def undo(self):
         for block, initialPos in self.__storyBlocks.items():
             block.setPos(block.pos() - self.__delta)
@@ -55,6 +205,30 @@ class MoveStoryBlocksCommand(QUndoCommand):
             block.setPos(initialPos + self.__delta)
 
 
+class SetStoryBlockPositionsCommand(QUndoCommand):
+    def __init__(
+        self, story: "Story", positions: dict["StoryBlock", QPointF], text: str
+    ):
+        super().__init__()
+        self.setText(text)
+        self.__story = story
+        self.__newPositions = positions
+        self.__oldPositions = {block: block.pos() for block in positions}
+
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return list(self.__newPositions)
+
+    def undo(self):
+        with self.__story.batchUpdate():
+            for block, pos in self.__oldPositions.items():
+                block.setPos(pos)
+
+    def redo(self):
+        with self.__story.batchUpdate():
+            for block, pos in self.__newPositions.items():
+                block.setPos(pos)
+
+
 class SetStoryStartBlockCommand(QUndoCommand):
     def __init__(self, story: "Story", newStartBlock: "StoryBlock"):
         super().__init__()
@@ -63,6 +237,9 @@ class SetStoryStartBlockCommand(QUndoCommand):
         self.__oldBlock = self.__story.startBlock()
         self.__newBlock = newStartBlock
 
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [block for block in (self.__oldBlock, self.__newBlock) if block is not None]
+
     def undo(self):
         self.__story.setStartBlock(self.__oldBlock)
 
@@ -77,6 +254,9 @@ class AddStoryBlockCommand(QUndoCommand):
         self.__story = story
         self.__block = StoryBlock(title=title, id=id, pos=pos)
 
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [self.__block]
+
     def undo(self):
         self.__story.removeBlock(self.__block)
 
@@ -99,15 +279,18 @@ class AddStoryBlockWithLinkToExistingBlockCommand(QUndoCommand):
         self.__sourceBlock = sourceBlock
         self.__newBlock = StoryBlock(title=title, id=id, pos=pos)
 
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [self.__sourceBlock, self.__newBlock]
+
     def undo(self):
-        self.__sourceBlock.setBody(
-            self.__sourceBlock.body()[: -len(f"\n[[{self.__newBlock.title()}]]")]
-        )
-        self.__story.removeBlock(self.__newBlock)
+        with self.__story.batchUpdate():
+            self.__sourceBlock.removeConnection(self.__linkText)
+            self.__story.removeBlock(self.__newBlock)
 
     def redo(self):
-        self.__story.addBlock(self.__newBlock)
-        self.__sourceBlock.addConnection(self.__newBlock)
+        with self.__story.batchUpdate():
+            self.__story.addBlock(self.__newBlock)
+            self.__linkText = self.__sourceBlock.addConnection(self.__newBlock)
 
 
 class AddLinkBetweenBlocksCommand(QUndoCommand):
@@ -117,13 +300,63 @@ class AddLinkBetweenBlocksCommand(QUndoCommand):
         self.__sourceBlock = sourceBlock
         self.__targetBlock = targetBlock
 
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [self.__sourceBlock]
+
     def undo(self):
-        self.__sourceBlock.setBody(
-            self.__sourceBlock.body()[: -len(f"\n[[{self.__targetBlock.title()}]]")]
+        self.__sourceBlock.removeConnection(self.__linkText)
+
+    def redo(self):
+        self.__linkText = self.__sourceBlock.addConnection(self.__targetBlock)
+
+
+class ReplaceTextCommand(QUndoCommand):
+    """
+    Applies a set of title and body changes across the story as one step,
+    with a single model notification. Each change is kept as a splice, as
+    with the typing commands.
+    """
+
+    def __init__(
+        self,
+        story: "Story",
+        changes: list[tuple["StoryBlock", str, str, str]],
+        count: int,
+    ):
+        super().__init__()
+        self.setText(
+            f"Replace {count} Occurrence{'s' if count != 1 else ''}"
+        )
+        self.__story = story
+        self.__changes = [
+            (block, field, diff_text(oldText, newText))
+            for block, field, oldText, newText in changes
+        ]
+
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [block for block, _, _ in self.__changes]
+
+    def memoryCost(self) -> int:
+        return sum(
+            128 + len(removed) + len(inserted)
+            for _, _, (_, removed, inserted) in self.__changes
         )
 
+    def __apply(self, reverse: bool):
+        with self.__story.batchUpdate():
+            for block, field, (start, removed, inserted) in self.__changes:
+                if reverse:
+                    removed, inserted = inserted, removed
+                if field == "title":
+                    block.setTitle(apply_diff(block.title(), start, removed, inserted))
+                else:
+                    block.setBody(apply_diff(block.body(), start, removed, inserted))
+
+    def undo(self):
+        self.__apply(reverse=True)
+
     def redo(self):
-        self.__sourceBlock.addConnection(self.__targetBlock)
+        self.__apply(reverse=False)
 
 
 class DeleteStoryBlockCommand(QUndoCommand):
@@ -133,132 +366,374 @@ class DeleteStoryBlockCommand(QUndoCommand):
         self.__story = story
         self.__blocks = blocks
 
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return list(self.__blocks)
+
     def undo(self) -> None:
-        for b in self.__blocks:
-            self.__story.addBlock(b)
+        self.__story.addBlocks(self.__blocks)
 
     def redo(self) -> None:
-        for b in self.__blocks:
-            self.__story.removeBlock(b)
+        self.__story.removeBlocks(self.__blocks)
+
+
+class SetStoryGroupsCommand(QUndoCommand):
+    """
+    Replaces the story's groups, and which blocks are in each, as one
+    step. Groups that aren't in `groups` are removed from the story.
+    """
+
+    def __init__(
+        self, story: "Story", groups: dict["StoryGroup", list["StoryBlock"]], text: str
+    ):
+        super().__init__()
+        self.setText(text)
+        self.__story = story
+        self.__newGroups = groups
+        self.__oldGroups = {group: group.blocks() for group in story.groups()}
+
+    def storyBlocks(self) -> list["StoryBlock"]:
+        return [
+            block
+            for groups in (self.__oldGroups, self.__newGroups)
+            for blocks in groups.values()
+            for block in blocks
+        ]
+
+    def __apply(self, groups: dict["StoryGroup", list["StoryBlock"]]):
+        with self.__story.batchUpdate():
+            for group, blocks in groups.items():
+                group.setBlocks(blocks)
+            self.__story.setGroups(list(groups))
 
+    def undo(self):
+        self.__apply(self.__oldGroups)
 
-class StoryBlock(QObject):
-    titleChanged = pyqtSignal(object, str)
-    idChanged = pyqtSignal(object, str)
-    bodyChanged = pyqtSignal()
-    posChanged = pyqtSignal()
+    def redo(self):
+        self.__apply(self.__newGroups)
+
+
+class StoryBlock:
+    """
+    A single passage. Blocks are plain objects rather than QObjects, since
+    a story can have tens of thousands of them; any changes are reported
+    through the signals of the Story that owns the block.
+    """
+
+    __slots__ = (
+        "__story",
+        "__title",
+        "__id",
+        "__body",
+        "__bodyVersion",
+        "__tokens",
+        "__tokensVersion",
+        "__x",
+        "__y",
+    )
 
     def __init__(
         self,
-        parent: QObject | None = None,
         title: str | None = None,
         id: str | None = None,
         body: str | None = None,
         pos: QPointF | None = None,
     ) -> None:
-        super().__init__(parent)
+        self.__story: "Story | None" = None
         self.__title: str = title if title is not None else "Untitled Passage"
         self.__id: str = id if id is not None else str(int(time()))
         self.__body: str = body if body is not None else ""
-        self.__pos: QPointF = pos if pos is not None else QPointF()
+        self.__bodyVersion: int = 0
+        self.__tokens: list[Token] | None = None
+        self.__tokensVersion: int = -1
+        self.__x: float = pos.x() if pos is not None else 0.0
+        self.__y: float = pos.y() if pos is not None else 0.0
 
     def __repr__(self) -> str:
         return f'<StoryBlock title="{self.__title}" id="{self.__id}">'
 
-    def parent(self) -> "Story":
-        return super().parent()
+    def parent(self) -> "Story | None":
+        return self.__story
+
+    def setParent(self, story: "Story | None"):
+        self.__story = story
 
     def setPos(self, pos: QPointF):
-        self.__pos = pos
-        self.posChanged.emit()
+        self.__x = pos.x()
+        self.__y = pos.y()
+        if self.__story is not None:
+            self.__story.onBlockPosChanged(self)
 
     def pos(self) -> QPointF:
-        return self.__pos
+        return QPointF(self.__x, self.__y)
+
+    def x(self) -> float:
+        return self.__x
+
+    def y(self) -> float:
+        return self.__y
 
     def setTitle(self, name: str):
         oldName = self.__title
         self.__title = name
-        self.titleChanged.emit(self, oldName)
+        if self.__story is not None:
+            self.__story.onBlockTitleChanged(self, oldName)
 
     def title(self) -> str:
         return self.__title
 
-    def setId(self, id: str):
+    def setId(self, id: str, updateLinks: bool = True):
+        """
+        Links to the block from the rest of the story follow it to the new
+        ID, unless `updateLinks` is False.
+        """
         oldId = self.__id
         self.__id = id
-        self.idChanged.emit(self, oldId)
+        if self.__story is not None:
+            self.__story.onBlockIdChanged(self, oldId, updateLinks)
 
     def id(self) -> str:
         return self.__id
 
     def setBody(self, body: str):
+        oldBody = self.__body
         self.__body = body
-        self.bodyChanged.emit()
+        self.__bodyVersion += 1
+        if self.__story is not None:
+            self.__story.onBlockBodyChanged(self, oldBody)
 
     def body(self) -> str:
         return self.__body
 
-    def addConnection(self, targetBlock: "StoryBlock"):
-        self.setBody(
-            self.body() + "\n" + f"[[{targetBlock.title()}->{targetBlock.id()}]]"
-        )
+    def bodyVersion(self) -> int:
+        """Goes up every time the body is set, for keying caches on."""
+        return self.__bodyVersion
+
+    def tokens(self) -> list[Token]:
+        """The body split into text and links. Don't modify the result."""
+        if self.__tokensVersion != self.__bodyVersion:
+            self.__tokens = tokenize_links(self.__body)
+            self.__tokensVersion = self.__bodyVersion
+        return self.__tokens
+
+    def links(self) -> list[LinkToken]:
+        return [t for t in self.tokens() if isinstance(t, LinkToken)]
+
+    def addConnection(self, targetBlock: "StoryBlock") -> str:
+        """Appends a link to the target block, and returns the text added."""
+        linkText = "\n" + link_markup(targetBlock.title(), targetBlock.id())
+        self.setBody(self.body() + linkText)
+        return linkText
+
+    def removeConnection(self, linkText: str):
+        """Undoes addConnection, given the text it returned."""
+        if self.__body.endswith(linkText):
+            self.setBody(self.__body[: -len(linkText)])
+
+
+class StoryGroup:
+    """
+    A named set of blocks, such as a chapter, that can be collapsed into a
+    single node on the canvas. Blocks that are removed from the story stay
+    in their group, so that undoing the removal puts them back in it, but
+    only the ones still in the story are saved.
+    """
+
+    __slots__ = ("__story", "__id", "__title", "__blocks", "__collapsed")
+
+    def __init__(
+        self,
+        id: str,
+        title: str | None = None,
+        blocks: list[StoryBlock] | None = None,
+        collapsed: bool = False,
+    ) -> None:
+        self.__story: "Story | None" = None
+        self.__id: str = id
+        self.__title: str = title if title is not None else id
+        self.__blocks: list[StoryBlock] = list(blocks) if blocks is not None else []
+        self.__collapsed: bool = collapsed
+
+    def __repr__(self) -> str:
+        return f'<StoryGroup title="{self.__title}" id="{self.__id}">'
+
+    def parent(self) -> "Story | None":
+        return self.__story
+
+    def setParent(self, story: "Story | None"):
+        self.__story = story
+
+    def id(self) -> str:
+        return self.__id
+
+    def title(self) -> str:
+        return self.__title
+
+    def setTitle(self, title: str):
+        self.__title = title
+        if self.__story is not None:
+            self.__story.onGroupChanged(self)
+
+    def blocks(self) -> list[StoryBlock]:
+        return self.__blocks.copy()
+
+    def setBlocks(self, blocks: list[StoryBlock]):
+        oldBlocks = self.__blocks
+        self.__blocks = list(blocks)
+        if self.__story is not None:
+            self.__story.onGroupBlocksChanged(self, oldBlocks)
+
+    def collapsed(self) -> bool:
+        return self.__collapsed
+
+    def setCollapsed(self, collapsed: bool):
+        if collapsed == self.__collapsed:
+            return
+        self.__collapsed = collapsed
+        if self.__story is not None:
+            self.__story.onGroupChanged(self)
 
 
 class Story(QObject):
     stateChanged = pyqtSignal()
     errorsReevaluated = pyqtSignal()
 
+    blockTitleChanged = pyqtSignal(object, str)
+    blockIdChanged = pyqtSignal(object, str)
+    blockBodyChanged = pyqtSignal(object, str)
+    blockPosChanged = pyqtSignal(object)
+    blocksAdded = pyqtSignal(list)
+    blocksRemoved = pyqtSignal(list)
+    # Groups were added, removed or changed, including being collapsed
+    groupsChanged = pyqtSignal()
+
     def __init__(
         self,
         parent: QObject | None = None,
         startBlock: StoryBlock | None = None,
         blocks: list[StoryBlock] | None = None,
+        groups: list[StoryGroup] | None = None,
     ) -> None:
         super().__init__(parent)
         self.__startBlock: StoryBlock = startBlock
-        self.__blocks: list[StoryBlock] = blocks if blocks is not None else []
-        self.__modified: bool = False
-        self.stateChanged.connect(self.onStateChanged)
-        if len(self.__blocks) > 0:
-            for block in self.__blocks:
-                block.setParent(self)
-                self.makeBlockConnections(block)
+        self.__blocks: list[StoryBlock] = []
+        self.__blockSet: set[StoryBlock] = set()
+        self.__blocksById: dict[str, list[StoryBlock]] = {}
+        self.__idAllocator = IdAllocator(self.__blocksById.__contains__)
+        self.__cachedErrors: dict[str, list[dict]] | None = None
+        # Every change bumps the generation, so a save can record exactly
+        # which state of the story it wrote
+        self.__generation: int = 0
+        self.__savedGeneration: int = 0
+        self.__modifiedBlocks: dict[StoryBlock, int] = {}
+        self.__batchDepth: int = 0
+        self.__pendingStateChange: bool = False
+        self.__pendingErrorsReevaluated: bool = False
+        self.__groups: list[StoryGroup] = []
+        self.__groupOfBlock: dict[StoryBlock, StoryGroup] = {}
+        if blocks is not None:
+            self.__insertBlocks(blocks)
+        if groups is not None:
+            self.__replaceGroups(groups)
 
     def resetModified(self):
-        self.__modified = False
+        self.markSaved(self.__generation)
 
     def modified(self) -> bool:
-        return self.__modified
-
-    def onStateChanged(self):
-        self.__cachedErrors = check_story_for_errors(self.data())
-        self.__modified = True
-
-    def makeBlockConnections(self, block: StoryBlock):
-        block.setParent(self)
-        block.titleChanged.connect(self.stateChanged)
-        block.idChanged.connect(self.updateBlockId)
-        block.bodyChanged.connect(self.stateChanged)
-        block.posChanged.connect(self.stateChanged)
-
-        block.titleChanged.connect(self.errorsReevaluated)
-        block.idChanged.connect(self.errorsReevaluated)
-        block.bodyChanged.connect(self.errorsReevaluated)
-
-    def disconnectBlockSignals(self, block: StoryBlock):
-        block.setParent(None)
-        block.titleChanged.disconnect(self.stateChanged)
-        block.idChanged.disconnect(self.updateBlockId)
-        block.bodyChanged.disconnect(self.stateChanged)
-        block.posChanged.disconnect(self.stateChanged)
-
-        block.titleChanged.disconnect(self.errorsReevaluated)
-        block.idChanged.disconnect(self.errorsReevaluated)
-        block.bodyChanged.disconnect(self.errorsReevaluated)
+        return self.__generation != self.__savedGeneration
+
+    def markModified(self):
+        """Flags the story as unsaved without changing anything in it."""
+        self.__generation += 1
+
+    def generation(self) -> int:
+        return self.__generation
+
+    def markSaved(self, generation: int):
+        """
+        Records that the story as it was at `generation` has been saved.
+        Anything changed since then still counts as unsaved.
+        """
+        self.__savedGeneration = max(self.__savedGeneration, generation)
+        self.__modifiedBlocks = {
+            block: g for block, g in self.__modifiedBlocks.items() if g > generation
+        }
+
+    def blockModified(self, block: StoryBlock) -> bool:
+        """Whether the block has changed since the story was last saved."""
+        return block in self.__modifiedBlocks
+
+    def resetModifiedBlocks(self, blocks: list[StoryBlock]):
+        for block in blocks:
+            self.__modifiedBlocks.pop(block, None)
+
+    def __markBlockModified(self, block: StoryBlock):
+        self.__generation += 1
+        self.__modifiedBlocks[block] = self.__generation
+
+    @contextmanager
+    def batchUpdate(self):
+        """
+        Holds back stateChanged and errorsReevaluated until the end of the
+        block, then emits each of them at most once. The per-block signals
+        are still emitted as the changes happen.
+        """
+        self.__batchDepth += 1
+        try:
+            yield
+        finally:
+            self.__batchDepth -= 1
+            if self.__batchDepth == 0:
+                self.__flushNotifications()
+
+    def __notify(self, errorsChanged: bool = True):
+        self.__generation += 1
+        self.__pendingStateChange = True
+        self.__pendingErrorsReevaluated |= errorsChanged
+        if errorsChanged:
+            self.__cachedErrors = None
+        if self.__batchDepth == 0:
+            self.__flushNotifications()
+
+    def __flushNotifications(self):
+        stateChanged = self.__pendingStateChange
+        errorsReevaluated = self.__pendingErrorsReevaluated
+        self.__pendingStateChange = False
+        self.__pendingErrorsReevaluated = False
+        if stateChanged:
+            with span("Story.stateChanged"):
+                self.stateChanged.emit()
+        if errorsReevaluated:
+            with span("Story.errorsReevaluated"):
+                self.errorsReevaluated.emit()
+
+    def onBlockTitleChanged(self, block: StoryBlock, oldTitle: str):
+        self.__markBlockModified(block)
+        self.blockTitleChanged.emit(block, oldTitle)
+        self.__notify()
+
+    def onBlockIdChanged(self, block: StoryBlock, oldId: str, updateLinks: bool = True):
+        self.__markBlockModified(block)
+        self.__unindexBlock(block, oldId)
+        self.__indexBlock(block)
+        self.blockIdChanged.emit(block, oldId)
+        if updateLinks:
+            self.updateBlockId(block, oldId)
+        else:
+            self.__notify()
+
+    def onBlockBodyChanged(self, block: StoryBlock, oldBody: str):
+        self.__markBlockModified(block)
+        self.blockBodyChanged.emit(block, oldBody)
+        self.__notify()
+
+    def onBlockPosChanged(self, block: StoryBlock):
+        self.__markBlockModified(block)
+        self.blockPosChanged.emit(block)
+        self.__notify(errorsChanged=False)
 
     def setStartBlock(self, block: StoryBlock):
         self.__startBlock = block
-        self.stateChanged.emit()
+        self.__notify(errorsChanged=False)
 
     def startBlock(self) -> StoryBlock:
         return self.__startBlock
@@ -266,53 +741,191 @@ class Story(QObject):
     def blocks(self) -> list[StoryBlock]:
         return self.__blocks.copy()
 
+    # Iterating over the story, or checking its length or membership,
+    # doesn't copy the list of blocks. The story mustn't be changed
+    # while it's being iterated over.
+    def __iter__(self) -> Iterator[StoryBlock]:
+        return iter(self.__blocks)
+
+    def __len__(self) -> int:
+        return len(self.__blocks)
+
+    def __contains__(self, block: object) -> bool:
+        return block in self.__blockSet
+
+    def blockById(self, id: str) -> StoryBlock | None:
+        blocks = self.__blocksById.get(id)
+        return blocks[0] if blocks else None
+
+    def idTaken(self, id: str) -> bool:
+        return id in self.__blocksById
+
+    def allocateId(self, base: str) -> str:
+        """Returns `base`, or `base` with a numbered suffix, that no block has yet."""
+        return self.__idAllocator.allocate(base)
+
+    def __indexBlock(self, block: StoryBlock):
+        self.__blocksById.setdefault(block.id(), []).append(block)
+
+    def __unindexBlock(self, block: StoryBlock, id: str):
+        blocks = self.__blocksById.get(id, [])
+        if block in blocks:
+            blocks.remove(block)
+        if len(blocks) == 0:
+            self.__blocksById.pop(id, None)
+
     def addBlock(self, block: StoryBlock):
-        if block in self.blocks():
-            return
+        self.addBlocks([block])
 
-        self.makeBlockConnections(block)
-        self.__blocks.append(block)
+    def addBlocks(self, blocks: list[StoryBlock]):
+        wasEmpty = len(self.__blocks) == 0
+        added = self.__insertBlocks(blocks)
+        if len(added) == 0:
+            return
 
-        if len(self.__blocks) == 1:
-            self.setStartBlock(block)
+        if wasEmpty and self.__startBlock is None:
+            self.__startBlock = added[0]
 
-        self.stateChanged.emit()
-        self.errorsReevaluated.emit()
+        self.blocksAdded.emit(added)
+        self.__notify()
 
     def removeBlock(self, block: StoryBlock):
-        self.disconnectBlockSignals(block)
-        self.__blocks.remove(block)
-        if self.__startBlock == block:
+        self.removeBlocks([block])
+
+    def removeBlocks(self, blocks: list[StoryBlock]):
+        removed = list(dict.fromkeys(b for b in blocks if b in self.__blockSet))
+        if len(removed) == 0:
+            return
+        toRemove = set(removed)
+
+        for block in toRemove:
+            block.setParent(None)
+            self.__unindexBlock(block, block.id())
+        self.__blockSet -= toRemove
+        for block in toRemove:
+            self.__modifiedBlocks.pop(block, None)
+        self.__blocks = [b for b in self.__blocks if b not in toRemove]
+
+        if self.__startBlock in toRemove:
             self.__startBlock = None
-        self.stateChanged.emit()
-        self.errorsReevaluated.emit()
-
-    def updateBlockId(self, block: StoryBlock, oldId: str):
-        b = compile(r"\[\[(.*?)->" + escape(oldId) + r"\]\]")
-        for otherBlock in self.__blocks:
-            otherBlock.setBody(
-                b.sub(
-                    r"[[\1->" + block.id().replace("\\", r"\\") + r"]]",
-                    otherBlock.body(),
+        self.blocksRemoved.emit(removed)
+        self.__notify()
+
+    def __insertBlocks(self, blocks: list[StoryBlock]) -> list[StoryBlock]:
+        # Skips blocks that are already in the story (or repeated in
+        # the input), without emitting anything
+        added: list[StoryBlock] = []
+        for block in blocks:
+            if block in self.__blockSet:
+                continue
+            self.__blockSet.add(block)
+            block.setParent(self)
+            self.__indexBlock(block)
+            added.append(block)
+        self.__blocks.extend(added)
+        return added
+
+    def updateBlockId(self, block: StoryBlock, oldId: str) -> list[tuple[StoryBlock, str]]:
+        """
+        Points links to `oldId` at the block's new ID. Returns the blocks
+        whose bodies were changed, with the body each had before.
+        """
+        changed: list[tuple[StoryBlock, str]] = []
+        with self.batchUpdate():
+            for otherBlock in self.__blocks:
+                oldBody = otherBlock.body()
+                newBody = replace_link_targets(
+                    oldBody, otherBlock.links(), oldId, block.id()
                 )
-            )
-        self.stateChanged.emit()
+                if newBody is not None:
+                    otherBlock.setBody(newBody)
+                    changed.append((otherBlock, oldBody))
+            self.__notify()
+        return changed
+
+    def groups(self) -> list[StoryGroup]:
+        return self.__groups.copy()
+
+    def groupById(self, id: str) -> StoryGroup | None:
+        for group in self.__groups:
+            if group.id() == id:
+                return group
+        return None
+
+    def groupOf(self, block: StoryBlock) -> StoryGroup | None:
+        return self.__groupOfBlock.get(block)
+
+    def allocateGroupId(self, base: str) -> str:
+        """Returns `base`, or `base` with a numbered suffix, that no group has yet."""
+        return IdAllocator(lambda id: self.groupById(id) is not None).allocate(base)
+
+    def setGroups(self, groups: list[StoryGroup]):
+        self.__replaceGroups(groups)
+        self.groupsChanged.emit()
+        self.__notify(errorsChanged=False)
+
+    def __replaceGroups(self, groups: list[StoryGroup]):
+        for group in self.__groups:
+            group.setParent(None)
+        self.__groups = list(groups)
+        self.__groupOfBlock.clear()
+        for group in self.__groups:
+            group.setParent(self)
+            for block in group.blocks():
+                self.__groupOfBlock[block] = group
+
+    def onGroupChanged(self, group: StoryGroup):
+        self.groupsChanged.emit()
+        self.__notify(errorsChanged=False)
+
+    def onGroupBlocksChanged(self, group: StoryGroup, oldBlocks: list[StoryBlock]):
+        for block in oldBlocks:
+            if self.__groupOfBlock.get(block) is group:
+                del self.__groupOfBlock[block]
+        for block in group.blocks():
+            self.__groupOfBlock[block] = group
+        self.onGroupChanged(group)
+
+    def groupsData(self) -> dict[str, dict]:
+        """The groups as they're saved in main.json, keyed by group ID."""
+        return {
+            group.id(): {
+                "title": group.title(),
+                "blocks": [block.id() for block in group.blocks() if block in self.__blockSet],
+                "collapsed": group.collapsed(),
+            }
+            for group in self.__groups
+        }
 
     def getConnectionsForBlock(self, block: StoryBlock) -> list[StoryBlock]:
         connections: list[StoryBlock] = []
-        for _, targetBlockId in LINK_RE.findall(block.body()):
-            targetBlocks = [b for b in self.blocks() if b.id() == targetBlockId]
+        for link in block.links():
+            targetBlocks = self.__blocksById.get(link.target, [])
             if len(targetBlocks) == 1:
                 connections.append(targetBlocks[0])
         return connections
 
     def errors(self) -> dict[str, list[dict]]:
-        return check_story_for_errors(self.data())
+        # Validated lazily, and only again once something that can affect
+        # the errors has changed
+        if self.__cachedErrors is None:
+            with span("validation"):
+                self.__cachedErrors = check_story_for_errors(
+                    self.data(includeLinks=True)
+                )
+        return self.__cachedErrors
 
     def errorsAsList(self) -> list[dict]:
         return errors_as_list(self.errors())
 
-    def data(self) -> dict:
+    def data(self, includeLinks: bool = False) -> dict:
+        # Validation can reuse the links each block has already parsed
+        if includeLinks:
+            data = self.data()
+            for blockData, block in zip(data["blocks"], self.__blocks):
+                blockData["links"] = block.links()
+            return data
+
         return {
             "start": self.startBlock().id()
             if isinstance(self.startBlock(), StoryBlock)
@@ -325,6 +938,32 @@ class Story(QObject):
                     "id": block.id(),
                     "body": block.body(),
                 }
-                for block in self.blocks()
+                for block in self.__blocks
             ],
+            "groups": self.groupsData(),
         }
+
+
+def groups_from_data(groups: dict, blocksById: dict[str, StoryBlock]) -> list[StoryGroup]:
+    """
+    Makes the groups saved in main.json, given the story's blocks by ID.
+    Blocks that aren't in the story are left out, as are blocks already
+    in an earlier group, since a block can only be in one.
+    """
+    made: list[StoryGroup] = []
+    grouped: set[str] = set()
+    for id, data in groups.items():
+        members = []
+        for blockId in data.get("blocks", []):
+            if blockId in blocksById and blockId not in grouped:
+                grouped.add(blockId)
+                members.append(blocksById[blockId])
+        made.append(
+            StoryGroup(
+                id,
+                title=data.get("title", id),
+                blocks=members,
+                collapsed=data.get("collapsed", False),
+            )
+        )
+    return made
@@ -0,0 +1,322 @@
+"""
+Checks a story directory for the damage that stops it opening or
+silently loses blocks, usually left behind by a messy merge, and
+optionally repairs it:
+
+    python packard.py fsck STORY [--repair]
+
+Groups in main.json are checked for blocks that aren't in the story or
+are in more than one group, and repairing takes them out.
+
+main.json is read while meta/ and content/ are listed, and then every
+block file is parsed, all on a pool of threads. Repairing adopts block
+files that main.json doesn't list, fills in whichever half of a block is
+missing, moves unreadable files into lost+found/ (replacing them with
+stubs) and then rewrites main.json to match.
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from json import JSONDecodeError, dump, load, loads
+from os import listdir, makedirs, replace
+from os.path import dirname, exists, join, splitext
+from typing import NamedTuple
+
+# Subdirectories holding one file per block, and each one's extension
+BLOCK_FILES = {"meta": ".json", "content": ".txt"}
+
+# Files are checked in batches of this many, so the threads aren't
+# mostly busy handing out work
+CHECK_BATCH_SIZE = 256
+
+# Where repairing moves files it couldn't read
+LOST_AND_FOUND = "lost+found"
+
+UNREADABLE_MAIN = "unreadable_main"
+MISSING_META = "missing_meta"
+MISSING_CONTENT = "missing_content"
+UNREADABLE_META = "unreadable_meta"
+UNREADABLE_CONTENT = "unreadable_content"
+ORPHAN = "orphan"
+DUPLICATE_LISTING = "duplicate_listing"
+DANGLING_START = "dangling_start"
+BAD_GROUP = "bad_group"
+DANGLING_GROUP_MEMBER = "dangling_group_member"
+DUPLICATE_GROUP_MEMBER = "duplicate_group_member"
+
+
+class Problem(NamedTuple):
+    kind: str
+    # The block it's about, if it's about one
+    id: str | None
+    detail: str
+
+
+class FsckReport(NamedTuple):
+    # The contents of main.json, or None if it couldn't be read
+    main: dict | None
+    # Block IDs in the order main.json lists them
+    listed: list[str]
+    # Blocks with a readable file in each directory
+    meta: set[str]
+    content: set[str]
+    problems: list[Problem]
+
+
+def problem_to_string(problem: Problem) -> str:
+    prefix = f"{problem.id}: " if problem.id is not None else ""
+    return prefix + problem.detail
+
+
+def _read_main(path: str) -> tuple[dict | None, str | None]:
+    try:
+        with open(join(path, "main.json"), encoding="utf-8") as f:
+            main = load(f)
+    except FileNotFoundError:
+        return None, "main.json is missing"
+    except (OSError, UnicodeDecodeError, JSONDecodeError) as e:
+        return None, f"main.json can't be read: {e}"
+    if not isinstance(main, dict) or not isinstance(main.get("blocks", []), list):
+        return None, "main.json isn't a story's block list"
+    return main, None
+
+
+def _list_ids(path: str, extension: str) -> list[str]:
+    try:
+        names = listdir(path)
+    except FileNotFoundError:
+        return []
+    return [splitext(name)[0] for name in names if name.endswith(extension)]
+
+
+def _check_file(path: str) -> str | None:
+    """Returns why a block file can't be loaded, or None if it can."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if path.endswith(".json") and not isinstance(loads(text), dict):
+            return "isn't a JSON object"
+    except (OSError, UnicodeDecodeError) as e:
+        return str(e)
+    except JSONDecodeError as e:
+        return f"isn't valid JSON ({e})"
+    return None
+
+
+def _check_files(paths: list[str]) -> list[str | None]:
+    return [_check_file(path) for path in paths]
+
+
+def fsck_story(path: str, workers: int | None = None) -> FsckReport:
+    problems: list[Problem] = []
+    with ThreadPoolExecutor(workers) as pool:
+        mainFuture = pool.submit(_read_main, path)
+        idFutures = {
+            d: pool.submit(_list_ids, join(path, d), extension)
+            for d, extension in BLOCK_FILES.items()
+        }
+        ids = {d: future.result() for d, future in idFutures.items()}
+
+        files = [
+            (d, id, join(path, d, id + BLOCK_FILES[d])) for d in BLOCK_FILES for id in ids[d]
+        ]
+        paths = [filePath for _, _, filePath in files]
+        batches = pool.map(
+            _check_files,
+            [paths[i : i + CHECK_BATCH_SIZE] for i in range(0, len(paths), CHECK_BATCH_SIZE)],
+        )
+        failures = [failure for batch in batches for failure in batch]
+        readable: dict[str, set[str]] = {d: set() for d in BLOCK_FILES}
+        for (d, id, _), failure in zip(files, failures):
+            if failure is None:
+                readable[d].add(id)
+            else:
+                kind = UNREADABLE_META if d == "meta" else UNREADABLE_CONTENT
+                problems.append(Problem(kind, id, f"{d}/{id}{BLOCK_FILES[d]} {failure}"))
+        main, mainError = mainFuture.result()
+
+    if mainError is not None:
+        problems.insert(0, Problem(UNREADABLE_MAIN, None, mainError))
+    listed: list[str] = []
+    if main is not None:
+        seen: set[str] = set()
+        for id in main.get("blocks", []):
+            if id in seen:
+                problems.append(Problem(DUPLICATE_LISTING, id, "is listed in main.json more than once"))
+                continue
+            seen.add(id)
+            listed.append(id)
+
+        present = {d: set(ids[d]) for d in BLOCK_FILES}
+        for id in listed:
+            if id not in present["meta"]:
+                problems.append(Problem(MISSING_META, id, f"meta/{id}.json is missing"))
+            if id not in present["content"]:
+                problems.append(Problem(MISSING_CONTENT, id, f"content/{id}.txt is missing"))
+
+        for id in sorted((present["meta"] | present["content"]) - seen):
+            problems.append(Problem(ORPHAN, id, "has block files but isn't listed in main.json"))
+
+        # A null start is how Packard saves a story with no start block
+        start = main.get("start")
+        if start is not None and start not in seen:
+            problems.append(
+                Problem(DANGLING_START, start, "is the start block but isn't listed in main.json")
+            )
+
+        problems.extend(_check_groups(main.get("groups", {}), seen))
+
+    return FsckReport(main, listed, readable["meta"], readable["content"], problems)
+
+
+def _valid_group(group) -> bool:
+    return isinstance(group, dict) and isinstance(group.get("blocks", []), list)
+
+
+def _check_groups(groups, listed: set[str]) -> list[Problem]:
+    if not isinstance(groups, dict):
+        return [Problem(BAD_GROUP, None, "main.json's groups aren't keyed by group ID")]
+    problems: list[Problem] = []
+    grouped: set[str] = set()
+    for groupId, group in groups.items():
+        if not _valid_group(group):
+            problems.append(Problem(BAD_GROUP, None, f'Group "{groupId}" has no list of blocks'))
+            continue
+        for id in group.get("blocks", []):
+            if id not in listed:
+                problems.append(
+                    Problem(
+                        DANGLING_GROUP_MEMBER,
+                        id,
+                        f'is in group "{groupId}" but isn\'t listed in main.json',
+                    )
+                )
+            elif id in grouped:
+                problems.append(
+                    Problem(DUPLICATE_GROUP_MEMBER, id, f'is in group "{groupId}" but is already in a group')
+                )
+            grouped.add(id)
+    return problems
+
+
+def _repair_groups(groups, blocks: list[str]) -> tuple[dict, list[str]]:
+    if not isinstance(groups, dict):
+        return {}, ["Dropped the unreadable groups"]
+    repaired: dict = {}
+    actions: list[str] = []
+    listed = set(blocks)
+    grouped: set[str] = set()
+    for groupId, group in groups.items():
+        if not _valid_group(group):
+            actions.append(f'Dropped group "{groupId}", which has no list of blocks')
+            continue
+        members = []
+        for id in group.get("blocks", []):
+            if id in listed and id not in grouped:
+                members.append(id)
+                grouped.add(id)
+            else:
+                actions.append(f'Took {id} out of group "{groupId}"')
+        repaired[groupId] = {**group, "blocks": members}
+    return repaired, actions
+
+
+def _move_to_lost_and_found(path: str, relative: str):
+    dest = join(path, LOST_AND_FOUND, relative)
+    makedirs(dirname(dest), exist_ok=True)
+    replace(join(path, relative), dest)
+
+
+def repair_story(path: str, report: FsckReport) -> list[str]:
+    """
+    Fixes the problems in `report`, which should be fresh from fsck_story.
+    Returns a description of each thing it did.
+    """
+    actions: list[str] = []
+
+    if report.main is None and exists(join(path, "main.json")):
+        _move_to_lost_and_found(path, "main.json")
+        actions.append(f"Moved the unreadable main.json into {LOST_AND_FOUND}/")
+    for problem in report.problems:
+        if problem.kind in (UNREADABLE_META, UNREADABLE_CONTENT):
+            d = "meta" if problem.kind == UNREADABLE_META else "content"
+            _move_to_lost_and_found(path, join(d, problem.id + BLOCK_FILES[d]))
+            actions.append(f"Moved {d}/{problem.id}{BLOCK_FILES[d]} into {LOST_AND_FOUND}/")
+
+    # Every block with anything left of it is kept: listed ones in their
+    # order, then the ones main.json didn't know about
+    meta, content = report.meta, report.content
+    unreadable = {p.id for p in report.problems if p.kind in (UNREADABLE_META, UNREADABLE_CONTENT)}
+    survivors = meta | content | unreadable
+    blocks = [id for id in report.listed if id in survivors]
+    for id in report.listed:
+        if id not in survivors:
+            actions.append(f"Dropped {id}, which has no files left")
+    listed = set(report.listed)
+    for id in sorted(survivors - listed):
+        blocks.append(id)
+        actions.append(f"Adopted {id}, which main.json didn't list")
+
+    for id in blocks:
+        if id not in meta:
+            makedirs(join(path, "meta"), exist_ok=True)
+            with open(join(path, "meta", f"{id}.json"), "w") as f:
+                dump({"x": 0, "y": 0, "title": id}, f, indent=4)
+            actions.append(f"Wrote a stub meta/{id}.json")
+        if id not in content:
+            makedirs(join(path, "content"), exist_ok=True)
+            with open(join(path, "content", f"{id}.txt"), "w") as f:
+                f.write("")
+            actions.append(f"Wrote an empty content/{id}.txt")
+
+    # Anything else in main.json is kept as it was
+    main = dict(report.main) if report.main is not None else {}
+    start = main.get("start")
+    if start is not None and start not in blocks:
+        start = blocks[0] if len(blocks) > 0 else None
+        actions.append(f"Made {start} the start block" if start else "Cleared the start block")
+    groups = main.get("groups")
+    if groups is not None:
+        groups, groupActions = _repair_groups(groups, blocks)
+        actions.extend(groupActions)
+    if (
+        main.get("blocks") != blocks
+        or main.get("start") != start
+        or main.get("groups") != groups
+        or report.main is None
+    ):
+        main["blocks"] = blocks
+        main["start"] = start
+        if groups is not None:
+            main["groups"] = groups
+        with open(join(path, "main.json"), "w") as f:
+            dump(main, f, indent=4)
+        actions.append("Rewrote main.json")
+    return actions
+
+
+def main(args: list[str]) -> int:
+    parser = ArgumentParser(
+        prog="packard fsck",
+        description="Check a story directory for missing, unlisted and unreadable files.",
+    )
+    parser.add_argument("story", help="the story directory")
+    parser.add_argument("--repair", action="store_true", help="fix the problems found")
+    parser.add_argument("--workers", type=int, default=None, help="threads to scan with")
+    options = parser.parse_args(args)
+
+    report = fsck_story(options.story, options.workers)
+    for problem in report.problems:
+        print(problem_to_string(problem))
+    if len(report.problems) == 0:
+        print("No problems found")
+        return 0
+    if not options.repair:
+        return 1
+
+    for action in repair_story(options.story, report):
+        print(action)
+    remaining = fsck_story(options.story, options.workers).problems
+    for problem in remaining:
+        print(f"Still wrong: {problem_to_string(problem)}")
+    return 1 if len(remaining) > 0 else 0
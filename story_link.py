@@ -1,3 +1,103 @@
-from re import compile
+from typing import NamedTuple
 
-LINK_RE = compile(r"\[\[(.*?)->(.*?)\]\]")
\ No newline at end of file
+
+class TextToken(NamedTuple):
+    """Plain text between links, as a span of the body it came from."""
+
+    start: int
+    end: int
+
+
+class LinkToken(NamedTuple):
+    """A `[[label->target]]` link, with the spans of the whole link and its target."""
+
+    label: str
+    target: str
+    start: int
+    end: int
+    target_start: int
+    target_end: int
+
+
+Token = TextToken | LinkToken
+
+
+def link_markup(label: str, target: str) -> str:
+    return f"[[{label}->{target}]]"
+
+
+def tokenize_links(body: str) -> list[Token]:
+    """
+    Splits a block body into text and link tokens in a single pass.
+
+    A link opens with `[[`, and its label runs up to the first `->` after
+    that; the target then runs up to the first `]]` after the arrow.
+    Links can't span lines, so an opener without a complete link on the
+    same line is treated as text.
+    """
+    tokens: list[Token] = []
+    find = body.find
+    length = len(body)
+    textStart = 0
+    pos = 0
+    lineEnd = -1
+    while pos < length:
+        start = find("[[", pos)
+        if start < 0:
+            break
+
+        if start > lineEnd:
+            lineEnd = find("\n", start)
+            if lineEnd < 0:
+                lineEnd = length
+
+        arrow = find("->", start + 2, lineEnd)
+        close = find("]]", arrow + 2, lineEnd) if arrow >= 0 else -1
+        if close < 0:
+            # Any later opener on this line would fail in the same way
+            pos = lineEnd + 1
+            continue
+
+        if start > textStart:
+            tokens.append(TextToken(textStart, start))
+        tokens.append(
+            LinkToken(
+                body[start + 2 : arrow],
+                body[arrow + 2 : close],
+                start,
+                close + 2,
+                arrow + 2,
+                close,
+            )
+        )
+        textStart = pos = close + 2
+
+    if textStart < length:
+        tokens.append(TextToken(textStart, length))
+    return tokens
+
+
+def find_links(body: str) -> list[LinkToken]:
+    return [t for t in tokenize_links(body) if isinstance(t, LinkToken)]
+
+
+def replace_link_targets(
+    body: str, links: list[LinkToken], old_target: str, new_target: str
+) -> str | None:
+    """
+    Rewrites every link to `old_target` so it points at `new_target`.
+    Returns None if no link pointed at `old_target`.
+    """
+    pieces: list[str] = []
+    last = 0
+    for link in links:
+        if link.target != old_target:
+            continue
+        pieces.append(body[last : link.target_start])
+        pieces.append(new_target)
+        last = link.target_end
+
+    if last == 0:
+        return None
+    pieces.append(body[last:])
+    return "".join(pieces)
@@ -0,0 +1,509 @@
+"""
+Three-way merging of Packard story directories.
+
+Stories are merged block by block: main.json's block list is unioned in
+order, each block's meta file is merged field by field and its content
+file line by line. This can be run over whole story directories, or by
+git on the individual files it couldn't merge itself, by adding this to
+.git/config:
+
+    [merge "packard"]
+        name = Packard story merge
+        driver = python packard.py merge-file %O %A %B %P
+
+and this to .gitattributes in the story directory:
+
+    main.json merge=packard
+    meta/*.json merge=packard
+    content/*.txt merge=packard
+"""
+
+from argparse import ArgumentParser
+from difflib import SequenceMatcher
+from filecmp import cmp
+from json import JSONDecodeError, dumps, loads
+from os import listdir, makedirs, remove
+from os.path import basename, dirname, exists, join, splitext
+from sys import stdin
+from typing import Callable, Iterable, Sequence, TypeVar
+
+from saver import check_story_for_errors, error_to_string, errors_as_list, load_story
+from text_diff import apply_diff, diff_text
+
+T = TypeVar("T")
+
+CONFLICT_START = "<<<<<<< ours\n"
+CONFLICT_MIDDLE = "=======\n"
+CONFLICT_END = ">>>>>>> theirs\n"
+
+# Subdirectories holding one file per block
+BLOCK_DIRS = ("meta", "content")
+
+DELETE_CONFLICT = "changed on one side, deleted on the other"
+INVALID_MAIN_CONFLICT = "not valid JSON, so it was merged as text"
+
+_MISSING = object()
+# A file that only one side changed (or neither), so ours already has it
+_UNCHANGED = object()
+
+
+def _changes(base: Sequence[T], new: Sequence[T]) -> list[tuple[int, int, list[T]]]:
+    matcher = SequenceMatcher(None, base, new, autojunk=False)
+    return [
+        (i1, i2, list(new[j1:j2]))
+        for op, i1, i2, j1, j2 in matcher.get_opcodes()
+        if op != "equal"
+    ]
+
+
+def _apply_changes(base: Sequence[T], lo: int, hi: int, changes) -> list[T]:
+    out: list[T] = []
+    pos = lo
+    for i1, i2, lines in changes:
+        out.extend(base[pos:i1])
+        out.extend(lines)
+        pos = i2
+    out.extend(base[pos:hi])
+    return out
+
+
+def merge_sequences(
+    base: Sequence[T],
+    ours: Sequence[T],
+    theirs: Sequence[T],
+    resolve: Callable[[list[T], list[T], list[T]], list[T] | None],
+) -> tuple[list[T], int]:
+    """
+    Merges the changes both sides made to `base`. Where they changed the
+    same region differently, `resolve` is given the base, our and their
+    versions of it and returns the merged region, or None to leave it
+    conflicted. Returns the merged sequence and the number of conflicts.
+    """
+    hunks = sorted(
+        [(i1, i2, lines, 0) for i1, i2, lines in _changes(base, ours)]
+        + [(i1, i2, lines, 1) for i1, i2, lines in _changes(base, theirs)],
+        key=lambda h: (h[0], h[1]),
+    )
+
+    merged: list[T] = []
+    conflicts = 0
+    pos = 0
+    i = 0
+    while i < len(hunks):
+        # Gather every hunk that overlaps or touches this one
+        lo, hi = hunks[i][0], hunks[i][1]
+        group = [hunks[i]]
+        i += 1
+        while i < len(hunks) and hunks[i][0] <= hi:
+            hi = max(hi, hunks[i][1])
+            group.append(hunks[i])
+            i += 1
+
+        merged.extend(base[pos:lo])
+        pos = hi
+        sides = [[h[:3] for h in group if h[3] == side] for side in (0, 1)]
+        oursRegion = _apply_changes(base, lo, hi, sides[0])
+        theirsRegion = _apply_changes(base, lo, hi, sides[1])
+        if len(sides[1]) == 0 or oursRegion == theirsRegion:
+            merged.extend(oursRegion)
+        elif len(sides[0]) == 0:
+            merged.extend(theirsRegion)
+        else:
+            region = resolve(list(base[lo:hi]), oursRegion, theirsRegion)
+            if region is None:
+                conflicts += 1
+                region = _conflict_region(oursRegion, theirsRegion)
+            merged.extend(region)
+
+    merged.extend(base[pos:])
+    return merged, conflicts
+
+
+def _conflict_region(ours: list[str], theirs: list[str]) -> list[str]:
+    def terminated(lines: list[str]) -> list[str]:
+        if len(lines) > 0 and not lines[-1].endswith("\n"):
+            return lines[:-1] + [lines[-1] + "\n"]
+        return lines
+
+    return (
+        [CONFLICT_START]
+        + terminated(ours)
+        + [CONFLICT_MIDDLE]
+        + terminated(theirs)
+        + [CONFLICT_END]
+    )
+
+
+def _merge_line(base: str, ours: str, theirs: str) -> str | None:
+    # Both sides may have changed different parts of the same line, such
+    # as rewriting two different links in a paragraph
+    oursStart, oursRemoved, oursInserted = diff_text(base, ours)
+    theirsStart, theirsRemoved, theirsInserted = diff_text(base, theirs)
+    oursEnd = oursStart + len(oursRemoved)
+    theirsEnd = theirsStart + len(theirsRemoved)
+    if oursEnd < theirsStart:
+        shift = len(oursInserted) - len(oursRemoved)
+        return apply_diff(ours, theirsStart + shift, theirsRemoved, theirsInserted)
+    if theirsEnd < oursStart:
+        return apply_diff(ours, theirsStart, theirsRemoved, theirsInserted)
+    return None
+
+
+def _resolve_lines(base: list[str], ours: list[str], theirs: list[str]):
+    if not len(base) == len(ours) == len(theirs):
+        return None
+    merged: list[str] = []
+    for b, o, t in zip(base, ours, theirs):
+        if o == t or t == b:
+            merged.append(o)
+        elif o == b:
+            merged.append(t)
+        else:
+            line = _merge_line(b, o, t)
+            if line is None:
+                return None
+            merged.append(line)
+    return merged
+
+
+def merge_text(base: str, ours: str, theirs: str) -> tuple[str, int]:
+    """
+    Merges a block's body line by line, falling back to merging within a
+    line when both sides changed it. Regions that still clash are left
+    between conflict markers. Returns the text and the conflict count.
+    """
+    if ours == theirs or theirs == base:
+        return ours, 0
+    if ours == base:
+        return theirs, 0
+    lines, conflicts = merge_sequences(
+        base.splitlines(keepends=True),
+        ours.splitlines(keepends=True),
+        theirs.splitlines(keepends=True),
+        _resolve_lines,
+    )
+    return "".join(lines), conflicts
+
+
+def merge_fields(base: dict, ours: dict, theirs: dict) -> tuple[dict, list[str]]:
+    """
+    Merges two changed versions of a JSON object key by key. Where both
+    sides changed a key differently our value is kept, and the key is
+    listed in the returned conflicts.
+    """
+    merged: dict = {}
+    conflicts: list[str] = []
+    for key in {**base, **ours, **theirs}:
+        b = base.get(key, _MISSING)
+        o = ours.get(key, _MISSING)
+        t = theirs.get(key, _MISSING)
+        if o == t or t == b:
+            value = o
+        elif o == b:
+            value = t
+        else:
+            value = o
+            conflicts.append(key)
+        if value is not _MISSING:
+            merged[key] = value
+    return merged, conflicts
+
+
+def _union(base: list, ours: list, theirs: list):
+    # Blocks both sides added at the same place are all kept, ours first,
+    # and blocks either side removed stay removed
+    removed = {b for b in base if b not in ours or b not in theirs}
+    return [b for b in ours + theirs if b not in removed]
+
+
+def merge_groups(base: dict, ours: dict, theirs: dict) -> tuple[dict, list[str]]:
+    """
+    Merges main.json's groups, group by group: each group's block list is
+    merged like the story's, and its other keys field by field. A group
+    deleted on one side and changed on the other is kept.
+    """
+    merged: dict = {}
+    conflicts: list[str] = []
+    for id in {**base, **ours, **theirs}:
+        b = base.get(id, _MISSING)
+        o = ours.get(id, _MISSING)
+        t = theirs.get(id, _MISSING)
+        if o == t or t == b:
+            group = o
+        elif o == b:
+            group = t
+        elif o is _MISSING or t is _MISSING:
+            group = o if o is not _MISSING else t
+            conflicts.append(f"groups.{id}")
+        else:
+            b = b if b is not _MISSING else {}
+            blocks, _ = merge_sequences(
+                b.get("blocks", []), o.get("blocks", []), t.get("blocks", []), _union
+            )
+            strip = lambda d: {k: v for k, v in d.items() if k != "blocks"}
+            group, keys = merge_fields(strip(b), strip(o), strip(t))
+            group["blocks"] = list(dict.fromkeys(blocks))
+            conflicts.extend(f"groups.{id}.{key}" for key in keys)
+        if group is not _MISSING:
+            merged[id] = group
+    return merged, conflicts
+
+
+def merge_main(base: dict, ours: dict, theirs: dict) -> tuple[dict, list[str]]:
+    """
+    Merges main.json: the block lists are merged as sequences, keeping
+    every block either side added in the order it was added, the groups
+    group by group, and the remaining keys field by field.
+    """
+    blocks, _ = merge_sequences(
+        base.get("blocks", []), ours.get("blocks", []), theirs.get("blocks", []), _union
+    )
+    # The same block may have been moved to different places on each side
+    blocks = list(dict.fromkeys(blocks))
+
+    strip = lambda d: {k: v for k, v in d.items() if k not in ("blocks", "groups")}
+    merged, conflicts = merge_fields(strip(base), strip(ours), strip(theirs))
+    main = {"blocks": blocks, **merged}
+
+    if any("groups" in d for d in (base, ours, theirs)):
+        groups, groupConflicts = merge_groups(
+            base.get("groups", {}), ours.get("groups", {}), theirs.get("groups", {})
+        )
+        conflicts.extend(groupConflicts)
+        # Blocks that are gone leave their groups, and a block that each
+        # side put in a different group stays in the first one
+        listed = set(blocks)
+        grouped: set[str] = set()
+        for group in groups.values():
+            group["blocks"] = [
+                id for id in group.get("blocks", []) if id in listed and id not in grouped
+            ]
+            grouped.update(group["blocks"])
+        main["groups"] = groups
+    return main, conflicts
+
+
+def _read(path: str) -> str | None:
+    if not exists(path):
+        return None
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def _same_file(a: str, b: str) -> bool:
+    """
+    Whether both files are missing, or both exist with the same bytes.
+    Files with the same size and modification time are taken to be the
+    same without reading them, as git and rsync do.
+    """
+    if not exists(a) or not exists(b):
+        return exists(a) == exists(b)
+    return cmp(a, b, shallow=True)
+
+
+def _write(path: str, text: str | None):
+    if text is None:
+        if exists(path):
+            remove(path)
+        return
+    makedirs(dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def _json_text(data: dict) -> str:
+    return dumps(data, indent=4)
+
+
+def merge_file(
+    kind: str, base: str | None, ours: str | None, theirs: str | None
+) -> tuple[str | None, list[str]]:
+    """
+    Merges the three versions of one story file, any of which may be
+    missing (None). `kind` is "main", "meta" or "content". Returns the
+    merged text (None if the file should be deleted) and a description of
+    each conflict.
+    """
+    if ours == theirs or theirs == base:
+        return ours, []
+    if ours == base:
+        return theirs, []
+    if ours is None or theirs is None:
+        # Deleted on one side and changed on the other
+        return ours if ours is not None else theirs, [DELETE_CONFLICT]
+
+    if kind != "content":
+        merge = merge_main if kind == "main" else merge_fields
+        try:
+            merged, keys = merge(loads(base or "{}"), loads(ours), loads(theirs))
+            return _json_text(merged), [f'conflicting changes to "{key}"' for key in keys]
+        except JSONDecodeError:
+            # Such as a file that's already been left with conflict markers
+            pass
+
+    text, count = merge_text(base or "", ours, theirs)
+    return text, ["conflicting changes to the text"] * count
+
+
+def _kind(path: str) -> str:
+    folder = basename(dirname(path))
+    if basename(path) == "main.json" and folder not in BLOCK_DIRS:
+        return "main"
+    return "meta" if folder == "meta" else "content"
+
+
+def _list(path: str) -> set[str]:
+    return set(listdir(path)) if exists(path) else set()
+
+
+def _block_ids(*stories: str) -> list[str]:
+    ids: set[str] = set()
+    for story in stories:
+        for folder in BLOCK_DIRS:
+            ids.update(splitext(name)[0] for name in _list(join(story, folder)))
+    return sorted(ids)
+
+
+def _changed_block_ids(paths: Iterable[str]) -> list[str]:
+    ids: set[str] = set()
+    for path in paths:
+        if basename(dirname(path)) in BLOCK_DIRS:
+            ids.add(splitext(basename(path))[0])
+    return sorted(ids)
+
+
+def _parse_json(text: str | None) -> dict | None:
+    try:
+        return loads(text or "{}")
+    except JSONDecodeError:
+        return None
+
+
+def merge_story_dirs(
+    base: str, ours: str, theirs: str, changed: Iterable[str] | None = None
+) -> dict[str, list[str]]:
+    """
+    Merges the stories in `base` and `theirs` into `ours`, in place.
+    Returns the conflicts found, keyed by the path of the file they're in
+    relative to the story directory.
+
+    If `changed` is given, such as from `git diff --name-only`, only the
+    blocks whose files are in it are looked at, rather than every block
+    in all three stories. main.json is always merged.
+    """
+    conflicts: dict[str, list[str]] = {}
+    keptIds: list[str] = []
+
+    ids = _block_ids(base, ours, theirs) if changed is None else _changed_block_ids(changed)
+    for id in ids:
+        paths = [join("meta", f"{id}.json"), join("content", f"{id}.txt")]
+        results = []
+        for path in paths:
+            files = [join(story, path) for story in (base, ours, theirs)]
+            # Nearly every file is unchanged on at least one side, which
+            # is found without reading it in as text, let alone merging it
+            if _same_file(files[1], files[2]) or _same_file(files[0], files[2]):
+                results.append((files, _UNCHANGED, []))
+            else:
+                versions = [_read(f) for f in files]
+                results.append((files, *merge_file(_kind(path), *versions)))
+
+        # If one side deleted a block the other changed, the whole block
+        # is kept rather than just the files that were changed
+        kept = any(DELETE_CONFLICT in r[2] for r in results)
+        for path, (files, merged, fileConflicts) in zip(paths, results):
+            if kept and (merged is None or (merged is _UNCHANGED and not exists(files[1]))):
+                merged = _read(files[1]) if exists(files[1]) else _read(files[2])
+            if merged is not _UNCHANGED and merged != _read(files[1]):
+                _write(join(ours, path), merged)
+            if len(fileConflicts) > 0:
+                conflicts[path] = fileConflicts
+        if kept:
+            keptIds.append(id)
+
+    versions = [_read(join(story, "main.json")) for story in (base, ours, theirs)]
+    merged, mainConflicts = merge_file("main", *versions)
+    main = _parse_json(merged) if merged is not None else None
+    if merged is not None and main is None:
+        # Such as a main.json that already had conflict markers in it,
+        # which can only be merged as text and is left for the user to fix
+        if merged != versions[1]:
+            _write(join(ours, "main.json"), merged)
+        mainConflicts = mainConflicts + [INVALID_MAIN_CONFLICT]
+    elif main is not None:
+        blocks = main.get("blocks", [])
+        main["blocks"] = blocks + [id for id in keptIds if id not in blocks]
+        if main != _parse_json(versions[1]):
+            _write(join(ours, "main.json"), _json_text(main))
+    if len(mainConflicts) > 0:
+        conflicts["main.json"] = mainConflicts
+    return conflicts
+
+
+def _print_conflicts(conflicts: dict[str, list[str]]):
+    for path, descriptions in conflicts.items():
+        for description in descriptions:
+            print(f"CONFLICT {path}: {description}")
+
+
+def main(args: list[str]) -> int:
+    parser = ArgumentParser(
+        prog="packard merge",
+        description="Three-way merge two changed copies of a story directory. "
+        "The result is written into OURS.",
+    )
+    parser.add_argument("base", help="the common ancestor of both stories")
+    parser.add_argument("ours", help="our version, which receives the merge")
+    parser.add_argument("theirs", help="their version")
+    parser.add_argument(
+        "--changed",
+        metavar="FILE",
+        help="only merge the blocks whose files are listed in FILE, one path per "
+        'line, such as from "git diff --name-only" ("-" reads standard input)',
+    )
+    options = parser.parse_args(args)
+
+    changed = None
+    if options.changed == "-":
+        changed = [line.strip() for line in stdin if line.strip() != ""]
+    elif options.changed is not None:
+        with open(options.changed, encoding="utf-8") as f:
+            changed = [line.strip() for line in f if line.strip() != ""]
+
+    conflicts = merge_story_dirs(options.base, options.ours, options.theirs, changed)
+    _print_conflicts(conflicts)
+
+    if not exists(join(options.ours, "main.json")):
+        return 1
+    try:
+        errors = errors_as_list(check_story_for_errors(load_story(options.ours)))
+    except OSError as e:
+        print(f"The merged story could not be loaded: {e}")
+        return 1
+    for error in errors:
+        print(f"{error.get('id', '')}: {error_to_string(error)}")
+
+    return 1 if len(conflicts) > 0 else 0
+
+
+def main_file(args: list[str]) -> int:
+    parser = ArgumentParser(
+        prog="packard merge-file",
+        description="Three-way merge one story file, as a git merge driver. "
+        "The result is written into OURS.",
+    )
+    parser.add_argument("base", help="the common ancestor's version (%%O)")
+    parser.add_argument("ours", help="our version, which receives the merge (%%A)")
+    parser.add_argument("theirs", help="their version (%%B)")
+    parser.add_argument("path", help="the file's path in the repository (%%P)")
+    options = parser.parse_args(args)
+
+    merged, conflicts = merge_file(
+        _kind(options.path),
+        _read(options.base),
+        _read(options.ours),
+        _read(options.theirs),
+    )
+    _write(options.ours, merged if merged is not None else "")
+    _print_conflicts({options.path: conflicts} if len(conflicts) > 0 else {})
+    return 1 if len(conflicts) > 0 else 0
@@ -0,0 +1,239 @@
+from json import JSONDecodeError, load
+from os import scandir
+from os.path import exists, join, splitext
+from typing import NamedTuple
+
+from PyQt6.QtCore import QFileSystemWatcher, QObject, QPointF, QTimer, pyqtSignal
+
+from saver import load_block
+from story_components import Story, StoryBlock, groups_from_data
+
+# How long to wait for a burst of changes (such as a checkout) to finish
+DEBOUNCE_INTERVAL = 300
+
+BLOCK_DIRS = ("meta", "content")
+
+
+class DiskChanges(NamedTuple):
+    # Loaded data for each block whose files changed, or None if they're gone
+    blocks: dict[str, dict | None]
+    # The new contents of main.json, or None if it didn't change
+    main: dict | None
+    # Blocks no longer listed in main.json
+    removedIds: set[str]
+    # Blocks that changed on disk but also have unsaved changes here
+    conflicts: list[StoryBlock]
+
+
+def _stat_dir(path: str) -> dict[str, tuple[int, int]]:
+    stats: dict[str, tuple[int, int]] = {}
+    try:
+        with scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    stats[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        pass
+    return stats
+
+
+def _load_main(path: str) -> dict | None:
+    try:
+        with open(join(path, "main.json")) as f:
+            return load(f)
+    except (OSError, JSONDecodeError):
+        return None
+
+
+class StoryWatcher(QObject):
+    """
+    Watches an open story's directory, and after a burst of changes from
+    outside the editor works out which blocks' files changed so that only
+    those need to be read back in.
+    """
+
+    changesDetected = pyqtSignal(object)
+    storyReloaded = pyqtSignal(list)
+
+    def __init__(self, parent: QObject | None = None):
+        super().__init__(parent)
+        self.__story: Story | None = None
+        self.__path: str | None = None
+        self.__snapshot: dict[str, dict[str, tuple[int, int]]] = {}
+        self.__main: dict = {}
+        self.__suspended = 0
+
+        self.__watcher = QFileSystemWatcher(self)
+        self.__watcher.directoryChanged.connect(self.scheduleRescan)
+        self.__watcher.fileChanged.connect(self.scheduleRescan)
+
+        self.__timer = QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(DEBOUNCE_INTERVAL)
+        self.__timer.timeout.connect(self.rescan)
+
+    def setStory(self, story: Story, path: str | None):
+        self.__story = story
+        self.__path = path
+        self.__timer.stop()
+        watched = self.__watcher.directories() + self.__watcher.files()
+        if len(watched) > 0:
+            self.__watcher.removePaths(watched)
+        self.resnapshot()
+
+    def resnapshot(self):
+        """
+        Records the current state of the files as the one the story
+        matches, such as after it's been saved.
+        """
+        if self.__path is None:
+            self.__snapshot = {}
+            self.__main = {}
+            return
+        self.__snapshot = {d: _stat_dir(join(self.__path, d)) for d in BLOCK_DIRS}
+        self.__main = _load_main(self.__path) or {}
+        self.__watchPaths()
+
+    def __watchPaths(self):
+        # Saving can create these for the first time, and a file that's
+        # replaced rather than written to stops being watched
+        paths = [self.__path, join(self.__path, "main.json")]
+        paths += [join(self.__path, d) for d in BLOCK_DIRS]
+        watched = set(self.__watcher.directories() + self.__watcher.files())
+        missing = [p for p in paths if p not in watched and exists(p)]
+        if len(missing) > 0:
+            self.__watcher.addPaths(missing)
+
+    def suspend(self):
+        """
+        Stops looking for changes, such as while the editor is writing the
+        story itself, until resume() is called.
+        """
+        self.__suspended += 1
+        self.__timer.stop()
+
+    def resume(self):
+        self.__suspended -= 1
+        if self.__suspended == 0:
+            self.resnapshot()
+
+    def scheduleRescan(self):
+        if self.__suspended == 0:
+            self.__timer.start()
+
+    def rescan(self):
+        if self.__path is None or self.__story is None:
+            return
+        self.__watchPaths()
+
+        newSnapshot = {d: _stat_dir(join(self.__path, d)) for d in BLOCK_DIRS}
+        changedIds: set[str] = set()
+        for d in BLOCK_DIRS:
+            old, new = self.__snapshot.get(d, {}), newSnapshot[d]
+            for name in old.keys() | new.keys():
+                if old.get(name) != new.get(name):
+                    changedIds.add(splitext(name)[0])
+
+        main = _load_main(self.__path)
+        removedIds: set[str] = set()
+        if main == self.__main:
+            main = None
+        if main is not None:
+            # Blocks newly listed in main.json need loading even if their
+            # files were already there
+            listed = set(self.__main.get("blocks", []))
+            newListed = set(main.get("blocks", []))
+            changedIds.update(newListed - listed)
+            removedIds = listed - newListed
+            self.__main = main
+
+        blocks: dict[str, dict | None] = {}
+        for id in changedIds:
+            try:
+                blocks[id] = load_block(self.__path, id)
+            except FileNotFoundError:
+                blocks[id] = None
+            except (OSError, JSONDecodeError):
+                # Probably caught half-written; it'll be read again once
+                # the writer's finished and the files change again
+                for d in BLOCK_DIRS:
+                    for name in list(newSnapshot[d]):
+                        if splitext(name)[0] == id:
+                            del newSnapshot[d][name]
+                continue
+
+        self.__snapshot = newSnapshot
+        if len(blocks) == 0 and main is None:
+            return
+
+        conflicts = self.__conflicts(blocks.keys() | removedIds)
+        self.changesDetected.emit(DiskChanges(blocks, main, removedIds, conflicts))
+
+    def __conflicts(self, ids: set[str]) -> list[StoryBlock]:
+        conflicts: list[StoryBlock] = []
+        for id in ids:
+            block = self.__story.blockById(id)
+            if block is not None and self.__story.blockModified(block):
+                conflicts.append(block)
+        return conflicts
+
+    def applyChanges(self, changes: DiskChanges, reloadConflicts: bool):
+        """
+        Brings the story up to date with the changes found on disk, as one
+        batched update. Blocks with unsaved changes of their own are only
+        touched if `reloadConflicts` is set.
+        """
+        story = self.__story
+        skipped = set() if reloadConflicts else set(changes.conflicts)
+        wasModified = story.modified()
+        reloaded: list[StoryBlock] = []
+        removed: list[StoryBlock] = []
+
+        with story.batchUpdate():
+            for id in changes.removedIds:
+                block = story.blockById(id)
+                if block is not None and block not in skipped:
+                    removed.append(block)
+            story.removeBlocks(removed)
+
+            added: list[StoryBlock] = []
+            for id, data in changes.blocks.items():
+                if data is None:
+                    continue
+                pos = QPointF(data["x"] or 0, data["y"] or 0)
+                block = story.blockById(id)
+                if block is None:
+                    if changes.main is not None and id in changes.main.get("blocks", []):
+                        added.append(
+                            StoryBlock(title=data["title"], body=data["body"], id=id, pos=pos)
+                        )
+                    continue
+                if block in skipped:
+                    continue
+                if block.title() != data["title"]:
+                    block.setTitle(data["title"])
+                if block.body() != data["body"]:
+                    block.setBody(data["body"])
+                if block.pos() != pos:
+                    block.setPos(pos)
+                reloaded.append(block)
+            story.addBlocks(added)
+            reloaded.extend(added)
+
+            if changes.main is not None:
+                startId = changes.main.get("start")
+                start = story.blockById(startId) if startId is not None else None
+                if start is not None and start is not story.startBlock():
+                    story.setStartBlock(start)
+
+                groups = changes.main.get("groups", {})
+                if groups != story.groupsData():
+                    blocksById = {block.id(): block for block in reversed(story.blocks())}
+                    story.setGroups(groups_from_data(groups, blocksById))
+
+        story.resetModifiedBlocks(reloaded)
+        # Reloading isn't an unsaved change of its own
+        if not wasModified:
+            story.resetModified()
+        self.storyReloaded.emit(reloaded + removed)
@@ -0,0 +1,52 @@
+from os import listdir
+from os.path import join
+
+from saver import compile_story_data_to_html
+
+
+def story() -> dict:
+    return {
+        "blocks": [
+            {"id": "start", "title": "Start", "body": "[[a->a]] [[b->b]] [[c->c]]", "x": 0, "y": 0},
+            {"id": "a", "title": "A", "body": "short", "x": 0, "y": 0},
+            {"id": "b", "title": "B", "body": "a much longer passage " * 20, "x": 0, "y": 0},
+            {"id": "c", "title": "C", "body": "tiny", "x": 0, "y": 0},
+        ],
+        "start": "start",
+    }
+
+
+def start_page(path) -> str:
+    with open(join(path, "pages", "start.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_inlining_works_without_prefetching(tmp_path):
+    compile_story_data_to_html(
+        str(tmp_path), story(), prefetch_limit=0, inline_limit=50, compress=False
+    )
+    page = start_page(tmp_path)
+    assert 'rel="prefetch"' not in page
+    assert '"a.html": ' in page and '"c.html": ' in page
+    assert '"b.html": ' not in page
+
+
+def test_prefetching_works_without_inlining(tmp_path):
+    compile_story_data_to_html(
+        str(tmp_path), story(), prefetch_limit=2, inline_limit=0, compress=False
+    )
+    page = start_page(tmp_path)
+    assert 'rel="prefetch" href="a.html"' in page
+    assert 'rel="prefetch" href="b.html"' in page
+    assert 'rel="prefetch" href="c.html"' not in page
+    assert "PAGES" not in page
+
+
+def test_inlined_pages_are_not_prefetched_too(tmp_path):
+    compile_story_data_to_html(
+        str(tmp_path), story(), prefetch_limit=3, inline_limit=50, compress=False
+    )
+    page = start_page(tmp_path)
+    assert 'rel="prefetch" href="b.html"' in page
+    assert 'rel="prefetch" href="a.html"' not in page
+    assert sorted(listdir(join(tmp_path, "pages"))) == ["a.html", "b.html", "c.html", "start.html"]
@@ -0,0 +1,92 @@
+from journal import replay_journal
+from text_diff import text_checksum
+
+
+def body_record(id: str, start: int, removed: str, inserted: str, result: str) -> dict:
+    return {
+        "op": "body",
+        "id": id,
+        "s": start,
+        "n": len(removed),
+        "t": inserted,
+        "rc": text_checksum(removed),
+        "crc": text_checksum(result),
+    }
+
+
+def story(*blocks: tuple[str, str]) -> dict:
+    return {
+        "blocks": [{"id": id, "title": id, "body": body, "x": 0, "y": 0} for id, body in blocks],
+        "start": None,
+    }
+
+
+def test_replays_unsaved_body_edits():
+    data = story(("a", "hello"))
+    records = [
+        body_record("a", 5, "", " world", "hello world"),
+        body_record("a", 0, "h", "H", "Hello world"),
+    ]
+    assert replay_journal(data, records) == 2
+    assert data["blocks"][0]["body"] == "Hello world"
+
+
+def test_skips_body_edits_already_saved():
+    data = story(("a", "hello world"))
+    records = [
+        body_record("a", 5, "", " world", "hello world"),
+        body_record("a", 0, "h", "H", "Hello world"),
+    ]
+    replay_journal(data, records)
+    assert data["blocks"][0]["body"] == "Hello world"
+
+
+def test_renames_and_edits_unsaved():
+    data = story(("a", "hello"))
+    records = [
+        {"op": "id", "old": "a", "id": "b"},
+        body_record("b", 5, "", " world", "hello world"),
+    ]
+    replay_journal(data, records)
+    assert [(b["id"], b["body"]) for b in data["blocks"]] == [("b", "hello world")]
+
+
+def test_rename_and_edit_already_saved_are_not_applied_twice():
+    data = story(("b", "hello world"))
+    records = [
+        {"op": "id", "old": "a", "id": "b"},
+        body_record("b", 5, "", " world", "hello world"),
+    ]
+    replay_journal(data, records)
+    assert [(b["id"], b["body"]) for b in data["blocks"]] == [("b", "hello world")]
+
+
+def test_skips_edits_that_do_not_line_up():
+    data = story(("a", "something else entirely"))
+    records = [body_record("a", 0, "hello", "goodbye", "goodbye")]
+    assert replay_journal(data, records) == 0
+    assert data["blocks"][0]["body"] == "something else entirely"
+
+
+def test_positions_titles_additions_and_removals():
+    data = story(("a", ""), ("b", ""))
+    records = [
+        {"op": "pos", "id": "a", "x": 10, "y": 20},
+        {"op": "title", "id": "a", "title": "A"},
+        {"op": "remove", "ids": ["b"]},
+        {"op": "add", "id": "c", "title": "C", "body": "new", "x": 1, "y": 2},
+        {"op": "start", "id": "c"},
+    ]
+    replay_journal(data, records)
+    assert [(b["id"], b["title"], b["x"], b["y"]) for b in data["blocks"]] == [
+        ("a", "A", 10, 20),
+        ("c", "C", 1, 2),
+    ]
+    assert data["start"] == "c"
+
+
+def test_rename_updates_groups():
+    data = story(("a", ""))
+    data["groups"] = {"g": {"title": "G", "blocks": ["a"], "collapsed": False}}
+    replay_journal(data, [{"op": "id", "old": "a", "id": "b"}])
+    assert data["groups"]["g"]["blocks"] == ["b"]
@@ -0,0 +1,28 @@
+from search_index import SearchIndex
+from story_components import Story, StoryBlock
+
+
+def ids(blocks: set[StoryBlock]) -> list[str]:
+    return sorted(block.id() for block in blocks)
+
+
+def test_search_follows_changes_made_before_and_after_building(qapp):
+    blocks = [StoryBlock(id=f"b{i}", title=f"Room {i}", body="a dark cave") for i in range(5)]
+    story = Story()
+    story.addBlocks(blocks)
+    index = SearchIndex()
+    index.setStory(story)
+
+    # Before the index is built
+    blocks[0].setBody("a sunny meadow")
+    story.removeBlocks([blocks[1]])
+    story.addBlocks([StoryBlock(id="new", body="another cave")])
+    assert ids(index.search("cav")) == ["b2", "b3", "b4", "new"]
+    assert ids(index.search("sun mea")) == ["b0"]
+
+    # After
+    blocks[2].setTitle("Sunny room")
+    story.removeBlocks([blocks[3]])
+    assert ids(index.search("sunny")) == ["b0", "b2"]
+    assert ids(index.search("cave")) == ["b2", "b4", "new"]
+    assert index.search("") == set()
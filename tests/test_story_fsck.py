@@ -0,0 +1,117 @@
+from json import dumps, loads
+from os import makedirs, remove
+from os.path import exists, join
+
+import pytest
+
+from saver import load_story, save_story
+from story_fsck import (
+    DANGLING_GROUP_MEMBER,
+    DANGLING_START,
+    LOST_AND_FOUND,
+    MISSING_CONTENT,
+    MISSING_META,
+    ORPHAN,
+    UNREADABLE_CONTENT,
+    UNREADABLE_MAIN,
+    fsck_story,
+    repair_story,
+)
+
+
+@pytest.fixture
+def story(tmp_path) -> str:
+    path = str(tmp_path / "story")
+    makedirs(path)
+    blocks = [
+        {"id": id, "title": id.upper(), "body": f"{id} body", "x": 0, "y": 0}
+        for id in ("a", "b", "c")
+    ]
+    save_story(path, {"blocks": blocks, "start": "a"})
+    return path
+
+
+def write(path: str, text: str | bytes):
+    with open(path, "wb" if isinstance(text, bytes) else "w") as f:
+        f.write(text)
+
+
+def read_main(path: str) -> dict:
+    with open(join(path, "main.json")) as f:
+        return loads(f.read())
+
+
+def kinds(path: str) -> set[str]:
+    return {problem.kind for problem in fsck_story(path, workers=2).problems}
+
+
+def repair(path: str) -> list[str]:
+    actions = repair_story(path, fsck_story(path, workers=2))
+    assert fsck_story(path, workers=2).problems == []
+    return actions
+
+
+def test_a_healthy_story_has_no_problems(story):
+    assert fsck_story(story).problems == []
+    assert repair_story(story, fsck_story(story)) == []
+
+
+def test_a_null_start_block_is_not_a_problem(story):
+    main = read_main(story)
+    main["start"] = None
+    write(join(story, "main.json"), dumps(main))
+    assert fsck_story(story).problems == []
+
+
+def test_stubs_missing_files(story):
+    remove(join(story, "meta", "b.json"))
+    remove(join(story, "content", "c.txt"))
+    assert kinds(story) == {MISSING_META, MISSING_CONTENT}
+
+    repair(story)
+    loaded = {block["id"]: block for block in load_story(story)["blocks"]}
+    assert loaded["b"]["body"] == "b body"
+    assert loaded["c"]["title"] == "C"
+    assert loaded["c"]["body"] == ""
+
+
+def test_adopts_orphans_and_drops_blocks_with_no_files(story):
+    write(join(story, "meta", "d.json"), dumps({"x": 0, "y": 0, "title": "D"}))
+    write(join(story, "content", "d.txt"), "d body")
+    remove(join(story, "meta", "c.json"))
+    remove(join(story, "content", "c.txt"))
+    assert ORPHAN in kinds(story)
+
+    repair(story)
+    assert read_main(story)["blocks"] == ["a", "b", "d"]
+
+
+def test_moves_unreadable_files_aside(story):
+    write(join(story, "content", "b.txt"), b"\xff\xfe not utf-8")
+    assert kinds(story) == {UNREADABLE_CONTENT}
+
+    repair(story)
+    assert exists(join(story, LOST_AND_FOUND, "content", "b.txt"))
+    assert read_main(story)["blocks"] == ["a", "b", "c"]
+
+
+def test_rebuilds_an_unreadable_main_json(story):
+    write(join(story, "main.json"), "{ not json")
+    assert UNREADABLE_MAIN in kinds(story)
+
+    repair(story)
+    assert exists(join(story, LOST_AND_FOUND, "main.json"))
+    assert sorted(read_main(story)["blocks"]) == ["a", "b", "c"]
+
+
+def test_moves_a_dangling_start_and_drops_dangling_group_members(story):
+    main = read_main(story)
+    main["start"] = "gone"
+    main["groups"] = {"g": {"title": "G", "blocks": ["a", "gone"], "collapsed": False}}
+    write(join(story, "main.json"), dumps(main))
+    assert {DANGLING_START, DANGLING_GROUP_MEMBER} <= kinds(story)
+
+    repair(story)
+    main = read_main(story)
+    assert main["start"] == "a"
+    assert main["groups"]["g"]["blocks"] == ["a"]
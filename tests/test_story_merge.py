@@ -0,0 +1,124 @@
+from json import dumps, loads
+from os import makedirs, remove
+from os.path import exists, join
+from shutil import copytree
+
+import pytest
+
+from saver import load_story, save_story
+from story_merge import (
+    CONFLICT_START,
+    DELETE_CONFLICT,
+    INVALID_MAIN_CONFLICT,
+    merge_file,
+    merge_story_dirs,
+)
+
+
+def block(id: str, body: str = "", title: str | None = None) -> dict:
+    return {"id": id, "title": title or id, "body": body, "x": 0, "y": 0}
+
+
+@pytest.fixture
+def stories(tmp_path):
+    """A base story, and ours and theirs as copies of it."""
+    base = str(tmp_path / "base")
+    save_story_dir(base, [block("a", "one\ntwo\nthree\n"), block("b", "bee\n")])
+    ours, theirs = str(tmp_path / "ours"), str(tmp_path / "theirs")
+    copytree(base, ours)
+    copytree(base, theirs)
+    return base, ours, theirs
+
+
+def save_story_dir(path: str, blocks: list[dict], start: str | None = None):
+    makedirs(path, exist_ok=True)
+    save_story(path, {"blocks": blocks, "start": start})
+
+
+def write(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_merge_file_takes_the_side_that_changed():
+    assert merge_file("content", "a\n", "a\n", "b\n") == ("b\n", [])
+    assert merge_file("content", "a\n", "b\n", "a\n") == ("b\n", [])
+    assert merge_file("content", "a\n", None, "a\n") == (None, [])
+
+
+def test_merge_file_merges_separate_lines():
+    merged, conflicts = merge_file("content", "1\n2\n3\n", "one\n2\n3\n", "1\n2\nthree\n")
+    assert merged == "one\n2\nthree\n"
+    assert conflicts == []
+
+
+def test_merge_file_marks_conflicting_lines():
+    merged, conflicts = merge_file("content", "1\n", "ours\n", "theirs\n")
+    assert CONFLICT_START in merged
+    assert len(conflicts) == 1
+
+
+def test_merge_file_reports_a_delete_against_a_change():
+    merged, conflicts = merge_file("content", "1\n", None, "2\n")
+    assert merged == "2\n"
+    assert conflicts == [DELETE_CONFLICT]
+
+
+def test_merge_file_merges_meta_by_field():
+    base = dumps({"x": 0, "y": 0, "title": "A"})
+    ours = dumps({"x": 10, "y": 0, "title": "A"})
+    theirs = dumps({"x": 0, "y": 0, "title": "Renamed"})
+    merged, conflicts = merge_file("meta", base, ours, theirs)
+    assert loads(merged) == {"x": 10, "y": 0, "title": "Renamed"}
+    assert conflicts == []
+
+
+def test_merge_story_dirs_merges_both_sides_changes(stories):
+    base, ours, theirs = stories
+    write(join(ours, "content", "a.txt"), "ONE\ntwo\nthree\n")
+    write(join(theirs, "content", "a.txt"), "one\ntwo\nTHREE\n")
+    save_story_dir(theirs, [block("a", "one\ntwo\nTHREE\n"), block("b", "bee\n"), block("c")])
+
+    assert merge_story_dirs(base, ours, theirs) == {}
+    story = load_story(ours)
+    assert [b["id"] for b in story["blocks"]] == ["a", "b", "c"]
+    assert story["blocks"][0]["body"] == "ONE\ntwo\nTHREE\n"
+
+
+def test_merge_story_dirs_keeps_a_block_deleted_on_one_side_and_changed_on_the_other(stories):
+    base, ours, theirs = stories
+    save_story_dir(ours, [block("a", "one\ntwo\nthree\n")])
+    remove(join(ours, "meta", "b.json"))
+    remove(join(ours, "content", "b.txt"))
+    write(join(theirs, "content", "b.txt"), "changed\n")
+
+    conflicts = merge_story_dirs(base, ours, theirs)
+    assert conflicts[join("content", "b.txt")] == [DELETE_CONFLICT]
+    assert read(join(ours, "content", "b.txt")) == "changed\n"
+    assert exists(join(ours, "meta", "b.json"))
+    assert "b" in loads(read(join(ours, "main.json")))["blocks"]
+
+
+def test_merge_story_dirs_leaves_invalid_main_json_for_the_user(stories):
+    base, ours, theirs = stories
+    write(join(ours, "main.json"), "<<<<<<< not json\n")
+    save_story_dir(theirs, [block("a", "one\ntwo\nthree\n"), block("b", "bee\n"), block("c")])
+
+    conflicts = merge_story_dirs(base, ours, theirs)
+    assert INVALID_MAIN_CONFLICT in conflicts["main.json"]
+    assert "<<<<<<< not json" in read(join(ours, "main.json"))
+
+
+def test_merge_story_dirs_only_looks_at_changed_blocks(stories):
+    base, ours, theirs = stories
+    write(join(theirs, "content", "a.txt"), "from theirs\n")
+    write(join(theirs, "content", "b.txt"), "also from theirs\n")
+
+    merge_story_dirs(base, ours, theirs, changed=["story/content/a.txt"])
+    assert read(join(ours, "content", "a.txt")) == "from theirs\n"
+    assert read(join(ours, "content", "b.txt")) == "bee\n"
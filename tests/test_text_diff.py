@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from text_diff import apply_diff, diff_text, merge_diffs, text_checksum
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ("", ""),
+        ("", "abc"),
+        ("abc", ""),
+        ("hello", "hello world"),
+        ("hello world", "hello"),
+        ("abc", "axc"),
+        ("aaaa", "aaa"),
+        ("abcabc", "abc"),
+    ],
+)
+def test_diff_round_trips(old, new):
+    start, removed, inserted = diff_text(old, new)
+    assert apply_diff(old, start, removed, inserted) == new
+    assert apply_diff(new, start, inserted, removed) == old
+
+
+def test_diff_is_minimal():
+    assert diff_text("the cat sat", "the bat sat") == (4, "c", "b")
+
+
+def test_merges_typing():
+    first = diff_text("hello", "hello ")
+    second = diff_text("hello ", "hello w")
+    assert merge_diffs(first, second) == (5, "", " w")
+
+
+def test_merges_typing_and_deleting_into_nothing():
+    first = diff_text("hello", "hellox")
+    second = diff_text("hellox", "hello")
+    start, removed, inserted = merge_diffs(first, second)
+    assert removed == inserted
+
+
+def test_does_not_merge_separate_edits():
+    first = diff_text("hello world", "Hello world")
+    second = diff_text("Hello world", "Hello world!")
+    assert merge_diffs(first, second) is None
+
+
+def test_merged_diffs_match_the_edits_they_replace():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = "".join(rng.choice("ab") for _ in range(rng.randrange(8)))
+        b = "".join(rng.choice("ab") for _ in range(rng.randrange(8)))
+        c = "".join(rng.choice("ab") for _ in range(rng.randrange(8)))
+        merged = merge_diffs(diff_text(a, b), diff_text(b, c))
+        if merged is None:
+            continue
+        start, removed, inserted = merged
+        assert apply_diff(a, start, removed, inserted) == c
+        assert apply_diff(c, start, inserted, removed) == a
+
+
+def test_checksum_tells_texts_apart():
+    assert text_checksum("hello") == text_checksum("hello")
+    assert text_checksum("hello") != text_checksum("hellp")
@@ -0,0 +1,145 @@
+import pytest
+from PyQt6.QtCore import QPointF
+
+from story_components import (
+    MoveStoryBlocksCommand,
+    SetStoryBlockBodyCommand,
+    SetStoryBlockIdCommand,
+    Story,
+    StoryBlock,
+)
+from undo_stack import UndoStack
+
+
+@pytest.fixture
+def stack(qapp) -> UndoStack:
+    return UndoStack()
+
+
+def make_story(*blocks: StoryBlock) -> Story:
+    story = Story()
+    story.addBlocks(list(blocks))
+    return story
+
+
+def test_rename_rewrites_links_and_undoes_exactly(stack):
+    a = StoryBlock(id="a")
+    linking = StoryBlock(id="l", body="[[go->a]] and [[also->b]]")
+    story = make_story(a, linking)
+
+    stack.push(SetStoryBlockIdCommand(story, a, "b"))
+    assert a.id() == "b"
+    assert linking.body() == "[[go->b]] and [[also->b]]"
+
+    stack.undo()
+    assert a.id() == "a"
+    # The link that already pointed at "b" is left alone
+    assert linking.body() == "[[go->a]] and [[also->b]]"
+    assert story.blockById("a") is a
+
+    stack.redo()
+    assert linking.body() == "[[go->b]] and [[also->b]]"
+
+
+def test_merged_renames_undo_links_first_rewritten_by_a_later_rename(stack):
+    a = StoryBlock(id="a")
+    linking = StoryBlock(id="l", body="[[go->a]]")
+    dangling = StoryBlock(id="d", body="[[go->ab]]")
+    story = make_story(a, linking, dangling)
+
+    stack.push(SetStoryBlockIdCommand(story, a, "ab"))
+    stack.push(SetStoryBlockIdCommand(story, a, "abc"))
+    assert linking.body() == "[[go->abc]]"
+    assert dangling.body() == "[[go->abc]]"
+
+    stack.undo()
+    assert linking.body() == "[[go->a]]"
+    assert dangling.body() == "[[go->ab]]"
+
+
+def test_rename_back_to_the_original_id_is_obsolete(stack):
+    a = StoryBlock(id="a")
+    story = make_story(a, StoryBlock(id="l", body="[[go->a]]"))
+
+    stack.push(SetStoryBlockIdCommand(story, a, "ab"))
+    stack.push(SetStoryBlockIdCommand(story, a, "a"))
+    assert stack.count() == 0
+
+
+def test_typing_merges_and_undoes_as_one_step(stack):
+    block = StoryBlock(id="a", body="hello")
+    make_story(block)
+
+    for text in ("hello ", "hello w", "hello wo"):
+        stack.push(SetStoryBlockBodyCommand(block, text))
+    assert stack.count() == 1
+
+    stack.undo()
+    assert block.body() == "hello"
+    stack.redo()
+    assert block.body() == "hello wo"
+
+
+def test_typing_that_cancels_out_leaves_nothing_to_undo(stack):
+    block = StoryBlock(id="a", body="hello")
+    make_story(block)
+
+    stack.push(SetStoryBlockBodyCommand(block, "hellox"))
+    stack.push(SetStoryBlockBodyCommand(block, "hello"))
+    assert stack.count() == 0
+
+
+def test_undo_after_a_change_outside_the_stack_leaves_the_text_alone(stack):
+    block = StoryBlock(id="a", body="hello")
+    make_story(block)
+
+    stack.push(SetStoryBlockBodyCommand(block, "hello world"))
+    block.setBody("something else")
+    stack.undo()
+    assert block.body() == "something else"
+
+
+def test_move_undoes_to_the_start_of_the_drag(stack):
+    block = StoryBlock(id="a", pos=QPointF(10, 10))
+    make_story(block)
+
+    block.setPos(QPointF(30, 50))
+    stack.push(MoveStoryBlocksCommand({block: QPointF(10, 10)}, QPointF(20, 40)))
+    stack.undo()
+    assert block.pos() == QPointF(10, 10)
+
+
+def test_reload_keeps_history_for_other_blocks(stack):
+    a = StoryBlock(id="a", body="a")
+    b = StoryBlock(id="b", body="b")
+    make_story(a, b)
+
+    stack.push(SetStoryBlockBodyCommand(a, "a1"))
+    stack.push(SetStoryBlockBodyCommand(b, "b1"))
+    stack.dropCommandsTouching([StoryBlock(id="elsewhere")])
+    assert stack.count() == 2
+
+    stack.undo()
+    stack.undo()
+    assert (a.body(), b.body()) == ("a", "b")
+
+
+def test_reload_drops_commands_touching_reloaded_blocks_and_older(stack):
+    a = StoryBlock(id="a", body="a")
+    b = StoryBlock(id="b", body="b")
+    make_story(a, b)
+
+    stack.push(SetStoryBlockBodyCommand(b, "b1"))
+    stack.push(SetStoryBlockBodyCommand(a, "a1"))
+    stack.push(SetStoryBlockBodyCommand(b, "b2"))
+    b.setPos(QPointF(5, 5))
+    stack.push(MoveStoryBlocksCommand({b: QPointF(0, 0)}, QPointF(5, 5)))
+    stack.undo()
+
+    a.setBody("from disk")
+    stack.dropCommandsTouching([a])
+    # Only the last edit to b is left, and the undone move can't be redone
+    assert stack.count() == 1
+    assert stack.index() == 1
+    stack.undo()
+    assert (a.body(), b.body()) == ("from disk", "b1")
@@ -0,0 +1,79 @@
+from zlib import crc32
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    """
+    Returns the length of the longest common prefix of two strings.
+    Uses a binary search over slice comparisons so the scanning happens
+    in C rather than one character at a time in Python.
+    """
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix_length(a: str, b: str, limit: int) -> int:
+    """
+    Returns the length of the longest common suffix of two strings,
+    never counting more than `limit` characters.
+    """
+    lo, hi = 0, min(len(a), len(b), limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid : len(a) - lo] == b[len(b) - mid : len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def diff_text(old: str, new: str) -> tuple[int, str, str]:
+    """
+    Describes the change from `old` to `new` as a single splice: the
+    position it starts at, the text that was removed there, and the
+    text that was inserted in its place.
+    """
+    start = common_prefix_length(old, new)
+    end = common_suffix_length(old, new, min(len(old), len(new)) - start)
+    return start, old[start : len(old) - end], new[start : len(new) - end]
+
+
+def apply_diff(text: str, start: int, removed: str, inserted: str) -> str:
+    return text[:start] + inserted + text[start + len(removed) :]
+
+
+def merge_diffs(
+    first: tuple[int, str, str], second: tuple[int, str, str]
+) -> tuple[int, str, str] | None:
+    """
+    Combines two consecutive splices into one, as long as they touch or
+    overlap. Returns None if there's unchanged text between them, since
+    the splices alone don't record what that text was.
+    """
+    s1, removed1, inserted1 = first
+    s2, removed2, inserted2 = second
+    if s2 > s1 + len(inserted1) or s2 + len(removed2) < s1:
+        return None
+
+    # Rebuild the affected region of the intermediate text from the
+    # parts both splices know about
+    lo = min(s1, s2)
+    if s1 <= s2:
+        middle = inserted1 + removed2[max(0, s1 + len(inserted1) - s2) :]
+    else:
+        middle = removed2 + inserted1[max(0, s2 + len(removed2) - s1) :]
+
+    before = middle[: s1 - lo] + removed1 + middle[s1 - lo + len(inserted1) :]
+    after = middle[: s2 - lo] + inserted2 + middle[s2 - lo + len(removed2) :]
+    start, removed, inserted = diff_text(before, after)
+    return lo + start, removed, inserted
+
+
+def text_checksum(text: str) -> int:
+    """A cheap fingerprint of some text, for checking it hasn't changed."""
+    return crc32(text.encode("utf-8"))
@@ -0,0 +1,299 @@
+from argparse import ArgumentParser
+from html.parser import HTMLParser
+from json import JSONDecodeError, loads
+from os import makedirs
+from re import compile
+from typing import Iterator, NamedTuple
+
+from id_ify import id_ify
+from saver import save_story
+from story_link import link_markup
+
+# How much of the source file is read at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+# Twine passages that hold story settings or code rather than story text
+SPECIAL_PASSAGE_NAMES = {"StoryTitle", "StoryData"}
+SPECIAL_PASSAGE_TAGS = {"script", "stylesheet", "Twine.private"}
+
+# Passages without a position are laid out in rows of this many
+FALLBACK_COLUMNS = 10
+FALLBACK_SPACING_X = 200
+FALLBACK_SPACING_Y = 100
+
+TWINE_LINK_RE = compile(r"\[\[(.*?)\]\]")
+UNSAFE_ID_CHARS_RE = compile(r"[^\w\-]")
+TWEE_ESCAPE_RE = compile(r"\\(.)")
+
+# Packard links end their label at the first "->", and have no way of
+# escaping one, so any arrow left in a label is swapped for this
+LINK_ARROW_ESCAPE = "→"
+
+
+class TwinePassage(NamedTuple):
+    name: str
+    text: str
+    tags: list[str]
+    x: float | None
+    y: float | None
+
+
+def _parse_position(position: str | None) -> tuple[float | None, float | None]:
+    try:
+        x, y = position.split(",")
+        return float(x), float(y)
+    except (AttributeError, ValueError):
+        return None, None
+
+
+class _TwineHTMLParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.passages: list[TwinePassage] = []
+        self.start_pid: str | None = None
+        self.pid_names: dict[str, str] = {}
+        self.__current: dict | None = None
+        self.__text: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        attributes = dict(attrs)
+        if tag == "tw-storydata":
+            self.start_pid = attributes.get("startnode")
+        elif tag == "tw-passagedata":
+            self.__current = attributes
+            self.__text = []
+
+    def handle_data(self, data: str):
+        if self.__current is not None:
+            self.__text.append(data)
+
+    def handle_endtag(self, tag: str):
+        if tag != "tw-passagedata" or self.__current is None:
+            return
+        name = self.__current.get("name") or ""
+        pid = self.__current.get("pid")
+        if pid is not None:
+            self.pid_names[pid] = name
+        x, y = _parse_position(self.__current.get("position"))
+        self.passages.append(
+            TwinePassage(
+                name,
+                "".join(self.__text),
+                (self.__current.get("tags") or "").split(),
+                x,
+                y,
+            )
+        )
+        self.__current = None
+        self.__text = []
+
+
+def iter_twine_html(path: str, start: dict | None = None) -> Iterator[TwinePassage]:
+    """
+    Streams the passages out of a published or archived Twine 2 HTML
+    file, feeding the parser a chunk at a time. If `start` is given, its
+    "start" key is set to the name of the starting passage once that's
+    known.
+    """
+    parser = _TwineHTMLParser()
+    with open(path, encoding="utf-8") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if chunk == "":
+                parser.close()
+            else:
+                parser.feed(chunk)
+
+            if start is not None and parser.start_pid in parser.pid_names:
+                start["start"] = parser.pid_names[parser.start_pid]
+            yield from parser.passages
+            parser.passages.clear()
+
+            if chunk == "":
+                return
+
+
+def _unescape_twee(text: str) -> str:
+    return TWEE_ESCAPE_RE.sub(r"\1", text)
+
+
+def _parse_twee_header(line: str) -> tuple[str, list[str], dict]:
+    # The name runs up to the first unescaped "[" (tags) or "{" (metadata)
+    header = line[2:].strip()
+    end = len(header)
+    i = 0
+    while i < len(header):
+        if header[i] == "\\":
+            i += 2
+            continue
+        if header[i] in "[{":
+            end = i
+            break
+        i += 1
+    name = _unescape_twee(header[:end].strip())
+    rest = header[end:].strip()
+
+    tags: list[str] = []
+    if rest.startswith("["):
+        close = rest.find("]")
+        if close >= 0:
+            tags = rest[1:close].split()
+            rest = rest[close + 1 :].strip()
+
+    metadata: dict = {}
+    if rest.startswith("{"):
+        try:
+            metadata = loads(rest)
+        except JSONDecodeError:
+            pass
+    return name, tags, metadata
+
+
+def iter_twee(path: str, start: dict | None = None) -> Iterator[TwinePassage]:
+    """
+    Streams the passages out of a Twee 3 source file, one line at a time.
+    If `start` is given, its "start" key is set from the StoryData
+    passage once that's been read.
+    """
+    header: tuple[str, list[str], dict] | None = None
+    lines: list[str] = []
+
+    def finish() -> TwinePassage:
+        name, tags, metadata = header
+        # Trailing blank lines separate passages rather than belonging to them
+        text = "".join(lines).rstrip("\n")
+        if name == "StoryData" and start is not None:
+            try:
+                start["start"] = loads(text).get("start")
+            except (JSONDecodeError, AttributeError):
+                pass
+        x, y = _parse_position(metadata.get("position"))
+        return TwinePassage(name, text, tags, x, y)
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("::"):
+                if header is not None:
+                    yield finish()
+                header = _parse_twee_header(line.rstrip("\n"))
+                lines = []
+            elif header is not None:
+                # Lines starting with "::" inside a passage are escaped
+                lines.append(line[1:] if line.startswith("\\::") else line)
+    if header is not None:
+        yield finish()
+
+
+def _iter_passages(path: str, start: dict | None = None) -> Iterator[TwinePassage]:
+    is_html = path.lower().endswith((".html", ".htm"))
+    passages = iter_twine_html(path, start) if is_html else iter_twee(path, start)
+    for passage in passages:
+        if passage.name in SPECIAL_PASSAGE_NAMES:
+            continue
+        if SPECIAL_PASSAGE_TAGS.intersection(passage.tags):
+            continue
+        yield passage
+
+
+def passage_id(name: str, taken: set[str]) -> str:
+    """Makes a unique, file-name-safe block ID for a passage name."""
+    base = UNSAFE_ID_CHARS_RE.sub("", id_ify(name)) or "passage"
+    id = base
+    n = 2
+    while id in taken:
+        id = f"{base}-{n}"
+        n += 1
+    taken.add(id)
+    return id
+
+
+def _split_twine_link(inner: str) -> tuple[str, str]:
+    # Setters ("[[link][$x to 1]]") aren't supported, so drop them
+    inner = inner.split("][", 1)[0]
+    if "|" in inner:
+        label, target = inner.split("|", 1)
+    elif "->" in inner:
+        label, target = inner.rsplit("->", 1)
+    elif "<-" in inner:
+        target, label = inner.split("<-", 1)
+    else:
+        label = target = inner
+    return label, target
+
+
+def convert_twine_links(text: str, ids: dict[str, str]) -> str:
+    """
+    Rewrites Twine links ("[[Target]]", "[[label|Target]]",
+    "[[label->Target]]" and "[[Target<-label]]") as Packard links to the
+    imported block IDs. Targets that weren't imported keep their name,
+    which will show up as an unknown ID.
+
+    As in Twine, "[[a->b->c]]" links to "c". An arrow left in the label
+    (or in the name of a target that wasn't imported) would be read as
+    the end of the label, so it's written as LINK_ARROW_ESCAPE instead.
+    """
+
+    def replace(m) -> str:
+        label, target = _split_twine_link(m.group(1))
+        target = ids.get(target, target)
+        return link_markup(
+            label.replace("->", LINK_ARROW_ESCAPE),
+            target.replace("->", LINK_ARROW_ESCAPE),
+        )
+
+    return TWINE_LINK_RE.sub(replace, text)
+
+
+def import_twine(source_path: str, dest_path: str) -> int:
+    """
+    Imports a Twine 2 HTML or Twee 3 file as a Packard story. The source
+    is read twice: once for just the passage names, so that links can be
+    rewritten to IDs, and once more to convert and write each passage.
+    Returns the number of passages imported.
+    """
+    start: dict = {"start": None}
+    taken: set[str] = set()
+    ids: dict[str, str] = {}
+    for passage in _iter_passages(source_path, start):
+        if passage.name not in ids:
+            ids[passage.name] = passage_id(passage.name, taken)
+
+    written: set[str] = set()
+
+    def blocks():
+        for i, passage in enumerate(_iter_passages(source_path)):
+            id = ids[passage.name]
+            # A repeated name would overwrite the first passage's files
+            if id in written:
+                continue
+            written.add(id)
+
+            x, y = passage.x, passage.y
+            if x is None or y is None:
+                x = (i % FALLBACK_COLUMNS) * FALLBACK_SPACING_X
+                y = (i // FALLBACK_COLUMNS) * FALLBACK_SPACING_Y
+            yield {
+                "x": x,
+                "y": y,
+                "title": passage.name,
+                "id": id,
+                "body": convert_twine_links(passage.text, ids),
+            }
+
+    makedirs(dest_path, exist_ok=True)
+    save_story(dest_path, {"blocks": blocks(), "start": ids.get(start["start"])})
+    return len(written)
+
+
+def main(args: list[str]) -> int:
+    parser = ArgumentParser(
+        prog="packard import",
+        description="Import a Twine 2 HTML or Twee 3 file as a Packard story.",
+    )
+    parser.add_argument("source", help="Twine 2 .html file or Twee 3 .twee/.tw file")
+    parser.add_argument("destination", help="directory to write the story to")
+    options = parser.parse_args(args)
+
+    count = import_twine(options.source, options.destination)
+    print(f"Imported {count} passage{'s' if count != 1 else ''}")
+    return 0
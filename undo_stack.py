@@ -0,0 +1,147 @@
+from collections.abc import Iterable
+
+from PyQt6.QtCore import QObject
+from PyQt6.QtGui import QUndoCommand, QUndoStack
+
+DEFAULT_UNDO_MEMORY_BUDGET = 32 * 1024 * 1024
+
+# Rough cost of a command that doesn't report its own size
+DEFAULT_COMMAND_COST = 256
+
+
+class _UndoEntry(QUndoCommand):
+    """
+    What actually lives on the QUndoStack. It forwards everything to the
+    command that was pushed, so that the stack can drop its oldest entries
+    by rebuilding itself around the same commands.
+    """
+
+    def __init__(self, command: QUndoCommand, applied: bool = False):
+        super().__init__()
+        self.__command = command
+        self.__skipRedo = applied
+        self.__restored = applied
+        self.setText(command.text())
+
+    def command(self) -> QUndoCommand:
+        return self.__command
+
+    def id(self) -> int:
+        # Entries put back while trimming the stack must not merge
+        # into each other
+        return -1 if self.__restored else self.__command.id()
+
+    def mergeWith(self, other: QUndoCommand) -> bool:
+        if not isinstance(other, _UndoEntry):
+            return False
+        if not self.__command.mergeWith(other.command()):
+            return False
+        self.setText(self.__command.text())
+        # A merge that cancels out leaves nothing to undo
+        self.setObsolete(self.__command.isObsolete())
+        return True
+
+    def undo(self):
+        self.__command.undo()
+
+    def redo(self):
+        if self.__skipRedo:
+            self.__skipRedo = False
+            return
+        self.__command.redo()
+
+
+class UndoStack(QUndoStack):
+    """
+    A QUndoStack that keeps the memory held by its commands under a
+    budget, dropping the oldest entries once it's exceeded. Commands can
+    report their size with a `memoryCost()` method, and the blocks they
+    change with a `storyBlocks()` method.
+    """
+
+    def __init__(
+        self,
+        parent: QObject | None = None,
+        memoryBudget: int = DEFAULT_UNDO_MEMORY_BUDGET,
+    ):
+        super().__init__(parent)
+        self.__memoryBudget = memoryBudget
+        self.__rebuilding = False
+
+    def memoryBudget(self) -> int:
+        return self.__memoryBudget
+
+    def setMemoryBudget(self, budget: int):
+        self.__memoryBudget = budget
+        self.enforceMemoryBudget()
+
+    def memoryUsage(self) -> int:
+        return sum(self.__commandCost(self.command(i)) for i in range(self.count()))
+
+    def push(self, command: QUndoCommand):
+        if self.__rebuilding:
+            super().push(command)
+            return
+        super().push(_UndoEntry(command))
+        self.enforceMemoryBudget()
+
+    def enforceMemoryBudget(self):
+        # Only trim when nothing is waiting to be redone, which is always
+        # the case straight after a push
+        if self.__memoryBudget <= 0 or self.index() != self.count():
+            return
+
+        costs = [self.__commandCost(self.command(i)) for i in range(self.count())]
+        total = sum(costs)
+        if total <= self.__memoryBudget:
+            return
+
+        # Trim down to three quarters of the budget, so that we're not
+        # rebuilding the stack again on the very next push. The newest
+        # entry always stays.
+        target = self.__memoryBudget * 3 // 4
+        dropped = 0
+        while dropped < len(costs) - 1 and total > target:
+            total -= costs[dropped]
+            dropped += 1
+        self.__keepOnly(dropped, self.count())
+
+    def dropCommandsTouching(self, blocks: Iterable):
+        """
+        Forgets the commands that change any of `blocks`, such as once
+        they've been reloaded from disk and the commands no longer match
+        them. Commands can only be undone in order, so the ones before
+        the newest of those go too, as does anything waiting to be redone
+        if any of it touches the blocks. Commands that don't report their
+        blocks are taken to touch every block.
+        """
+        blocks = set(blocks)
+        touched = [i for i in range(self.count()) if self.__touches(self.command(i), blocks)]
+        if len(touched) == 0:
+            return
+        index = self.index()
+        self.__keepOnly(max((i + 1 for i in touched if i < index), default=0), index)
+
+    def __touches(self, entry: QUndoCommand, blocks: set) -> bool:
+        storyBlocks = getattr(entry.command(), "storyBlocks", None)
+        return storyBlocks is None or not blocks.isdisjoint(storyBlocks())
+
+    def __keepOnly(self, start: int, end: int):
+        """Rebuilds the stack from the applied commands from `start` to `end`."""
+        cleanIndex = self.cleanIndex() - start
+        commands = [self.command(i).command() for i in range(start, end)]
+
+        self.__rebuilding = True
+        self.clear()
+        if cleanIndex < 0 or cleanIndex > len(commands):
+            self.resetClean()
+        for i, command in enumerate(commands):
+            self.push(_UndoEntry(command, applied=True))
+            if i + 1 == cleanIndex:
+                self.setClean()
+        self.__rebuilding = False
+
+    def __commandCost(self, entry: QUndoCommand) -> int:
+        command = entry.command() if isinstance(entry, _UndoEntry) else entry
+        memoryCost = getattr(command, "memoryCost", None)
+        return memoryCost() if memoryCost is not None else DEFAULT_COMMAND_COST
@@ -0,0 +1,62 @@
+from typing import Callable
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+
+
+class Worker(QRunnable):
+    """
+    Runs a function on the global thread pool. Its result (or the message
+    of the exception it raised) is delivered back on the thread that
+    connected to `signals`, usually the GUI thread.
+
+    With `reportsProgress` set, the function is also passed a `progress`
+    keyword argument, a callback taking (done, total) that emits
+    `signals.progress`. With `cancellable` set, it's passed `cancelled`,
+    which returns whether cancel() has been called.
+    """
+
+    def __init__(
+        self,
+        fn: Callable,
+        *args,
+        reportsProgress: bool = False,
+        cancellable: bool = False,
+        **kwargs,
+    ):
+        super().__init__()
+        self.signals = WorkerSignals()
+        self.__fn = fn
+        self.__args = args
+        self.__kwargs = kwargs
+        self.__cancelled = False
+        if reportsProgress:
+            self.__kwargs["progress"] = self.signals.progress.emit
+        if cancellable:
+            self.__kwargs["cancelled"] = self.isCancelled
+
+    def run(self):
+        try:
+            result = self.__fn(*self.__args, **self.__kwargs)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
+
+    def cancel(self):
+        self.__cancelled = True
+
+    def isCancelled(self) -> bool:
+        return self.__cancelled
+
+
+def wait_for_workers():
+    QThreadPool.globalInstance().waitForDone()